@@ -1,5 +1,59 @@
 from django.contrib import admin
+from django.db.models import Q
 
-from ApiDevt.models import *
+from ApiDevt.models import OtpCode, SubTask, Task
+from ApiDevt.pagination import EstimatedCountPaginator
 
-admin.site.register(Task)
\ No newline at end of file
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """
+    Changelist for tables of millions of rows: estimated counts, newest first
+    by primary key, and only searches and sorts an index can serve.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False  # Would COUNT(*) the whole table on every page
+    ordering = ("-id",)
+    sortable_by = ("id",)
+    search_help_text = "An id, or an exact username."
+
+    def get_search_results(self, request, queryset, search_term):
+        # The default icontains searches scan every row
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        if term.isdigit():
+            return queryset.filter(pk=term), False
+        query = Q()
+        for field in self.get_search_fields(request):
+            query |= Q(**{field: term})
+        return queryset.filter(query), False
+
+
+@admin.register(Task)
+class TaskAdmin(LargeTableAdmin):
+    list_display = ("id", "name", "status", "priority", "assigned_user", "category", "end_date", "is_expired")
+    list_select_related = ("assigned_user", "category")
+    list_filter = ("status", "priority")
+    sortable_by = ("id", "end_date")
+    search_fields = ("assigned_user__username",)
+    autocomplete_fields = ("assigned_user", "collaborators")
+    raw_id_fields = ("category", "tags")
+
+
+@admin.register(SubTask)
+class SubTaskAdmin(LargeTableAdmin):
+    list_display = ("id", "name", "status", "parent_task", "assigned_user", "due_date")
+    list_select_related = ("parent_task", "assigned_user")
+    list_filter = ("status",)
+    search_fields = ("assigned_user__username",)
+    autocomplete_fields = ("assigned_user",)
+    raw_id_fields = ("parent_task",)
+
+
+@admin.register(OtpCode)
+class OtpCodeAdmin(LargeTableAdmin):
+    list_display = ("id", "user", "is_used", "expiry_time", "date_created")
+    list_select_related = ("user",)
+    list_filter = ("is_used",)
+    search_fields = ("user__username",)
+    autocomplete_fields = ("user",)
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class ApidevtConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'ApiDevt'
+
+    def ready(self):
+        # Connect the signal receivers
+        from . import history, refcache, sharding, signals, stats, sync, versioning  # noqa: F401
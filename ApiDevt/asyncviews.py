@@ -0,0 +1,193 @@
+"""
+Coroutine handlers for read-only viewset actions under ASGI.
+
+Django runs a sync view under ASGI in a thread for the whole request.
+Viewsets mixing in AsyncReadMixin serve the GET requests of their
+``async_actions`` with an ``a<action>`` coroutine instead when
+``ASYNC_VIEWS`` is on: authentication and queries are awaited through the
+async ORM and cache hits are served on the event loop. Everything else, and
+every request under WSGI or with ``ASYNC_VIEWS`` off, goes through the sync
+view as before.
+
+The coroutine path mirrors APIView.dispatch. Content negotiation,
+permissions, throttles, exception handling and rendering are DRF's own, they
+do not touch the database.
+"""
+import functools
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404
+from django.utils.translation import gettext_lazy as _
+from django_filters.filters import ModelChoiceFilter, ModelMultipleChoiceFilter
+from django_filters.rest_framework import DjangoFilterBackend
+from rest_framework import exceptions
+from rest_framework.authentication import SessionAuthentication, TokenAuthentication, get_authorization_header
+
+
+async def _token_credentials(authenticator, request):
+    """TokenAuthentication.authenticate with the token read through the async ORM"""
+    auth = get_authorization_header(request).split()
+    if not auth or auth[0].lower() != authenticator.keyword.lower().encode():
+        return None
+    if len(auth) == 1:
+        raise exceptions.AuthenticationFailed(_("Invalid token header. No credentials provided."))
+    if len(auth) > 2:
+        raise exceptions.AuthenticationFailed(_("Invalid token header. Token string should not contain spaces."))
+    try:
+        key = auth[1].decode()
+    except UnicodeError:
+        raise exceptions.AuthenticationFailed(
+            _("Invalid token header. Token string should not contain invalid characters.")
+        )
+
+    model = authenticator.get_model()
+    try:
+        token = await model.objects.select_related("user").aget(key=key)
+    except model.DoesNotExist:
+        raise exceptions.AuthenticationFailed(_("Invalid token."))
+    if not token.user.is_active:
+        raise exceptions.AuthenticationFailed(_("User inactive or deleted."))
+    return (token.user, token)
+
+
+async def _session_credentials(authenticator, request):
+    """SessionAuthentication.authenticate with the session user loaded by ``auser()``"""
+    auser = getattr(request._request, "auser", None)
+    if auser is None:
+        return None
+    user = await auser()
+    if not user or not user.is_active:
+        return None
+    authenticator.enforce_csrf(request)
+    return (user, None)
+
+
+async def aauthenticate(request):
+    """
+    Authenticate a DRF request like ``Request._authenticate`` does.
+
+    Token and session authentication are awaited, other authentication
+    classes run in a thread.
+    """
+    try:
+        for authenticator in request.authenticators:
+            if isinstance(authenticator, TokenAuthentication):
+                user_auth = await _token_credentials(authenticator, request)
+            elif isinstance(authenticator, SessionAuthentication):
+                user_auth = await _session_credentials(authenticator, request)
+            else:
+                user_auth = await sync_to_async(authenticator.authenticate)(request)
+            if user_auth is not None:
+                request._authenticator = authenticator
+                request.user, request.auth = user_auth
+                return
+    except exceptions.APIException:
+        request._not_authenticated()
+        raise
+    request._not_authenticated()
+
+
+class AsyncReadMixin:
+    """
+    Serve the GET requests of ``async_actions`` with ``a<action>`` coroutines under ASGI.
+    """
+    async_actions = ()
+
+    @classmethod
+    def as_view(cls, actions=None, **initkwargs):
+        view = super().as_view(actions, **initkwargs)
+        if not settings.ASYNC_VIEWS or (actions or {}).get("get") not in cls.async_actions:
+            return view
+
+        async def async_view(request, *args, **kwargs):
+            if request.method != "GET" or not isinstance(request, ASGIRequest):
+                return await sync_to_async(view)(request, *args, **kwargs)
+
+            self = cls(**initkwargs)
+            # Bound like ViewSetMixin.as_view does, DRF reads them back
+            self.action_map = actions
+            for method, action in actions.items():
+                setattr(self, method, getattr(self, action))
+            self.request = request
+            self.args = args
+            self.kwargs = kwargs
+            return await self.adispatch(request, *args, **kwargs)
+
+        # Keeps the cls, actions and csrf_exempt attributes of the sync view
+        functools.update_wrapper(async_view, view)
+        return async_view
+
+    async def adispatch(self, request, *args, **kwargs):
+        """APIView.dispatch for the coroutine handlers"""
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await self.ainitial(request, *args, **kwargs)
+            handler = getattr(self, f"a{self.action}")
+            response = await handler(request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+    async def ainitial(self, request, *args, **kwargs):
+        """APIView.initial with the authentication awaited"""
+        self.format_kwarg = self.get_format_suffix(**kwargs)
+        neg = self.perform_content_negotiation(request)
+        request.accepted_renderer, request.accepted_media_type = neg
+        version, scheme = self.determine_version(request, *args, **kwargs)
+        request.version, request.versioning_scheme = version, scheme
+
+        await aauthenticate(request)
+        self.check_permissions(request)
+        self.check_throttles(request)
+
+    async def afilter_queryset(self, queryset):
+        """
+        filter_queryset for the coroutine handlers.
+
+        Filter sets validate relation filters by looking the objects up, those
+        run in a thread. The other backends only build the queryset.
+        """
+        for backend_class in self.filter_backends:
+            backend = backend_class()
+            if isinstance(backend, DjangoFilterBackend) and self._filters_by_relation(backend, queryset):
+                queryset = await sync_to_async(backend.filter_queryset)(self.request, queryset, self)
+            else:
+                queryset = backend.filter_queryset(self.request, queryset, self)
+        return queryset
+
+    def _filters_by_relation(self, backend, queryset):
+        filterset = backend.get_filterset(self.request, queryset, self)
+        if filterset is None:
+            return False
+        return any(
+            isinstance(field, (ModelChoiceFilter, ModelMultipleChoiceFilter))
+            and name in self.request.query_params
+            for name, field in filterset.filters.items()
+        )
+
+    async def aget_object(self):
+        """GenericAPIView.get_object through the async ORM"""
+        queryset = await self.afilter_queryset(self.get_queryset())
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            obj = await queryset.aget(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        except queryset.model.DoesNotExist:
+            raise Http404(f"No {queryset.model._meta.object_name} matches the given query.")
+        except (TypeError, ValueError):
+            raise Http404
+        self.check_object_permissions(self.request, obj)
+        return obj
+
+    async def apaginate_queryset(self, queryset):
+        if self.paginator is None:
+            return None
+        return await self.paginator.apaginate_queryset(queryset, self.request, view=self)
@@ -0,0 +1,139 @@
+import io
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIRequest
+from django.db import close_old_connections
+from django.urls import Resolver404, resolve
+from rest_framework import status
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.response import Response
+
+from TodoApp.renderers import json_dumps, json_loads
+
+logger = logging.getLogger(__name__)
+
+# Shared by all batch requests of the process, so concurrency stays bounded
+_executor = ThreadPoolExecutor(max_workers=settings.BATCH_MAX_WORKERS, thread_name_prefix="batch")
+
+# Headers of sub-responses handed back to the client
+FORWARDED_HEADERS = ("ETag", "Last-Modified", "Location")
+
+
+def build_sub_request(request, item):
+    """
+    Build the Django request of one batch item.
+
+    The item is authenticated as the batch request without running the
+    authentication classes again, and asks for the format the batch response
+    is rendered in unless its own headers say otherwise.
+    """
+    url = urlsplit(item["path"])
+    body = b"" if item.get("body") is None else json_dumps(item["body"])
+    renderer = request.accepted_renderer
+    accept = renderer.media_type if getattr(renderer, "native_temporals", False) else "application/json"
+    environ = {
+        "REQUEST_METHOD": item["method"],
+        "SCRIPT_NAME": "",
+        "PATH_INFO": url.path,
+        "QUERY_STRING": url.query,
+        "SERVER_NAME": request.META.get("SERVER_NAME", "localhost"),
+        "SERVER_PORT": request.META.get("SERVER_PORT", "80"),
+        "REMOTE_ADDR": request.META.get("REMOTE_ADDR", ""),
+        "HTTP_ACCEPT": accept,
+        "CONTENT_TYPE": "application/json",
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.url_scheme": request.scheme,
+        "wsgi.input": io.BytesIO(body),
+    }
+    if "HTTP_HOST" in request.META:
+        environ["HTTP_HOST"] = request.META["HTTP_HOST"]
+    for name, value in item.get("headers", {}).items():
+        environ["HTTP_" + name.upper().replace("-", "_")] = value
+
+    sub_request = WSGIRequest(environ)
+    sub_request.user = request.user
+    # DRF authenticates requests carrying these with ForcedAuthentication
+    sub_request._force_auth_user = request.user
+    sub_request._force_auth_token = request.auth
+    session = getattr(request._request, "session", None)
+    if session is not None:
+        sub_request.session = session
+    return sub_request
+
+
+def _entry(status_code, body, headers=None):
+    return {"status": status_code, "headers": headers or {}, "body": body}
+
+
+def _response_entry(response):
+    headers = {name: response[name] for name in FORWARDED_HEADERS if response.has_header(name)}
+    if isinstance(response, Response):
+        # Left to the batch renderer instead of being rendered twice
+        return _entry(response.status_code, response.data, headers)
+
+    content = b"".join(response.streaming_content) if response.streaming else response.content
+    if not content:
+        body = None
+    elif response.get("Content-Type", "").startswith("application/json"):
+        body = json_loads(content)
+    else:
+        body = content.decode(response.charset)
+    return _entry(response.status_code, body, headers)
+
+
+def run_sub_request(sub_request):
+    """
+    Route a sub-request through the URL configuration and call its view directly.
+    """
+    try:
+        match = resolve(sub_request.path_info)
+    except Resolver404:
+        return _entry(status.HTTP_404_NOT_FOUND, {"detail": "Not found."})
+    if match.url_name == "batch":
+        return _entry(status.HTTP_400_BAD_REQUEST, {"detail": "Batches cannot be nested."})
+
+    try:
+        response = match.func(sub_request, *match.args, **match.kwargs)
+        return _response_entry(response)
+    except Exception:
+        logger.exception("Batch sub-request %s %s failed", sub_request.method, sub_request.get_full_path())
+        return _entry(status.HTTP_500_INTERNAL_SERVER_ERROR, {"detail": "Internal server error."})
+
+
+def _run_in_worker(sub_request):
+    # Worker threads hold their own database connections, recycle them like
+    # the request signals do for request threads
+    close_old_connections()
+    try:
+        return run_sub_request(sub_request)
+    finally:
+        close_old_connections()
+
+
+def run_batch(request, items):
+    """
+    Run the batch items and return their results in order.
+
+    Consecutive safe requests run concurrently on the shared thread pool,
+    any other request runs alone once the ones before it finished, so
+    writes are seen by the requests after them.
+    """
+    sub_requests = [build_sub_request(request, item) for item in items]
+    results = [None] * len(sub_requests)
+    start = 0
+    while start < len(sub_requests):
+        end = start + 1
+        if sub_requests[start].method in SAFE_METHODS:
+            while end < len(sub_requests) and sub_requests[end].method in SAFE_METHODS:
+                end += 1
+        if end - start == 1:
+            results[start] = run_sub_request(sub_requests[start])
+        else:
+            futures = [_executor.submit(_run_in_worker, sub_requests[index]) for index in range(start, end)]
+            for index, future in enumerate(futures, start):
+                results[index] = future.result()
+        start = end
+    return results
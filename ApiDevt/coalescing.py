@@ -0,0 +1,203 @@
+import asyncio
+import functools
+import hashlib
+import json
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.response import Response
+
+from .metrics import counters
+
+_in_flight = {}
+_in_flight_lock = threading.Lock()
+# Futures of the coroutine handlers, per event loop
+_in_flight_async = {}
+
+
+def coalesce_key(view, request, versions=None):
+    """
+    Identify a request by user, action, normalized query parameters, response
+    format and the versions of the data it reads, so a write never shares a
+    stale result. Scheme and host are part of it too, pagination links are
+    absolute URLs.
+    """
+    if versions is None:
+        versions = view.get_list_versions()
+    params = sorted((key, value) for key, values in request.query_params.lists() for value in values)
+    versions = sorted(versions.items())
+    digest = hashlib.md5(json.dumps([
+        request.scheme, request.get_host(), params, request.accepted_renderer.format, versions,
+    ]).encode()).hexdigest()
+    return f"coalesce:{request.user.pk}:{view.action}:{digest}"
+
+
+def _wait_for_shared(shared, key, lock_key):
+    """
+    Poll the shared cache for another worker's result while it holds the lock.
+    """
+    deadline = time.monotonic() + settings.COALESCE_LOCK_SECONDS
+    while time.monotonic() < deadline:
+        time.sleep(settings.COALESCE_POLL_SECONDS)
+        result = shared.get(key)
+        if result is not None:
+            return result
+        if shared.get(lock_key) is None:
+            # The other worker finished without a result, most likely an error
+            return None
+    return None
+
+
+def _compute(view_method, view, request, args, kwargs, key):
+    """
+    Run the view once across workers: take the shared lock or wait for its holder.
+    """
+    shared = caches[settings.COALESCE_CACHE_ALIAS]
+    name = f"coalesce.{view.action}"
+    result = shared.get(key)
+    if result is None:
+        lock_key = f"{key}:lock"
+        if shared.add(lock_key, 1, settings.COALESCE_LOCK_SECONDS):
+            try:
+                response = view_method(view, request, *args, **kwargs)
+                result = (response.data, response.status_code)
+                if response.status_code == 200:
+                    shared.set(key, result, settings.COALESCE_RESULT_SECONDS)
+            finally:
+                shared.delete(lock_key)
+            counters.incr(f"{name}.computed")
+            return result
+        result = _wait_for_shared(shared, key, lock_key)
+        if result is None:
+            counters.incr(f"{name}.fallback")
+            response = view_method(view, request, *args, **kwargs)
+            return (response.data, response.status_code)
+    counters.incr(f"{name}.coalesced_remote")
+    return result
+
+
+def coalesced(view_method):
+    """
+    Let concurrent identical requests to a viewset action share one computation.
+
+    The first request for a key computes the response. Requests in the same
+    process wait on its future, other workers wait on a short lock in the
+    shared cache and then read the result it stored there. Waiting ends after
+    ``COALESCE_LOCK_SECONDS`` either way, the request then computes its own
+    response. Only the response
+    data and status are shared, so the action must not set custom headers.
+    """
+    @functools.wraps(view_method)
+    def wrapper(view, request, *args, **kwargs):
+        key = coalesce_key(view, request)
+        with _in_flight_lock:
+            future = _in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = _in_flight[key] = Future()
+
+        if not leader:
+            counters.incr(f"coalesce.{view.action}.coalesced_local")
+            try:
+                data, status_code = future.result(timeout=settings.COALESCE_LOCK_SECONDS)
+            except FutureTimeout:
+                # The leader hangs, do not wait on it any longer than on another worker
+                counters.incr(f"coalesce.{view.action}.fallback")
+                return view_method(view, request, *args, **kwargs)
+            return Response(data, status=status_code)
+
+        try:
+            result = _compute(view_method, view, request, args, kwargs, key)
+        except BaseException as exc:
+            future.set_exception(exc)
+            raise
+        else:
+            future.set_result(result)
+        finally:
+            with _in_flight_lock:
+                _in_flight.pop(key, None)
+        return Response(result[0], status=result[1])
+    return wrapper
+
+
+async def _await_shared(shared, key, lock_key):
+    """
+    _wait_for_shared for coroutine handlers, sleeping on the event loop.
+    """
+    deadline = time.monotonic() + settings.COALESCE_LOCK_SECONDS
+    while time.monotonic() < deadline:
+        await asyncio.sleep(settings.COALESCE_POLL_SECONDS)
+        result = await shared.aget(key)
+        if result is not None:
+            return result
+        if await shared.aget(lock_key) is None:
+            return None
+    return None
+
+
+async def _acompute(view_method, view, request, args, kwargs, key):
+    """
+    _compute for coroutine handlers, through the cache's async API.
+    """
+    shared = caches[settings.COALESCE_CACHE_ALIAS]
+    name = f"coalesce.{view.action}"
+    result = await shared.aget(key)
+    if result is None:
+        lock_key = f"{key}:lock"
+        if await shared.aadd(lock_key, 1, settings.COALESCE_LOCK_SECONDS):
+            try:
+                response = await view_method(view, request, *args, **kwargs)
+                result = (response.data, response.status_code)
+                if response.status_code == 200:
+                    await shared.aset(key, result, settings.COALESCE_RESULT_SECONDS)
+            finally:
+                await shared.adelete(lock_key)
+            counters.incr(f"{name}.computed")
+            return result
+        result = await _await_shared(shared, key, lock_key)
+        if result is None:
+            counters.incr(f"{name}.fallback")
+            response = await view_method(view, request, *args, **kwargs)
+            return (response.data, response.status_code)
+    counters.incr(f"{name}.coalesced_remote")
+    return result
+
+
+def acoalesced(view_method):
+    """
+    coalesced for coroutine handlers: requests of the same event loop await
+    the leader's future, other workers share through the cache as before.
+    """
+    @functools.wraps(view_method)
+    async def wrapper(view, request, *args, **kwargs):
+        key = (asyncio.get_running_loop(), coalesce_key(view, request, await view.aget_list_versions()))
+        future = _in_flight_async.get(key)
+        if future is not None:
+            counters.incr(f"coalesce.{view.action}.coalesced_local")
+            try:
+                data, status_code = await asyncio.wait_for(asyncio.shield(future), settings.COALESCE_LOCK_SECONDS)
+            except asyncio.TimeoutError:
+                counters.incr(f"coalesce.{view.action}.fallback")
+                return await view_method(view, request, *args, **kwargs)
+            return Response(data, status=status_code)
+
+        future = _in_flight_async[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await _acompute(view_method, view, request, args, kwargs, key[1])
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as exc:
+            future.set_exception(exc)
+            # Retrieved here so a leader without followers leaves no warning
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+        finally:
+            _in_flight_async.pop(key, None)
+        return Response(result[0], status=result[1])
+    return wrapper
@@ -0,0 +1,91 @@
+from collections import defaultdict, namedtuple
+
+from .models import Task, subtask_count
+
+# ``lookup`` is read with values_list, ``encoded`` columns are dictionary encoded
+Column = namedtuple("Column", ["name", "lookup", "encoded"])
+
+TASK_COLUMNS = (
+    Column("id", "id", False),
+    Column("name", "name", False),
+    Column("status", "status", True),
+    Column("priority", "priority", True),
+    Column("start_date", "start_date", False),
+    Column("end_date", "end_date", False),
+    Column("progress", "progress", False),
+    Column("assigned_to", "assigned_user__username", True),
+    Column("category_name", "category__name", True),
+    Column("subtasks_count", "subtasks_total", False),
+    Column("is_expired", "is_expired", False),
+    Column("tags", None, True),  # Tag names, filled in by task_rows()
+)
+
+SUBTASK_COLUMNS = (
+    Column("id", "id", False),
+    Column("name", "name", False),
+    Column("description", "description", False),
+    Column("status", "status", True),
+    Column("parent_task", "parent_task_id", False),
+    Column("assigned_user", "assigned_user_id", False),
+    Column("assigned_user_name", "assigned_user__username", True),
+    Column("due_date", "due_date", False),
+    Column("date_created", "date_created", False),
+    Column("date_updated", "date_updated", False),
+)
+
+
+def values_for(queryset, columns):
+    return queryset.values_list(*(column.lookup for column in columns if column.lookup))
+
+
+def task_values(queryset):
+    """
+    Read the task columns as tuples.
+    """
+    return values_for(queryset.annotate(subtasks_total=subtask_count()), TASK_COLUMNS)
+
+
+def task_rows(rows):
+    """
+    Append the tag names of each task to rows read with task_values().
+    """
+    tags = defaultdict(list)
+    pairs = (
+        Task.tags.through.objects.filter(task_id__in=[row[0] for row in rows])
+        .order_by("pk")
+        .values_list("task_id", "tag__name")
+    )
+    for task_id, name in pairs:
+        tags[task_id].append(name)
+    return [(*row, tags[row[0]]) for row in rows]
+
+
+def _encode(value, codes):
+    if value is None:
+        return None
+    if isinstance(value, list):
+        return [codes.setdefault(item, len(codes)) for item in value]
+    return codes.setdefault(value, len(codes))
+
+
+def to_columnar(columns, rows):
+    """
+    Turn rows into one value array per column.
+
+    Encoded columns hold indexes into ``dictionaries[name]`` instead of the
+    repeated values, list values become lists of indexes and nulls stay null.
+    """
+    dictionaries = {}
+    arrays = []
+    for index, column in enumerate(columns):
+        values = [row[index] for row in rows]
+        if column.encoded:
+            codes = {}
+            values = [_encode(value, codes) for value in values]
+            dictionaries[column.name] = list(codes)
+        arrays.append(values)
+    return {
+        "fields": [column.name for column in columns],
+        "dictionaries": dictionaries,
+        "columns": arrays,
+    }
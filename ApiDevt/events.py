@@ -0,0 +1,270 @@
+"""
+Server-sent change events.
+
+Every SyncChange row is an event: its id is the event id, its kind and
+object say what changed and its user who should hear about it (null for
+everyone). Rows are published after their transaction commits, fanned out
+across worker processes by a pub/sub channel and handed by each process's
+broadcaster to the event streams of the users concerned.
+
+Redis pub/sub is used when ``EVENTS_PUBSUB_URL`` is set. Without it an
+in-process stand-in with the same interface serves single-process setups.
+
+A stream whose queue overflows, because its client reads slower than
+changes arrive, drops the queued events and reads them back from the change
+log. So do all streams after the pub/sub connection was lost.
+"""
+import asyncio
+import json
+import threading
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Q
+
+from TodoApp.renderers import json_dumps
+
+from .metrics import counters
+from .models import SyncChange
+
+Event = namedtuple("Event", ["id", "kind", "object_id", "op", "user_id"])
+
+EVENT_NAMES = {
+    SyncChange.TASK: "task",
+    SyncChange.SUBTASK: "subtask",
+    SyncChange.TAG: "tag",
+    SyncChange.CATEGORY: "category",
+}
+OP_NAMES = {SyncChange.UPSERT: "upsert", SyncChange.DELETE: "delete"}
+
+
+class LocalPubSub:
+    """
+    In-process stand-in for Redis pub/sub, for single-process setups.
+    """
+    def __init__(self):
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def publish(self, channel, message):
+        with self._lock:
+            callbacks = [callback for name, callback in self._callbacks if name == channel]
+        for callback in callbacks:
+            callback(message)
+
+    def subscribe(self, channel, callback, on_reconnect=None):
+        with self._lock:
+            self._callbacks.append((channel, callback))
+
+
+class RedisPubSub:
+    """
+    Redis pub/sub, listened to by one daemon thread per process and channel.
+    """
+    def __init__(self, url):
+        import redis
+
+        self._redis = redis
+        self._client = redis.Redis.from_url(url)
+
+    def publish(self, channel, message):
+        self._client.publish(channel, message)
+
+    def subscribe(self, channel, callback, on_reconnect=None):
+        thread = threading.Thread(
+            target=self._listen, args=(channel, callback, on_reconnect), name=f"pubsub:{channel}", daemon=True
+        )
+        thread.start()
+
+    def _listen(self, channel, callback, on_reconnect):
+        connected_before = False
+        while True:
+            try:
+                pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(channel)
+                if connected_before and on_reconnect is not None:
+                    # Messages published while disconnected are lost
+                    on_reconnect()
+                connected_before = True
+                for message in pubsub.listen():
+                    callback(message["data"])
+            except self._redis.RedisError:
+                time.sleep(settings.EVENTS_RECONNECT_SECONDS)
+
+
+class Subscription:
+    """
+    The queue of one event stream, fed on the event loop serving it.
+    """
+    def __init__(self, user, loop):
+        self.user_id = user.pk
+        self.is_staff = user.is_staff
+        self.loop = loop
+        self.queue = asyncio.Queue(settings.EVENTS_QUEUE_SIZE)
+        # Set when events were dropped, the stream then reads the change log
+        self.lagging = False
+
+    def wants(self, event):
+        # Staff see every task, like in the delta sync
+        return self.is_staff or event.user_id is None or event.user_id == self.user_id
+
+    def deliver(self, events):
+        for event in events:
+            if not self.wants(event):
+                continue
+            try:
+                self.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                self.lagging = True
+                counters.incr("events.lagging")
+                return
+
+    def mark_lagging(self):
+        self.lagging = True
+        # Wake the stream up
+        if not self.queue.full():
+            self.queue.put_nowait(None)
+
+
+class Broadcaster:
+    """
+    Hands published events to the subscriptions of the current process.
+    """
+    def __init__(self):
+        self._subscriptions = set()
+        self._lock = threading.Lock()
+        self._pubsub = None
+
+    def _get_pubsub(self):
+        with self._lock:
+            if self._pubsub is None:
+                url = settings.EVENTS_PUBSUB_URL
+                self._pubsub = RedisPubSub(url) if url else LocalPubSub()
+                self._pubsub.subscribe(settings.EVENTS_CHANNEL, self._receive, self._lost_messages)
+            return self._pubsub
+
+    def publish(self, events):
+        self._get_pubsub().publish(settings.EVENTS_CHANNEL, json.dumps(events))
+
+    def subscribe(self, user):
+        # Listen before the stream reads its starting point
+        self._get_pubsub()
+        subscription = Subscription(user, asyncio.get_running_loop())
+        with self._lock:
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def _receive(self, message):
+        events = [Event(*row) for row in json.loads(message)]
+        self._each_loop("deliver", events)
+
+    def _lost_messages(self):
+        counters.incr("events.pubsub_reconnected")
+        self._each_loop("mark_lagging")
+
+    def _each_loop(self, method, *args):
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(getattr(subscription, method), *args)
+            except RuntimeError:
+                # The event loop of the stream is gone
+                self.unsubscribe(subscription)
+
+
+broadcaster = Broadcaster()
+
+
+def publish_changes(changes):
+    """
+    Publish saved SyncChange rows once their transaction commits.
+    """
+    events = [
+        (change.id, change.kind, change.object_id, change.op, change.user_id)
+        for change in changes
+        if change.id is not None
+    ]
+    if events:
+        transaction.on_commit(lambda: broadcaster.publish(events))
+
+
+def changes_for(user):
+    changes = SyncChange.objects.all()
+    if not user.is_staff:
+        changes = changes.filter(Q(user_id=user.id) | Q(user_id__isnull=True))
+    return changes
+
+
+def format_event(event):
+    data = json_dumps({"id": event.object_id, "op": OP_NAMES[event.op]})
+    return b"id: %d\nevent: %s\ndata: %s\n\n" % (event.id, EVENT_NAMES[event.kind].encode(), data)
+
+
+async def _replay(user, cursor):
+    """
+    Read the changes after ``cursor`` from the log.
+
+    Returns the events, or None when more than EVENTS_MAX_REPLAY are waiting
+    and the client should catch up through the delta sync instead.
+    """
+    limit = settings.EVENTS_MAX_REPLAY
+    rows = changes_for(user).filter(id__gt=cursor).order_by("id").values_list(
+        "id", "kind", "object_id", "op", "user_id"
+    )[:limit + 1]
+    events = [Event(*row) async for row in rows]
+    return None if len(events) > limit else events
+
+
+async def stream_events(user, last_event_id=None):
+    """
+    Yield the server-sent events of a user, resuming after ``last_event_id``.
+    """
+    subscription = broadcaster.subscribe(user)
+    counters.incr("events.streams")
+    try:
+        yield b"retry: %d\n\n" % settings.EVENTS_RETRY_MILLISECONDS
+        if last_event_id is None:
+            cursor = (await SyncChange.objects.aaggregate(last=Max("id")))["last"] or 0
+        else:
+            cursor = last_event_id
+            subscription.lagging = True
+        # Live events up to here were read from the log already
+        replayed = cursor
+
+        while True:
+            if subscription.lagging:
+                subscription.lagging = False
+                while not subscription.queue.empty():
+                    subscription.queue.get_nowait()
+                events = await _replay(user, cursor)
+                if events is None:
+                    counters.incr("events.resync")
+                    latest = (await SyncChange.objects.aaggregate(last=Max("id")))["last"] or cursor
+                    yield b"id: %d\nevent: resync\ndata: %s\n\n" % (latest, json_dumps({"since": cursor}))
+                    cursor = replayed = latest
+                    continue
+                for event in events:
+                    yield format_event(event)
+                if events:
+                    cursor = replayed = max(cursor, events[-1].id)
+                continue
+
+            try:
+                event = await asyncio.wait_for(subscription.queue.get(), settings.EVENTS_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield b": heartbeat\n\n"
+                continue
+            if event is None or event.id <= replayed:
+                continue
+            # Transactions may commit out of id order, so ids only grow mostly
+            cursor = max(cursor, event.id)
+            yield format_event(event)
+    finally:
+        broadcaster.unsubscribe(subscription)
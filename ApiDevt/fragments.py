@@ -0,0 +1,143 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+
+from TodoApp.renderers import wants_native_temporals
+
+
+class LocalLRU:
+    """
+    Small thread-safe in-process LRU mapping, the first cache tier.
+    """
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, keys):
+        found = {}
+        with self._lock:
+            for key in keys:
+                if key in self._data:
+                    self._data.move_to_end(key)
+                    found[key] = self._data[key]
+        return found
+
+    def set_many(self, items):
+        with self._lock:
+            for key, value in items.items():
+                self._data[key] = value
+                self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+local_fragments = LocalLRU(settings.FRAGMENT_CACHE_LOCAL_SIZE)
+
+
+def fragment_key(serializer_class, object_id, version, variant="text"):
+    return f"frag:{serializer_class.__name__}:{variant}:{object_id}:{version}"
+
+
+def version_token(*parts):
+    """
+    Fold the versions and request details a fragment depends on into a short token.
+    """
+    return hashlib.sha1(repr(parts).encode()).hexdigest()[:20]
+
+
+def get_fragments(keys):
+    """
+    Look keys up in the process LRU, then fetch the rest from the shared tier in one call.
+    """
+    found = local_fragments.get_many(keys)
+    missing = [key for key in keys if key not in found]
+    if missing:
+        shared = caches[settings.FRAGMENT_CACHE_ALIAS].get_many(missing)
+        local_fragments.set_many(shared)
+        found.update(shared)
+    return found
+
+
+async def aget_fragments(keys):
+    """get_fragments through the shared tier's async API"""
+    found = local_fragments.get_many(keys)
+    missing = [key for key in keys if key not in found]
+    if missing:
+        shared = await caches[settings.FRAGMENT_CACHE_ALIAS].aget_many(missing)
+        local_fragments.set_many(shared)
+        found.update(shared)
+    return found
+
+
+def set_fragments(items):
+    """
+    Store serialized fragments in both tiers.
+    """
+    if items:
+        local_fragments.set_many(items)
+        caches[settings.FRAGMENT_CACHE_ALIAS].set_many(items, timeout=settings.FRAGMENT_CACHE_TIMEOUT)
+
+
+def _fragment_keys(serializer_class, versions, context):
+    variant = "native" if wants_native_temporals(context) else "text"
+    return {
+        object_id: fragment_key(serializer_class, object_id, version, variant)
+        for object_id, version in versions.items()
+    }
+
+
+def _missing(keys, cached):
+    return [object_id for object_id, key in keys.items() if key not in cached]
+
+
+def _add_fragments(serializer_class, keys, cached, objects, context):
+    if objects:
+        serialized = serializer_class(objects, many=True, context=context).data
+        fresh = {keys[obj.pk]: data for obj, data in zip(objects, serialized)}
+        set_fragments(fresh)
+        cached.update(fresh)
+    # Objects that disappeared between the id and the row queries are dropped
+    return [cached[key] for key in keys.values() if key in cached]
+
+
+def render_fragments(serializer_class, versions, load, context=None):
+    """
+    Return the serialized representations of objects in the order of ``versions``.
+
+    ``versions`` maps object ids to a version token that changes whenever the
+    representation may change. Cached fragments are reused and the misses are
+    loaded with ``load(ids)`` and serialized in a single pass. Renderers that
+    encode dates themselves get fragments of their own.
+    """
+    context = context or {}
+    keys = _fragment_keys(serializer_class, versions, context)
+    cached = get_fragments(list(keys.values()))
+    missing = _missing(keys, cached)
+    objects = load(missing) if missing else []
+    return _add_fragments(serializer_class, keys, cached, objects, context)
+
+
+async def arender_fragments(serializer_class, versions, aload, context=None):
+    """
+    render_fragments with the misses loaded by the coroutine ``aload(ids)``.
+
+    Cache hits are served on the event loop. Misses are serialized in a
+    thread, serializers may read relations the loaded objects do not hold.
+    """
+    context = context or {}
+    keys = _fragment_keys(serializer_class, versions, context)
+    cached = await aget_fragments(list(keys.values()))
+    missing = _missing(keys, cached)
+    if not missing:
+        return _add_fragments(serializer_class, keys, cached, [], context)
+    objects = await aload(missing)
+    return await sync_to_async(_add_fragments)(serializer_class, keys, cached, objects, context)
@@ -0,0 +1,56 @@
+"""
+Readiness checks: can this process serve requests right now.
+"""
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+from django.db.migrations.executor import MigrationExecutor
+
+from TodoApp.routers import shard_aliases
+
+# Set once every migration was found applied, they are not unapplied while serving
+_migrated = False
+
+
+def check_database():
+    for alias in shard_aliases():
+        with connections[alias].cursor() as cursor:
+            cursor.execute("SELECT 1")
+
+
+def check_migrations():
+    global _migrated
+    if _migrated:
+        return
+    for alias in shard_aliases():
+        executor = MigrationExecutor(connections[alias])
+        if executor.migration_plan(executor.loader.graph.leaf_nodes()):
+            raise RuntimeError(f"Unapplied migrations on {alias}.")
+    _migrated = True
+
+
+def check_caches():
+    for alias in settings.CACHES:
+        caches[alias].get("ready")
+
+
+CHECKS = {
+    "database": check_database,
+    "migrations": check_migrations,
+    "caches": check_caches,
+}
+
+
+def run_checks():
+    """
+    Run every check and return whether all passed, with each one's outcome.
+    """
+    results = {}
+    for name, check in CHECKS.items():
+        try:
+            check()
+        except Exception as exc:
+            results[name] = f"failed: {exc}"
+        else:
+            results[name] = "ok"
+    return all(result == "ok" for result in results.values()), results
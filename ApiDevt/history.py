@@ -0,0 +1,120 @@
+import datetime
+
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncDate
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import TaskDailyRollup, TaskEvent
+from .signals import task_transitioned
+
+EVENT_BATCH_SIZE = 500
+
+# Tracked field and event kind for every logged transition
+LOGGED_FIELDS = (
+    ("status", TaskEvent.STATUS),
+    ("priority", TaskEvent.PRIORITY),
+    ("assigned_user_id", TaskEvent.ASSIGNMENT),
+    ("is_expired", TaskEvent.EXPIRY),
+    ("is_deleted", TaskEvent.DELETION),
+)
+
+# Rollup counters and the events they count
+ROLLUP_COUNTERS = {
+    "created_count": Q(kind=TaskEvent.CREATED),
+    "completed_count": Q(kind=TaskEvent.STATUS, new_value="Completed"),
+    "reopened_count": Q(kind=TaskEvent.STATUS, old_value="Completed") & ~Q(new_value="Completed"),
+    "expired_count": Q(kind=TaskEvent.EXPIRY, new_value="True"),
+    "deleted_count": Q(kind=TaskEvent.DELETION, new_value="True"),
+}
+
+
+def _events_for(transition, timestamp):
+    """
+    Build the TaskEvent rows describing one task transition.
+    """
+    before, after = transition.before, transition.after
+    state = after or before
+
+    def event(kind, old_value="", new_value=""):
+        return TaskEvent(
+            task_id=transition.task_id,
+            user_id=state["assigned_user_id"],
+            category_id=state["category_id"],
+            kind=kind,
+            old_value=str(old_value),
+            new_value=str(new_value),
+            timestamp=timestamp,
+        )
+
+    if before is None:
+        return [event(TaskEvent.CREATED, new_value=after["status"])]
+    if after is None:
+        # Hard deletion, only logged when the task was still live
+        return [] if before["is_deleted"] else [event(TaskEvent.DELETION, False, True)]
+    return [
+        event(kind, before[field], after[field])
+        for field, kind in LOGGED_FIELDS
+        if before[field] != after[field]
+    ]
+
+
+@receiver(task_transitioned)
+def log_task_transitions(sender, transitions, **kwargs):
+    """
+    Append the events of a batch of task transitions with batched inserts.
+    """
+    timestamp = timezone.now()
+    events = [event for transition in transitions for event in _events_for(transition, timestamp)]
+    if events:
+        TaskEvent.objects.bulk_create(events, batch_size=EVENT_BATCH_SIZE)
+
+
+def rollup_task_events(first_day, last_day):
+    """
+    Rebuild the daily rollups for the given days (inclusive) from the event log.
+
+    Each day is recomputed from scratch, so running the job again is harmless.
+    Returns the number of rollup rows written.
+    """
+    tz = timezone.get_current_timezone()
+    start = timezone.make_aware(datetime.datetime.combine(first_day, datetime.time.min), tz)
+    end = timezone.make_aware(
+        datetime.datetime.combine(last_day + datetime.timedelta(days=1), datetime.time.min), tz
+    )
+    buckets = (
+        TaskEvent.objects.filter(timestamp__gte=start, timestamp__lt=end)
+        .annotate(day=TruncDate("timestamp", tzinfo=tz))
+        .values("day", "user_id", "category_id")
+        .annotate(**{name: Count("id", filter=condition) for name, condition in ROLLUP_COUNTERS.items()})
+        .order_by()
+    )
+    rollups = [TaskDailyRollup(**bucket) for bucket in buckets]
+
+    with transaction.atomic():
+        TaskDailyRollup.objects.filter(day__gte=first_day, day__lte=last_day).delete()
+        TaskDailyRollup.objects.bulk_create(rollups, batch_size=EVENT_BATCH_SIZE)
+    return len(rollups)
+
+
+def summarize_rollups(queryset, *group_by):
+    """
+    Sum the rollup counters of a queryset grouped by the given fields, or in total.
+
+    Each row also gets a completion_rate: tasks completed over tasks created
+    in the same days, capped at 1. Rollups count events, not tasks, so a task
+    created before the window and completed inside it counts as a completion
+    without a creation. The cap keeps such windows at 1.
+    """
+    sums = {name: Sum(name) for name in ROLLUP_COUNTERS}
+    if group_by:
+        rows = list(queryset.values(*group_by).annotate(**sums).order_by(*group_by))
+    else:
+        rows = [queryset.aggregate(**sums)]
+    for row in rows:
+        for name in ROLLUP_COUNTERS:
+            row[name] = row[name] or 0
+        created = row["created_count"]
+        row["completion_rate"] = min(round(row["completed_count"] / created, 4), 1.0) if created else None
+    return rows
@@ -0,0 +1,204 @@
+import asyncio
+import datetime
+import importlib
+import statistics
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand
+from django.db.backends.signals import connection_created
+from django.test.utils import override_settings
+from django.urls import clear_url_caches
+from rest_framework.authtoken.models import Token
+
+from ApiDevt.models import Task
+
+SEED_PREFIX = "bench-async"
+
+
+def seed(users, tasks_per_user):
+    """
+    Create users with tokens and tasks, committed so the request threads see them.
+    """
+    today = datetime.date.today()
+    clients = []
+    for i in range(users):
+        user = User.objects.create_user(f"{SEED_PREFIX}-{i}", f"{SEED_PREFIX}-{i}@example.com")
+        token = Token.objects.create(user=user)
+        tasks = Task.objects.bulk_create([
+            Task(
+                name=f"Task {j}", description="Benchmark task", assigned_user=user,
+                start_date=today, start_time=datetime.time(9), end_date=today + datetime.timedelta(days=j % 7),
+                end_time=datetime.time(17),
+            )
+            for j in range(tasks_per_user)
+        ])
+        clients.append((token.key, tasks[0].pk))
+    return clients
+
+
+def unseed():
+    User.objects.filter(username__startswith=f"{SEED_PREFIX}-").delete()
+
+
+def reload_urls():
+    """Rebuild the views, AsyncReadMixin picks sync or coroutine views when routed"""
+    import ApiDevt.urls
+    import TodoApp.urls
+
+    importlib.reload(ApiDevt.urls)
+    importlib.reload(TodoApp.urls)
+    clear_url_caches()
+
+
+async def request(application, path, token, delay):
+    """
+    Send one GET through the ASGI application as a slow client: the request
+    arrives ``delay`` seconds late and every body chunk is read as slowly.
+    """
+    path, _, query = path.partition("?")
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query.encode(),
+        "root_path": "",
+        "headers": [(b"host", b"localhost"), (b"authorization", f"Token {token}".encode())],
+        "client": ("127.0.0.1", 50000),
+        "server": ("localhost", 80),
+    }
+    sent = False
+    finished = asyncio.Event()
+    status = None
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            await asyncio.sleep(delay)
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await finished.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            await asyncio.sleep(delay)
+            if not message.get("more_body"):
+                finished.set()
+
+    await application(scope, receive, send)
+    return status
+
+
+async def run_level(application, clients, paths, concurrency, requests_per_client, delay):
+    latencies = []
+    statuses = set()
+    peak_threads = threading.active_count()
+    running = True
+
+    async def sample_threads():
+        nonlocal peak_threads
+        while running:
+            peak_threads = max(peak_threads, threading.active_count())
+            await asyncio.sleep(0.005)
+
+    async def client(index):
+        token, task_id = clients[index % len(clients)]
+        for i in range(requests_per_client):
+            path = paths[i % len(paths)].format(task_id=task_id)
+            start = time.perf_counter()
+            statuses.add(await request(application, path, token, delay))
+            latencies.append(time.perf_counter() - start)
+
+    sampler = asyncio.ensure_future(sample_threads())
+    start = time.perf_counter()
+    await asyncio.gather(*(client(index) for index in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    running = False
+    await sampler
+
+    latencies.sort()
+    return {
+        "rps": len(latencies) / elapsed,
+        "p50": statistics.median(latencies),
+        "p95": latencies[int(len(latencies) * 0.95) - 1],
+        "threads": peak_threads,
+        "statuses": statuses,
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the sync and coroutine handlers of the read-only task endpoints under ASGI. "
+        "Many slow clients, whose requests arrive late and who read responses slowly, hit the "
+        "task list, upcoming, detail and current user endpoints through the ASGI application "
+        "in-process. Throughput, latency and the peak number of threads are reported per "
+        "handler kind and concurrency. Seeded rows are deleted afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", default="1,10,50,100",
+                            help="Comma separated numbers of concurrent clients")
+        parser.add_argument("--requests", type=int, default=20, help="Requests per client")
+        parser.add_argument("--client-delay-ms", type=float, default=20,
+                            help="Delay before a request arrives and per response chunk read")
+        parser.add_argument("--query-latency-ms", type=float, default=0,
+                            help="Latency added to every query, as with a database across the network")
+        parser.add_argument("--users", type=int, default=20, help="Seeded users")
+        parser.add_argument("--tasks", type=int, default=50, help="Seeded tasks per user")
+
+    def handle(self, *args, **options):
+        levels = [int(level) for level in options["concurrency"].split(",")]
+        delay = options["client_delay_ms"] / 1000
+        query_latency = options["query_latency_ms"] / 1000
+        paths = [
+            "/api/v1/tasks?page_size=20",
+            "/api/v1/tasks/upcoming",
+            "/api/v1/tasks/{task_id}",
+            "/api/v1/users/me",
+        ]
+
+        def slow_query(execute, sql, params, many, context):
+            time.sleep(query_latency)
+            return execute(sql, params, many, context)
+
+        def add_latency(sender, connection, **kwargs):
+            connection.execute_wrappers.append(slow_query)
+
+        if query_latency:
+            connection_created.connect(add_latency)
+        unseed()
+        clients = seed(options["users"], options["tasks"])
+        application = get_asgi_application()
+        self.stdout.write(
+            f"{len(paths)} endpoints, {options['requests']} requests per client, "
+            f"{options['client_delay_ms']:g} ms client delay, {options['query_latency_ms']:g} ms query latency"
+        )
+        try:
+            for async_views in (False, True):
+                with override_settings(ASYNC_VIEWS=async_views):
+                    reload_urls()
+                    for concurrency in levels:
+                        result = asyncio.run(run_level(
+                            application, clients, paths, concurrency, options["requests"], delay
+                        ))
+                        self.stdout.write(
+                            f"{'async' if async_views else 'sync':>5} x{concurrency:<4} "
+                            f"{result['rps']:8.1f} req/s  p50 {result['p50'] * 1000:7.1f} ms  "
+                            f"p95 {result['p95'] * 1000:7.1f} ms  peak threads {result['threads']:4d}  "
+                            f"statuses {sorted(result['statuses'])}"
+                        )
+        finally:
+            reload_urls()
+            connection_created.disconnect(add_latency)
+            unseed()
@@ -0,0 +1,110 @@
+import datetime
+import gzip
+import io
+import time
+from types import SimpleNamespace
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from ApiDevt.models import SubTask, Tag, Task, TaskCategory
+from ApiDevt.serializer import TaskListSerializer
+from ApiDevt.views import load_list_tasks
+from TodoApp.renderers import (
+    FastJSONParser, FastJSONRenderer, MessagePackParser, MessagePackRenderer, msgpack, orjson
+)
+
+
+class Rollback(Exception):
+    pass
+
+
+def seed_task_page(rows):
+    """
+    Create a page of tasks with tags and subtasks and return the loaded tasks.
+    """
+    user = User.objects.create_user("bench-renderers", "bench@example.com")
+    category = TaskCategory.objects.create(name="bench-renderers")
+    tags = [Tag.objects.create(name=f"bench-renderers-{i}", color="#3498db") for i in range(5)]
+    today = datetime.date.today()
+    tasks = Task.objects.bulk_create([
+        Task(
+            name=f"Task {i}", description="Benchmark task " * 8, assigned_user=user, category=category,
+            start_date=today, start_time=datetime.time(9), end_date=today + datetime.timedelta(days=i % 30),
+            end_time=datetime.time(17),
+        )
+        for i in range(rows)
+    ])
+    Task.tags.through.objects.bulk_create([
+        Task.tags.through(task_id=task.pk, tag_id=tag.pk)
+        for task in tasks for tag in tags[:task.pk % 4 + 1]
+    ])
+    SubTask.objects.bulk_create([
+        SubTask(name=f"Step {j}", parent_task=task, assigned_user=user)
+        for task in tasks for j in range(3)
+    ])
+    return load_list_tasks([task.pk for task in tasks])
+
+
+def serialize_for(renderer, tasks):
+    """
+    Serialize tasks the way a request accepting ``renderer`` would get them.
+    """
+    context = {"request": SimpleNamespace(accepted_renderer=renderer)}
+    return TaskListSerializer(tasks, many=True, context=context).data
+
+
+def best_of(func, iterations, repeat=5):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            func()
+        timings.append((time.perf_counter() - start) / iterations)
+    return min(timings)
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the JSON and MessagePack renderers and parsers configured for the API with "
+        "DRF's defaults on a page of seeded tasks: CPU time per call and payload size, raw "
+        "and gzipped. The seeded rows are rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=100, help="Tasks on the rendered page")
+        parser.add_argument("--iterations", type=int, default=200, help="Renders per timing run")
+
+    def handle(self, *args, **options):
+        candidates = [
+            ("drf", JSONRenderer(), JSONParser()),
+            ("fast", FastJSONRenderer(), FastJSONParser()),
+        ]
+        if msgpack is not None:
+            candidates.append(("msgpack", MessagePackRenderer(), MessagePackParser()))
+
+        pages = {}
+        try:
+            with transaction.atomic():
+                tasks = seed_task_page(options["rows"])
+                for label, renderer, parser in candidates:
+                    pages[label] = serialize_for(renderer, tasks)
+                raise Rollback
+        except Rollback:
+            pass
+
+        iterations = options["iterations"]
+        backend = "orjson" if orjson is not None else "stdlib json"
+        self.stdout.write(f"{options['rows']} tasks per page, fast JSON backend: {backend}")
+        for label, renderer, parser in candidates:
+            data = pages[label]
+            body = renderer.render(data)
+            render = best_of(lambda: renderer.render(data), iterations)
+            parse = best_of(lambda: parser.parse(io.BytesIO(body)), iterations)
+            self.stdout.write(
+                f"{label:>7}: render {render * 1000:.3f} ms, parse {parse * 1000:.3f} ms, "
+                f"{len(body)} bytes, {len(gzip.compress(body))} gzipped"
+            )
@@ -0,0 +1,153 @@
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections, transaction
+
+from ApiDevt.metrics import counters
+
+PROFILES = {
+    "default": {"ENGINE": "django.db.backends.sqlite3"},
+    "tuned": {
+        "ENGINE": "TodoApp.backends.sqlite3",
+        "OPTIONS": {
+            "pragmas": settings.SQLITE_PRAGMAS,
+            "transaction_mode": "IMMEDIATE",
+            "lock_retries": settings.SQLITE_LOCK_RETRIES,
+            "lock_backoff": settings.SQLITE_LOCK_BACKOFF_SECONDS,
+        },
+    },
+}
+
+
+def add_database(alias, database):
+    """Register a database alias next to the configured ones"""
+    connections.settings[alias] = connections.configure_settings({DEFAULT_DB_ALIAS: database})[DEFAULT_DB_ALIAS]
+
+
+def create_tables(alias, rows):
+    with connections[alias].cursor() as cursor:
+        cursor.execute("CREATE TABLE bench_counter (id INTEGER PRIMARY KEY, value INTEGER NOT NULL)")
+        cursor.execute("CREATE TABLE bench_entry (id INTEGER PRIMARY KEY, counter_id INTEGER, body TEXT)")
+        cursor.executemany("INSERT INTO bench_counter (id, value) VALUES (%s, 0)", [(i,) for i in range(rows)])
+    connections[alias].close()
+
+
+def write(alias, rows):
+    """Read a row then update it in a transaction, as ORM code loading then saving a model does"""
+    counter_id = random.randrange(rows)
+    with transaction.atomic(using=alias), connections[alias].cursor() as cursor:
+        cursor.execute("SELECT value FROM bench_counter WHERE id = %s", [counter_id])
+        value = cursor.fetchone()[0]
+        cursor.execute("UPDATE bench_counter SET value = %s WHERE id = %s", [value + 1, counter_id])
+        cursor.execute("INSERT INTO bench_entry (counter_id, body) VALUES (%s, %s)", [counter_id, "x" * 200])
+
+
+def read(alias, rows):
+    with connections[alias].cursor() as cursor:
+        cursor.execute(
+            "SELECT c.id, c.value, COUNT(e.id) FROM bench_counter c LEFT JOIN bench_entry e "
+            "ON e.counter_id = c.id WHERE c.id >= %s GROUP BY c.id LIMIT 20",
+            [random.randrange(rows)],
+        )
+        cursor.fetchall()
+
+
+def run_level(alias, workers, operations, write_ratio, rows):
+    latencies = {"read": [], "write": []}
+    errors = {"read": 0, "write": 0}
+    lock = threading.Lock()
+    start_line = threading.Barrier(workers)
+
+    def worker():
+        start_line.wait()
+        for _ in range(operations):
+            kind = "write" if random.random() < write_ratio else "read"
+            start = time.perf_counter()
+            try:
+                (write if kind == "write" else read)(alias, rows)
+            except OperationalError:
+                with lock:
+                    errors[kind] += 1
+                continue
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies[kind].append(elapsed)
+        connections[alias].close()
+
+    retried = counters.snapshot().get("db.lock_retried", 0)
+    threads = [threading.Thread(target=worker) for _ in range(workers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return {
+        "ops": sum(len(values) for values in latencies.values()) / elapsed,
+        "latency": {kind: percentiles(values) for kind, values in latencies.items()},
+        "errors": errors,
+        "retried": counters.snapshot().get("db.lock_retried", 0) - retried,
+    }
+
+
+def percentiles(values):
+    if not values:
+        return None
+    values = sorted(values)
+    return statistics.median(values), values[max(int(len(values) * 0.99) - 1, 0)]
+
+
+def format_latency(latency):
+    if latency is None:
+        return f"{'-':>19}"
+    return f"{latency[0] * 1000:7.1f} /{latency[1] * 1000:8.1f} ms"
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare Django's default SQLite settings with the tuned profile of settings.py under "
+        "concurrent writers. Worker threads, each with its own connection like separate "
+        "processes, mix transactions that read a row then update it with aggregate reads on "
+        "a scratch database file per profile. Throughput, p50 / p99 latency and lock errors "
+        "are reported per profile and number of workers. The files are deleted afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", default="1,4,16", help="Comma separated numbers of concurrent workers")
+        parser.add_argument("--operations", type=int, default=200, help="Operations per worker")
+        parser.add_argument("--write-ratio", type=float, default=0.3, help="Share of operations that write")
+        parser.add_argument("--rows", type=int, default=1000, help="Rows of the updated table")
+
+    def handle(self, *args, **options):
+        levels = [int(level) for level in options["workers"].split(",")]
+        directory = tempfile.mkdtemp(prefix="bench-sqlite-")
+        self.stdout.write(
+            f"{options['operations']} operations per worker, {options['write_ratio']:.0%} writes, "
+            f"latency p50 / p99"
+        )
+        self.stdout.write(f"{'profile':<8} {'workers':>7} {'ops/s':>8}  {'read':>19}  {'write':>19}  "
+                          f"{'lock errors':>11}  {'retries':>7}")
+        try:
+            for profile, database in PROFILES.items():
+                for workers in levels:
+                    # A fresh file per run, WAL is a property of the file once set
+                    alias = f"bench_{profile}_{workers}"
+                    add_database(alias, {**database, "NAME": os.path.join(directory, f"{alias}.sqlite3")})
+                    create_tables(alias, options["rows"])
+                    result = run_level(alias, workers, options["operations"], options["write_ratio"],
+                                       options["rows"])
+                    errors = result["errors"]["read"] + result["errors"]["write"]
+                    self.stdout.write(
+                        f"{profile:<8} {workers:>7} {result['ops']:8.1f}  "
+                        f"{format_latency(result['latency']['read'])}  "
+                        f"{format_latency(result['latency']['write'])}  {errors:>11}  {result['retried']:>7}"
+                    )
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
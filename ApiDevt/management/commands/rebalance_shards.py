@@ -0,0 +1,52 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ApiDevt.models import Task
+from ApiDevt.sharding import copy_references, home_shard, move_user, plan_rebalance, rebuild_collaborator_index
+from TodoApp.routers import shard_aliases
+
+
+class Command(BaseCommand):
+    help = (
+        "Move users' tasks between shards while the servers keep running, one user "
+        "given with --user and --to, or enough users to even out the shards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", type=int, help="Move this user id")
+        parser.add_argument("--to", help="Shard to move --user to")
+        parser.add_argument("--max-moves", type=int, default=10,
+                            help="Most users moved when evening out the shards")
+        parser.add_argument("--dry-run", action="store_true", help="Only print the moves")
+        parser.add_argument("--repair", action="store_true",
+                            help="Copy users, tags and categories to the shards again and rebuild "
+                                 "the collaborator index, for changes made around the signals")
+
+    def handle(self, *args, **options):
+        if not settings.DB_SHARD_ALIASES:
+            raise CommandError("Sharding is off, set DB_SHARDS.")
+
+        if options["repair"]:
+            for alias in settings.DB_SHARD_ALIASES:
+                copy_references(alias)
+            entries = rebuild_collaborator_index()
+            self.stdout.write(self.style.SUCCESS(f"Repaired the shards, {entries} collaborator index entries."))
+            return
+
+        if options["user"] is not None:
+            if options["to"] not in shard_aliases():
+                raise CommandError(f"--to must be one of {', '.join(shard_aliases())}.")
+            source = home_shard(options["user"])
+            total = Task._base_manager.using(source).filter(assigned_user_id=options["user"]).count()
+            moves = [(options["user"], source, options["to"], total)]
+        else:
+            moves = plan_rebalance(options["max_moves"])
+            if not moves:
+                self.stdout.write("The shards are balanced.")
+
+        for user_id, source, target, total in moves:
+            if options["dry_run"]:
+                self.stdout.write(f"Would move user {user_id} from {source} to {target} ({total} tasks).")
+                continue
+            moved = move_user(user_id, target, log=self.stdout.write)
+            self.stdout.write(self.style.SUCCESS(f"Moved {moved} tasks of user {user_id} to {target}."))
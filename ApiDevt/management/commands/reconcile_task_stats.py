@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from ApiDevt.stats import reconcile_user_stats
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the per-user task stats from the task table to correct drift. "
+        "Meant to be run periodically, e.g. hourly from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", type=int, action="append", dest="user_ids",
+                            help="Only reconcile this user id (repeatable)")
+
+    def handle(self, *args, **options):
+        corrected = reconcile_user_stats(options["user_ids"])
+        self.stdout.write(self.style.SUCCESS(f"Reconciled task stats, {corrected} rows corrected."))
@@ -0,0 +1,30 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from ApiDevt.history import rollup_task_events
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the daily task rollups from the task event log. By default the last "
+        "two days are rebuilt, meant to be run periodically, e.g. hourly from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--from", dest="first_day", type=datetime.date.fromisoformat,
+                            help="First day to rebuild (YYYY-MM-DD)")
+        parser.add_argument("--to", dest="last_day", type=datetime.date.fromisoformat,
+                            help="Last day to rebuild (YYYY-MM-DD), defaults to today")
+
+    def handle(self, *args, **options):
+        last_day = options["last_day"] or timezone.localdate()
+        first_day = options["first_day"] or last_day - datetime.timedelta(days=1)
+        if first_day > last_day:
+            raise CommandError("--from must not be after --to")
+
+        written = rollup_task_events(first_day, last_day)
+        self.stdout.write(self.style.SUCCESS(
+            f"Rolled up task events from {first_day} to {last_day} into {written} rows."
+        ))
@@ -0,0 +1,68 @@
+import os
+
+import uvicorn
+from django.conf import settings
+from django.contrib.staticfiles.handlers import ASGIStaticFilesHandler
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import get_resolver
+
+from TodoApp.prefork import Arbiter, parse_bind
+
+
+class Command(BaseCommand):
+    help = (
+        "Serve the ASGI application with preforked uvicorn workers sharing one listening "
+        "socket. The application is loaded once before forking. SIGTERM stops gracefully, SIGHUP reloads the code "
+        "without refusing connections. Migrations are not run, use `migrate` beforehand."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--bind", default=settings.SERVE_BIND, help="host:port to listen on")
+        parser.add_argument("--workers", type=int, default=settings.SERVE_WORKERS,
+                            help="Worker processes, 0 for one per CPU")
+        parser.add_argument("--max-requests", type=int, default=settings.SERVE_MAX_REQUESTS,
+                            help="Requests a worker serves before it is replaced, 0 for no limit")
+        parser.add_argument("--max-requests-jitter", type=int, default=settings.SERVE_MAX_REQUESTS_JITTER,
+                            help="Up to this many more requests per worker, so they restart at different times")
+        parser.add_argument("--graceful-timeout", type=float, default=settings.SERVE_GRACEFUL_TIMEOUT,
+                            help="Seconds workers get to finish their request when stopping")
+        parser.add_argument("--keep-alive", type=int, default=settings.SERVE_KEEP_ALIVE,
+                            help="Seconds an idle connection is kept open for its next request")
+        parser.add_argument("--backlog", type=int, default=settings.SERVE_BACKLOG,
+                            help="Connections queued while every worker is busy")
+        parser.add_argument("--static", action="store_true",
+                            help="Also serve static files, like runserver does")
+
+    def handle(self, *args, **options):
+        try:
+            parse_bind(options["bind"])
+        except ValueError as exc:
+            raise CommandError(exc)
+        workers = options["workers"] or os.cpu_count() or 1
+
+        # Preload: import the application, its middleware and every view once,
+        # the workers share the loaded code copy-on-write
+        app = get_asgi_application()
+        get_resolver().reverse_dict
+        if options["static"]:
+            app = ASGIStaticFilesHandler(app)
+        config = uvicorn.Config(
+            app,
+            interface="asgi3",
+            lifespan="off",  # Django's handler does not speak the lifespan protocol
+            timeout_keep_alive=options["keep_alive"],
+            timeout_graceful_shutdown=int(options["graceful_timeout"]),
+        )
+        config.load()
+
+        Arbiter(
+            config,
+            bind=options["bind"],
+            workers=workers,
+            max_requests=options["max_requests"],
+            max_requests_jitter=options["max_requests_jitter"],
+            graceful_timeout=options["graceful_timeout"],
+            backlog=options["backlog"],
+            log=self.stdout.write,
+        ).run()
@@ -0,0 +1,26 @@
+import threading
+from collections import defaultdict
+
+
+class CounterRegistry:
+    """
+    Thread-safe named counters of the current process.
+    """
+    def __init__(self):
+        self._counts = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            self._counts[name] += amount
+
+    def snapshot(self):
+        with self._lock:
+            return dict(sorted(self._counts.items()))
+
+    def reset(self):
+        with self._lock:
+            self._counts.clear()
+
+
+counters = CounterRegistry()
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:31
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ApiDevt', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['end_date', 'start_date'], name='task_end_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['recurring', 'is_expired', 'start_date'], name='task_recurring_idx'),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:34
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ApiDevt', '0003_user_task_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('task_id', models.PositiveBigIntegerField()),
+                ('user_id', models.PositiveIntegerField()),
+                ('category_id', models.PositiveBigIntegerField(null=True)),
+                ('kind', models.PositiveSmallIntegerField(choices=[(1, 'Created'), (2, 'Status'), (3, 'Priority'), (4, 'Assignment'), (5, 'Expiry'), (6, 'Deletion')])),
+                ('old_value', models.CharField(blank=True, max_length=20)),
+                ('new_value', models.CharField(blank=True, max_length=20)),
+                ('timestamp', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Task Event',
+                'db_table': 'task_event',
+            },
+        ),
+        migrations.CreateModel(
+            name='TaskDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('user_id', models.PositiveIntegerField()),
+                ('category_id', models.PositiveBigIntegerField(null=True)),
+                ('created_count', models.PositiveIntegerField(default=0)),
+                ('completed_count', models.PositiveIntegerField(default=0)),
+                ('reopened_count', models.PositiveIntegerField(default=0)),
+                ('expired_count', models.PositiveIntegerField(default=0)),
+                ('deleted_count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Task Daily Rollup',
+                'db_table': 'task_daily_rollup',
+                'indexes': [models.Index(fields=['user_id', 'day'], name='rollup_user_day_idx'), models.Index(fields=['day'], name='rollup_day_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:36
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def seed_sync_changes(apps, schema_editor):
+    """
+    Log every existing object once so a sync from cursor 0 returns the current data.
+    """
+    SyncChange = apps.get_model('ApiDevt', 'SyncChange')
+    Task = apps.get_model('ApiDevt', 'Task')
+    SubTask = apps.get_model('ApiDevt', 'SubTask')
+    Tag = apps.get_model('ApiDevt', 'Tag')
+    TaskCategory = apps.get_model('ApiDevt', 'TaskCategory')
+
+    audiences = {}
+    for task_id, user_id in Task.objects.filter(is_deleted=False).values_list('id', 'assigned_user_id'):
+        audiences[task_id] = {user_id}
+    for task_id, user_id in Task.collaborators.through.objects.values_list('task_id', 'user_id'):
+        if task_id in audiences:
+            audiences[task_id].add(user_id)
+
+    changes = [SyncChange(kind=4, object_id=pk) for pk in TaskCategory.objects.values_list('id', flat=True)]
+    changes += [SyncChange(kind=3, object_id=pk) for pk in Tag.objects.values_list('id', flat=True)]
+    for task_id, users in audiences.items():
+        changes += [SyncChange(kind=1, object_id=task_id, user_id=user_id) for user_id in users]
+    for subtask_id, task_id in SubTask.objects.values_list('id', 'parent_task_id'):
+        changes += [SyncChange(kind=2, object_id=subtask_id, user_id=user_id) for user_id in audiences.get(task_id, ())]
+    SyncChange.objects.bulk_create(changes, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ApiDevt', '0004_task_event_log'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.PositiveSmallIntegerField(choices=[(1, 'Task'), (2, 'SubTask'), (3, 'Tag'), (4, 'Task Category')])),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('user_id', models.PositiveIntegerField(null=True)),
+                ('op', models.PositiveSmallIntegerField(choices=[(1, 'Upsert'), (2, 'Delete')], default=1)),
+                ('date_created', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Sync Change',
+                'db_table': 'sync_change',
+                'indexes': [models.Index(fields=['user_id', 'id'], name='sync_change_user_cursor_idx')],
+            },
+        ),
+        migrations.RunPython(seed_sync_changes, migrations.RunPython.noop),
+    ]
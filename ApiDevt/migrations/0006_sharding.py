@@ -0,0 +1,56 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:41
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ApiDevt', '0005_sync_change_log'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdSequence',
+            fields=[
+                ('name', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('next_id', models.PositiveBigIntegerField()),
+            ],
+            options={
+                'verbose_name': 'Id Sequence',
+                'db_table': 'id_sequence',
+            },
+        ),
+        migrations.CreateModel(
+            name='CollaboratorIndex',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('task_id', models.PositiveBigIntegerField()),
+                ('user_id', models.PositiveIntegerField()),
+                ('shard', models.CharField(max_length=100)),
+            ],
+            options={
+                'verbose_name': 'Collaborator Index',
+                'db_table': 'collaborator_index',
+                'indexes': [models.Index(fields=['task_id'], name='collaborator_index_task_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user_id', 'task_id'), name='collaborator_index_user_task_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='UserShard',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='shard', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('alias', models.CharField(max_length=100)),
+                ('moving', models.BooleanField(default=False)),
+                ('date_updated', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'User Shard',
+                'db_table': 'user_shard',
+                'indexes': [models.Index(fields=['alias'], name='user_shard_alias_idx')],
+            },
+        ),
+    ]
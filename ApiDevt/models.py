@@ -1,10 +1,16 @@
 import datetime
 from django.conf import settings
-from django.db import models
+from django.db import models, router, transaction
+from django.db.models import Q
+from django.db.models.functions import Coalesce, Now
 from django.contrib.auth.models import User
 from django.core.mail import send_mail
 from django.utils import timezone
 
+from TodoApp.routers import shard_aliases, shard_scope
+
+from .signals import TaskTransition, send_task_transitions
+
 # Create your models here.
     
 class OtpCode(models.Model):
@@ -35,6 +41,37 @@ class OtpCode(models.Model):
     class Meta:
         verbose_name = "OtpCode"
         db_table = "OtpCode"
+        indexes = [
+            # Admin changelist filter, newest first
+            models.Index(fields=["is_used", "id"], name="otpcode_is_used_idx"),
+        ]
+
+def subtask_count():
+    """
+    Count the subtasks of each task with a correlated subquery, which unlike
+    a join stays correct on the distinct querysets of visible_to().
+    """
+    subtasks = (
+        SubTask.objects.filter(parent_task=models.OuterRef("pk"))
+        .order_by()
+        .values("parent_task")
+        .annotate(total=models.Count("pk"))
+        .values("total")
+    )
+    return Coalesce(models.Subquery(subtasks), 0)
+
+
+class TaskQuerySet(models.QuerySet):
+    def visible_to(self, user):
+        """
+        Restrict to the tasks a user may see:
+        - Staff can see all tasks
+        - Regular users can see tasks assigned to them or where they are collaborators
+        """
+        if user.is_staff:
+            return self
+        return self.filter(Q(assigned_user=user) | Q(collaborators=user)).distinct()
+
 
 class TaskCategory(models.Model):
     name = models.CharField(max_length=100)
@@ -93,25 +130,62 @@ class Task(models.Model):
     date_created = models.DateTimeField(auto_now_add=True)
     date_updated = models.DateTimeField(auto_now=True)
 
+    objects = TaskQuerySet.as_manager()
+
+    # Fields whose changes are broadcast through the task_transitioned signal
+    TRACKED_FIELDS = (
+        "status", "priority", "is_expired", "is_deleted",
+        "assigned_user_id", "category_id", "end_date",
+    )
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._tracked_state = instance.tracked_state()
+        return instance
+
+    def tracked_state(self):
+        """
+        Return the current values of the tracked fields, or None if any of them is deferred.
+        """
+        if not all(field in self.__dict__ for field in self.TRACKED_FIELDS):
+            return None
+        return {field: self.__dict__[field] for field in self.TRACKED_FIELDS}
+
     @classmethod
     def check_expired_tasks(cls):
         """
-        Mark tasks as expired if the current time is past their end time.
+        Mark tasks as expired if the current time is past their end time, on
+        every shard, and return the expired tasks.
         """
+        expired_tasks = []
+        for alias in shard_aliases():
+            with shard_scope(alias):
+                cls._expire_tasks()
+                expired_tasks.extend(cls.objects.filter(is_expired=True))
+        return expired_tasks
+
+    @classmethod
+    def _expire_tasks(cls):
         tasks_to_expire = cls.objects.filter(is_expired=False, is_deleted=False, end_date__lte=datetime.date.today())
         current_time = timezone.now()
+        transitions = []
 
         for task in tasks_to_expire:
-            task_end_datetime = datetime.datetime.combine(task.end_date, task.end_time)
+            task_end_datetime = timezone.make_aware(datetime.datetime.combine(task.end_date, task.end_time))
             if current_time > task_end_datetime:
+                before = task.tracked_state()
                 task.is_expired = True
+                task._tracked_state = task.tracked_state()
+                transitions.append(TaskTransition(task.pk, before, task._tracked_state))
                 
                 # Handle recurring tasks
                 if task.recurring != "None":
                     cls.create_recurring_task(task)
 
         cls.objects.bulk_update(tasks_to_expire, ["is_expired"])
-        return cls.objects.filter(is_expired=True)
+        # bulk_update bypasses model signals
+        send_task_transitions(cls, transitions)
         
     @classmethod
     def create_recurring_task(cls, original_task):
@@ -167,11 +241,48 @@ class Task(models.Model):
             
         return new_task
 
+    @classmethod
+    def bulk_create_with_relations(cls, tasks, tag_ids, collaborator_ids, batch_size=None):
+        """
+        Insert tasks and their tag and collaborator links with bulk_create.
+
+        ``tag_ids`` and ``collaborator_ids`` hold one iterable of ids per task.
+        The tasks go to the current shard, sharding.bulk_create_tasks() spreads
+        them over their owners' shards.
+        """
+        with transaction.atomic(using=router.db_for_write(cls)):
+            cls.objects.bulk_create(tasks, batch_size=batch_size)
+            cls.tags.through.objects.bulk_create([
+                cls.tags.through(task_id=task.pk, tag_id=tag_id)
+                for task, ids in zip(tasks, tag_ids)
+                for tag_id in dict.fromkeys(ids)
+            ], batch_size=batch_size)
+            cls.collaborators.through.objects.bulk_create([
+                cls.collaborators.through(task_id=task.pk, user_id=user_id)
+                for task, ids in zip(tasks, collaborator_ids)
+                for user_id in dict.fromkeys(ids)
+            ], batch_size=batch_size)
+
+            # bulk_create bypasses model and m2m signals
+            transitions = []
+            for task in tasks:
+                task._tracked_state = task.tracked_state()
+                transitions.append(TaskTransition(task.pk, None, task._tracked_state))
+            send_task_transitions(cls, transitions)
+        return tasks
+
     @classmethod
     def send_notifications(cls):
         """
-        Send email notifications for tasks starting soon.
+        Send email notifications for tasks starting soon, on every shard.
         """
+        for alias in shard_aliases():
+            with shard_scope(alias):
+                cls._notify_tasks()
+        return "Notifications sent to all users."
+
+    @classmethod
+    def _notify_tasks(cls):
         tasks_to_notify = cls.objects.filter(is_expired=False, is_notified=False, is_deleted=False)
         current_time = timezone.now()
 
@@ -197,7 +308,6 @@ class Task(models.Model):
                 task.is_notified = True
 
         cls.objects.bulk_update(tasks_to_notify, ["is_notified"])
-        return "Notifications sent to all users."
         
     @staticmethod
     def _send_notification_email(task, user):
@@ -222,6 +332,14 @@ class Task(models.Model):
     class Meta:
         verbose_name = "Task"
         db_table = "task"
+        indexes = [
+            # Serve date window (calendar) lookups
+            models.Index(fields=["end_date", "start_date"], name="task_end_start_idx"),
+            models.Index(fields=["recurring", "is_expired", "start_date"], name="task_recurring_idx"),
+            # Admin changelist filters, newest first
+            models.Index(fields=["status", "id"], name="task_status_idx"),
+            models.Index(fields=["priority", "id"], name="task_priority_idx"),
+        ]
 
 
 class SubTask(models.Model):
@@ -263,6 +381,10 @@ class SubTask(models.Model):
     class Meta:
         verbose_name = "SubTask"
         db_table = "subtask"
+        indexes = [
+            # Admin changelist filter, newest first
+            models.Index(fields=["status", "id"], name="subtask_status_idx"),
+        ]
 
 
 class Tag(models.Model):
@@ -304,4 +426,188 @@ class UserPreference(models.Model):
     
     class Meta:
         verbose_name = "User Preference"
-        db_table = "user_preference"
\ No newline at end of file
+        db_table = "user_preference"
+
+
+class UserTaskStats(models.Model):
+    """
+    Dashboard counters for the tasks assigned to a user.
+
+    Rows are updated incrementally from task transitions and rebuilt by the
+    reconcile_task_stats command to correct any drift.
+    """
+    user = models.OneToOneField(User, related_name="task_stats", on_delete=models.CASCADE)
+    open_count = models.IntegerField(default=0)  # Not Started, In Progress or On Hold
+    overdue_count = models.IntegerField(default=0)  # Open and expired
+    due_this_week_count = models.IntegerField(default=0)  # Open, not expired, ending this week
+    completed_count = models.IntegerField(default=0)
+    week_start = models.DateField()  # Monday of the week due_this_week_count refers to
+    date_updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.user.username}'s task stats"
+
+    class Meta:
+        verbose_name = "User Task Stats"
+        db_table = "user_task_stats"
+
+
+class TaskEvent(models.Model):
+    """
+    Append-only log of task transitions used to build historical rollups.
+
+    Ids are stored without foreign keys so the history outlives the rows it describes.
+    """
+    CREATED = 1
+    STATUS = 2
+    PRIORITY = 3
+    ASSIGNMENT = 4
+    EXPIRY = 5
+    DELETION = 6
+
+    KIND_CHOICES = [
+        (CREATED, "Created"),
+        (STATUS, "Status"),
+        (PRIORITY, "Priority"),
+        (ASSIGNMENT, "Assignment"),
+        (EXPIRY, "Expiry"),
+        (DELETION, "Deletion"),
+    ]
+
+    task_id = models.PositiveBigIntegerField()
+    user_id = models.PositiveIntegerField()  # Assigned user at the time of the event
+    category_id = models.PositiveBigIntegerField(null=True)
+    kind = models.PositiveSmallIntegerField(choices=KIND_CHOICES)
+    old_value = models.CharField(max_length=20, blank=True)
+    new_value = models.CharField(max_length=20, blank=True)
+    timestamp = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return f"{self.get_kind_display()} of task {self.task_id}"
+
+    class Meta:
+        verbose_name = "Task Event"
+        db_table = "task_event"
+
+
+class TaskDailyRollup(models.Model):
+    """
+    Task event counts per day, user and category, rebuilt by the rollup_task_events command.
+    """
+    day = models.DateField()
+    user_id = models.PositiveIntegerField()
+    category_id = models.PositiveBigIntegerField(null=True)
+    created_count = models.PositiveIntegerField(default=0)
+    completed_count = models.PositiveIntegerField(default=0)
+    reopened_count = models.PositiveIntegerField(default=0)
+    expired_count = models.PositiveIntegerField(default=0)
+    deleted_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Task Daily Rollup"
+        db_table = "task_daily_rollup"
+        indexes = [
+            models.Index(fields=["user_id", "day"], name="rollup_user_day_idx"),
+            models.Index(fields=["day"], name="rollup_day_idx"),
+        ]
+
+
+class SyncChange(models.Model):
+    """
+    Change log behind the delta sync endpoint.
+
+    The auto-incremented id is the sync cursor, so writes sharing a timestamp
+    still get distinct positions. It is held back behind the most recent rows,
+    which may still have uncommitted predecessors (see build_sync_page). Rows
+    only say which object changed for which user (null for everyone), the
+    sync endpoint reads the current state to build upserts and tombstones.
+    """
+    TASK = 1
+    SUBTASK = 2
+    TAG = 3
+    CATEGORY = 4
+
+    KIND_CHOICES = [
+        (TASK, "Task"),
+        (SUBTASK, "SubTask"),
+        (TAG, "Tag"),
+        (CATEGORY, "Task Category"),
+    ]
+
+    UPSERT = 1
+    DELETE = 2
+
+    OP_CHOICES = [
+        (UPSERT, "Upsert"),
+        (DELETE, "Delete"),
+    ]
+
+    kind = models.PositiveSmallIntegerField(choices=KIND_CHOICES)
+    object_id = models.PositiveBigIntegerField()
+    user_id = models.PositiveIntegerField(null=True)  # Null when the change concerns every user
+    op = models.PositiveSmallIntegerField(choices=OP_CHOICES, default=UPSERT)
+    # Stamped by the database clock, the one the sync cursor is held back with
+    date_created = models.DateTimeField(db_default=Now())
+
+    class Meta:
+        verbose_name = "Sync Change"
+        db_table = "sync_change"
+        indexes = [
+            models.Index(fields=["user_id", "id"], name="sync_change_user_cursor_idx"),
+        ]
+
+
+class UserShard(models.Model):
+    """
+    Shard map: the database holding the tasks assigned to a user.
+
+    Users without a row keep their tasks in the default database.
+    """
+    user = models.OneToOneField(User, primary_key=True, related_name="shard", on_delete=models.CASCADE)
+    alias = models.CharField(max_length=100)
+    moving = models.BooleanField(default=False)  # Writes to the user's tasks are refused while they move
+    date_updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.user_id} on {self.alias}"
+
+    class Meta:
+        verbose_name = "User Shard"
+        db_table = "user_shard"
+        indexes = [
+            models.Index(fields=["alias"], name="user_shard_alias_idx"),
+        ]
+
+
+class CollaboratorIndex(models.Model):
+    """
+    Global index of task collaborators and the shard each task lives on, so
+    users find the tasks they collaborate on in other users' shards.
+
+    Ids are stored without foreign keys, tasks live in other databases.
+    """
+    task_id = models.PositiveBigIntegerField()
+    user_id = models.PositiveIntegerField()
+    shard = models.CharField(max_length=100)
+
+    class Meta:
+        verbose_name = "Collaborator Index"
+        db_table = "collaborator_index"
+        constraints = [
+            models.UniqueConstraint(fields=["user_id", "task_id"], name="collaborator_index_user_task_uniq"),
+        ]
+        indexes = [
+            models.Index(fields=["task_id"], name="collaborator_index_task_idx"),
+        ]
+
+
+class IdSequence(models.Model):
+    """
+    Next free id of a model whose rows are spread over several databases.
+    """
+    name = models.CharField(max_length=100, primary_key=True)
+    next_id = models.PositiveBigIntegerField()
+
+    class Meta:
+        verbose_name = "Id Sequence"
+        db_table = "id_sequence"
@@ -0,0 +1,100 @@
+import json
+
+from django.conf import settings
+from django.core.paginator import InvalidPage, Paginator
+from django.db import DatabaseError, connections
+from django.db.models import Max, Min
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+
+
+class LargePagePagination(PageNumberPagination):
+    """
+    Page number pagination that lets clients ask for pages of up to 1000 rows
+    with ``?page_size=``, meant for the columnar list format.
+    """
+    page_size_query_param = "page_size"
+    max_page_size = 1000
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """
+        paginate_queryset through the async ORM, for coroutine handlers.
+        """
+        self.request = request
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        paginator = self.django_paginator_class(queryset, page_size)
+        # Counted up front so the paginator never queries by itself
+        paginator.count = await queryset.acount()
+        page_number = self.get_page_number(request, paginator)
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            raise NotFound(self.invalid_page_message.format(page_number=page_number, message=str(exc)))
+
+        if paginator.num_pages > 1 and self.template is not None:
+            self.display_page_controls = True
+
+        self.page.object_list = [row async for row in self.page.object_list]
+        return list(self.page)
+
+
+def estimate_count(queryset):
+    """
+    The database's estimate of the rows of a queryset, None without one.
+    PostgreSQL plans any queryset, elsewhere only a whole table is estimated:
+    from the table statistics, or the span of its primary keys before the
+    first ANALYZE on SQLite.
+    """
+    connection = connections[queryset.db]
+    try:
+        with connection.cursor() as cursor:
+            if connection.vendor == "postgresql":
+                sql, params = queryset.query.get_compiler(using=queryset.db).as_sql()
+                cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+                plan = cursor.fetchone()[0]
+                plan = json.loads(plan) if isinstance(plan, str) else plan
+                return int(plan[0]["Plan"]["Plan Rows"])
+            if queryset.query.has_filters():
+                return None
+            if connection.vendor == "mysql":
+                cursor.execute(
+                    "SELECT table_rows FROM information_schema.tables "
+                    "WHERE table_schema = DATABASE() AND table_name = %s",
+                    [queryset.model._meta.db_table],
+                )
+                row = cursor.fetchone()
+                return row and row[0]
+            if connection.vendor == "sqlite":
+                # The first number of an index's stat is the rows of its table
+                cursor.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1", [queryset.model._meta.db_table])
+                row = cursor.fetchone()
+                if row:
+                    return int(row[0].split()[0])
+    except DatabaseError:
+        # sqlite_stat1 only exists once ANALYZE ran
+        pass
+    if queryset.query.has_filters():
+        return None
+    span = queryset.model._base_manager.using(queryset.db).aggregate(low=Min("pk"), high=Max("pk"))
+    return span["high"] - span["low"] + 1 if span["high"] is not None else 0
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator for admin changelists of large tables. Counts exactly up to
+    ADMIN_EXACT_COUNT_LIMIT rows and estimates beyond that, where a COUNT(*)
+    would read the whole table.
+    """
+
+    @cached_property
+    def count(self):
+        limit = settings.ADMIN_EXACT_COUNT_LIMIT
+        # Counting a slice stops after limit + 1 rows
+        counted = self.object_list.order_by()[:limit + 1].count()
+        if counted <= limit:
+            return counted
+        return max(estimate_count(self.object_list) or 0, counted)
@@ -0,0 +1,67 @@
+import datetime
+import heapq
+
+from dateutil import rrule
+
+# dateutil frequencies for the recurring choices on Task
+RRULE_FREQUENCIES = {
+    "Daily": rrule.DAILY,
+    "Weekly": rrule.WEEKLY,
+    "Monthly": rrule.MONTHLY,
+    "Yearly": rrule.YEARLY,
+}
+
+
+def expand_occurrences(task, window_start, window_end):
+    """
+    Yield the (start, end) dates of every occurrence of a task overlapping the window.
+
+    ``task`` is a mapping with ``start_date``, ``end_date``, ``recurring`` and
+    ``is_expired`` keys. Recurrences are expanded virtually, no rows are created.
+    Expired recurring tasks only yield their own span because the expiry sweep
+    has already materialised the next occurrence as a new task.
+    """
+    start_date = task["start_date"]
+    end_date = task["end_date"]
+    duration = end_date - start_date
+    frequency = RRULE_FREQUENCIES.get(task["recurring"])
+
+    if frequency is None or task["is_expired"]:
+        if start_date <= window_end and end_date >= window_start:
+            yield start_date, end_date
+        return
+
+    rule = rrule.rrule(frequency, dtstart=datetime.datetime.combine(start_date, datetime.time.min))
+    after = datetime.datetime.combine(window_start - duration, datetime.time.min)
+    before = datetime.datetime.combine(window_end, datetime.time.min)
+    for occurrence in rule.xafter(after, inc=True):
+        if occurrence > before:
+            break
+        yield occurrence.date(), occurrence.date() + duration
+
+
+def iter_calendar_days(tasks, window_start, window_end):
+    """
+    Yield (day, entries) pairs in date order for the given tasks.
+
+    Each occurrence is placed in the bucket of the day it starts on, clipped to
+    the window, as a compact ``[task_id, span_in_days]`` entry. Occurrences are
+    merged lazily across tasks so memory stays proportional to the task count.
+    """
+    def clipped(task):
+        for start, end in expand_occurrences(task, window_start, window_end):
+            day = max(start, window_start)
+            span = (min(end, window_end) - day).days + 1
+            yield day, task["id"], span
+
+    current_day = None
+    entries = []
+    for day, task_id, span in heapq.merge(*(clipped(task) for task in tasks)):
+        if day != current_day:
+            if entries:
+                yield current_day, entries
+            current_day, entries = day, []
+        entries.append([task_id, span])
+
+    if entries:
+        yield current_day, entries
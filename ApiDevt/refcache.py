@@ -0,0 +1,116 @@
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .fragments import version_token
+from .models import Tag, TaskCategory, UserPreference
+from .versioning import CATEGORIES, TAGS, bump_versions, get_versions
+
+Snapshot = namedtuple("Snapshot", ["value", "version", "loaded_at", "checked_at"])
+
+
+def preference_key(user_id):
+    return f"preference:{user_id}"
+
+
+class ReferenceCache:
+    """
+    In-process snapshots of small, rarely changing tables.
+
+    Each snapshot remembers the shared version it was built from. Reads within
+    ``check_interval`` seconds of the last check are served from memory, later
+    ones compare against the shared version first, so a change made by any
+    worker is seen everywhere within that delay. Rebuilt snapshots are shared
+    through the default cache, keyed by version, before falling back to the
+    database. Snapshots older than ``ttl`` are always rebuilt and at most
+    ``max_entries`` are kept.
+    """
+    def __init__(self, max_entries, ttl, check_interval):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.check_interval = check_interval
+        self._snapshots = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, name, version_keys, load):
+        """
+        Return the snapshot called ``name``, rebuilding it with ``load()`` when
+        any of ``version_keys`` moved or the snapshot is too old.
+        """
+        now = time.monotonic()
+        with self._lock:
+            snapshot = self._snapshots.get(name)
+            if snapshot is not None:
+                self._snapshots.move_to_end(name)
+
+        if snapshot is not None and now - snapshot.loaded_at < self.ttl:
+            if now - snapshot.checked_at < self.check_interval:
+                return snapshot.value
+            if self._version(version_keys) == snapshot.version:
+                self._store(name, snapshot._replace(checked_at=now))
+                return snapshot.value
+
+        # Read the version before the data so a snapshot is never newer than its version
+        version = self._version(version_keys)
+        shared_key = f"ref:{name}:{version_token(version)}"
+        shared = caches[settings.REFCACHE_ALIAS]
+        value = shared.get(shared_key)
+        if value is None:
+            value = load()
+            shared.set(shared_key, value, self.ttl)
+        self._store(name, Snapshot(value, version, now, now))
+        return value
+
+    @staticmethod
+    def _version(version_keys):
+        versions = get_versions(version_keys)
+        return tuple(versions[key] for key in version_keys)
+
+    def invalidate(self, name):
+        """
+        Drop the snapshot called ``name`` and its variants (``name:<variant>``).
+        """
+        with self._lock:
+            for key in [key for key in self._snapshots if key == name or key.startswith(f"{name}:")]:
+                del self._snapshots[key]
+
+    def _store(self, name, snapshot):
+        with self._lock:
+            self._snapshots[name] = snapshot
+            self._snapshots.move_to_end(name)
+            while len(self._snapshots) > self.max_entries:
+                self._snapshots.popitem(last=False)
+
+
+reference_cache = ReferenceCache(
+    max_entries=settings.REFCACHE_MAX_ENTRIES,
+    ttl=settings.REFCACHE_TTL,
+    check_interval=settings.REFCACHE_VERSION_CHECK_SECONDS,
+)
+
+
+def _invalidate_on_commit(name):
+    # Other workers notice through the shared version, this one right away
+    transaction.on_commit(lambda: reference_cache.invalidate(name))
+
+
+@receiver([post_save, post_delete], sender=Tag)
+def invalidate_tags(sender, **kwargs):
+    _invalidate_on_commit(TAGS)
+
+
+@receiver([post_save, post_delete], sender=TaskCategory)
+def invalidate_categories(sender, **kwargs):
+    _invalidate_on_commit(CATEGORIES)
+
+
+@receiver([post_save, post_delete], sender=UserPreference)
+def invalidate_preference(sender, instance, **kwargs):
+    bump_versions(preference_key(instance.user_id))
+    _invalidate_on_commit(preference_key(instance.user_id))
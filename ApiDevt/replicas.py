@@ -0,0 +1,184 @@
+"""
+Read replicas for the safe requests of the task, tag, category and subtask endpoints.
+
+A replica serves a request only when it is known to hold every change the
+response depends on, so ETags and version-keyed caches never describe stale
+rows. The versions a response depends on are the ones its ETag is built
+from. A replica's position is measured in the change log at most every
+``REPLICA_CHECK_SECONDS``: it holds every change made before the first log
+row it misses, or before the measurement when it misses none. Otherwise:
+
+- Users who wrote through those endpoints read from the primary for
+  ``REPLICA_PIN_SECONDS``, writes without a change log row included.
+- Replicas further behind than ``REPLICA_MAX_LAG_SECONDS`` are out of
+  rotation until they catch up.
+- A replica that fails is out of rotation for ``REPLICA_RETRY_SECONDS``. The
+  request it failed is served again from another replica or the primary.
+"""
+import random
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, DatabaseError
+from django.db.models import Max
+from rest_framework.permissions import SAFE_METHODS
+
+from TodoApp.routers import read_database, read_from, read_scope
+
+from .metrics import counters
+from .models import SyncChange
+from .versioning import CATEGORIES, TAGS, TASKS, USERS, get_versions, user_key, version_time
+
+
+def pin_key(user_id):
+    return f"replica-pin:{user_id}"
+
+
+class Replica:
+    def __init__(self, alias):
+        self.alias = alias
+        # Wall clock time before which the replica holds every change
+        self.caught_up_at = 0.0
+        self.checked_at = None
+        self.down_until = 0.0
+        self._checking = threading.Lock()
+
+    def lag(self):
+        return time.time() - self.caught_up_at
+
+    def refresh(self):
+        """
+        Measure the replica's position unless it was measured recently or
+        another thread is measuring it.
+        """
+        now = time.monotonic()
+        if self.checked_at is not None and now - self.checked_at < settings.REPLICA_CHECK_SECONDS:
+            return
+        if not self._checking.acquire(blocking=False):
+            return
+        try:
+            measured_at = time.time()
+            # The replica first: rows the primary has beyond it were missing when it was read
+            last_id = SyncChange.objects.using(self.alias).aggregate(last_id=Max("id"))["last_id"] or 0
+            first_missing = (
+                SyncChange.objects.using(DEFAULT_DB_ALIAS).filter(id__gt=last_id)
+                .order_by("id").values_list("date_created", flat=True).first()
+            )
+            self.caught_up_at = measured_at if first_missing is None else first_missing.timestamp()
+            self.checked_at = time.monotonic()
+        except DatabaseError:
+            self.mark_down()
+        finally:
+            self._checking.release()
+
+    def mark_down(self):
+        counters.incr(f"replicas.{self.alias}.down")
+        self.down_until = time.monotonic() + settings.REPLICA_RETRY_SECONDS
+        self.checked_at = None
+
+
+class ReplicaSet:
+    def __init__(self, aliases):
+        self.replicas = {alias: Replica(alias) for alias in aliases}
+
+    def choose(self, fresh_since):
+        """
+        Pick a replica holding every change made up to ``fresh_since``, a wall
+        clock time, and not lagging too far behind. Return its alias and the
+        time up to which it is fresh, or None.
+        """
+        candidates = []
+        now = time.monotonic()
+        for replica in self.replicas.values():
+            if replica.down_until > now:
+                continue
+            replica.refresh()
+            # Versions are stamped by the clocks of every server
+            fresh_until = replica.caught_up_at - settings.REPLICA_CLOCK_SKEW_SECONDS
+            if (
+                replica.down_until <= now
+                and fresh_until >= fresh_since
+                and replica.lag() <= settings.REPLICA_MAX_LAG_SECONDS
+            ):
+                candidates.append((replica.alias, fresh_until))
+        return random.choice(candidates) if candidates else None
+
+    def mark_down(self, alias):
+        if alias in self.replicas:
+            self.replicas[alias].mark_down()
+
+    def stats(self):
+        now = time.monotonic()
+        return {
+            alias: {"lag": round(replica.lag(), 3), "down": replica.down_until > now}
+            for alias, replica in self.replicas.items()
+        }
+
+
+replicas = ReplicaSet(settings.DB_REPLICA_ALIASES)
+
+
+class ReplicaReadMixin:
+    """
+    Serve the safe requests of a viewset from a read replica that is fresh enough.
+    """
+    def get_replica_versions(self):
+        """The versions every safe response of the viewset depends on"""
+        user = self.request.user
+        return get_versions([TASKS if user.is_staff else user_key(user.pk), TAGS, CATEGORIES, USERS])
+
+    def choose_read_database(self, request):
+        if not replicas.replicas or request.method not in SAFE_METHODS or not request.user.is_authenticated:
+            return None
+        if cache.get(pin_key(request.user.pk)):
+            counters.incr("replicas.pinned")
+            return None
+        chosen = replicas.choose(version_time(self.get_replica_versions()))
+        counters.incr("replicas.reads" if chosen else "replicas.primary_reads")
+        return chosen
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        read_from(*self.choose_read_database(request) or (None,))
+
+    async def ainitial(self, request, *args, **kwargs):
+        await super().ainitial(request, *args, **kwargs)
+        read_from(*await sync_to_async(self.choose_read_database)(request) or (None,))
+
+    def dispatch(self, request, *args, **kwargs):
+        with read_scope():
+            try:
+                return super().dispatch(request, *args, **kwargs)
+            except DatabaseError:
+                if read_database() is None:
+                    raise
+                self._fail_over()
+        with read_scope():
+            return super().dispatch(request, *args, **kwargs)
+
+    async def adispatch(self, request, *args, **kwargs):
+        with read_scope():
+            try:
+                return await super().adispatch(request, *args, **kwargs)
+            except DatabaseError:
+                if read_database() is None:
+                    raise
+                self._fail_over()
+        with read_scope():
+            return await super().adispatch(request, *args, **kwargs)
+
+    def _fail_over(self):
+        counters.incr("replicas.failed_over")
+        replicas.mark_down(read_database())
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if (
+            replicas.replicas and request.method not in SAFE_METHODS
+            and response.status_code < 400 and request.user.is_authenticated
+        ):
+            cache.set(pin_key(request.user.pk), True, settings.REPLICA_PIN_SECONDS)
+        return response
@@ -1,10 +1,57 @@
 from rest_framework import serializers, exceptions
+from rest_framework.settings import api_settings
 from django.contrib.auth.models import User
+from django.db.models import Count, OuterRef, Prefetch, Q, Subquery
+from django.db.models.functions import Coalesce
 from django.contrib.auth import authenticate
 import datetime
 from drf_spectacular.utils import extend_schema_field
 from typing import Dict, Any, Union, List, Optional
-from ApiDevt.models import Task, TaskCategory, OtpCode, SubTask, Tag, UserPreference
+from ApiDevt.models import Task, TaskCategory, OtpCode, SubTask, Tag, UserPreference, UserTaskStats, subtask_count
+from ApiDevt.sharding import (
+    assigned_task_counts, bulk_create_tasks, category_task_counts, reload, sharding_enabled, tag_task_counts
+)
+from ApiDevt.sparse import FieldPlan, plan_queryset
+from TodoApp.renderers import wants_native_temporals
+
+
+class NativeTemporalMixin:
+    """
+    Leave dates and datetimes as objects when the accepted renderer encodes them itself.
+    """
+    def get_fields(self):
+        fields = super().get_fields()
+        if wants_native_temporals(self.context):
+            for field in fields.values():
+                if isinstance(field, (serializers.DateTimeField, serializers.DateField)):
+                    field.format = None
+        return fields
+
+
+class SparseFieldsMixin:
+    """
+    Output only the fields a view put in ``context["sparse_fields"]``.
+
+    Nested serializers share the context but always output every field, only
+    the top-level serializer (or the child of a top-level list) is trimmed.
+    Write-only fields are kept so input validation is unaffected.
+    """
+    sparse_plans = {}
+
+    @classmethod
+    def get_sparse_plans(cls):
+        """The ``FieldPlan`` of each field, see ApiDevt/sparse.py"""
+        return cls.sparse_plans
+    
+    def get_fields(self):
+        fields = super().get_fields()
+        selected = self.context.get("sparse_fields")
+        if selected is None:
+            return fields
+        root = self.root
+        if root is not self and not (self.parent is root and isinstance(root, serializers.ListSerializer)):
+            return fields
+        return {name: field for name, field in fields.items() if name in selected or field.write_only}
 
 
 class LoginSerializer(serializers.Serializer):
@@ -32,10 +79,15 @@ class LoginSerializer(serializers.Serializer):
         return data
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(SparseFieldsMixin, NativeTemporalMixin, serializers.ModelSerializer):
     """
     Serializer for user accounts with password handling.
     """
+    sparse_plans = {
+        "assigned_tasks_count": FieldPlan(annotations={
+            "assigned_tasks_total": Count("assigned_tasks", filter=Q(assigned_tasks__is_deleted=False)),
+        }),
+    }
     password = serializers.CharField(write_only=True, required=False)
     is_superuser = serializers.BooleanField(write_only=True, required=False)
     assigned_tasks_count = serializers.SerializerMethodField()
@@ -52,9 +104,16 @@ class UserSerializer(serializers.ModelSerializer):
             "password": {"write_only": True},
         }
     
+    @classmethod
+    def get_sparse_plans(cls):
+        # Sharded tasks cannot be joined to users, views attach the counts instead
+        return {} if sharding_enabled() else cls.sparse_plans
+
     @extend_schema_field(int)
     def get_assigned_tasks_count(self, obj) -> int:
         """Return the count of tasks assigned to this user."""
+        if hasattr(obj, "assigned_tasks_total"):
+            return obj.assigned_tasks_total
         return obj.assigned_tasks.filter(is_deleted=False).count()
 
     def create(self, validated_data):
@@ -89,7 +148,20 @@ class UserSerializer(serializers.ModelSerializer):
         return instance
 
 
-class TagSerializer(serializers.ModelSerializer):
+class UserTaskStatsSerializer(NativeTemporalMixin, serializers.ModelSerializer):
+    """
+    Serializer for a user's dashboard task counters.
+    """
+    class Meta:
+        model = UserTaskStats
+        fields = [
+            "open_count", "overdue_count", "due_this_week_count",
+            "completed_count", "week_start", "date_updated"
+        ]
+        read_only_fields = fields
+
+
+class TagSerializer(NativeTemporalMixin, serializers.ModelSerializer):
     """
     Serializer for task tags.
     """
@@ -103,6 +175,10 @@ class TagSerializer(serializers.ModelSerializer):
     @extend_schema_field(int)
     def get_tasks_count(self, obj) -> int:
         """Return the count of active tasks associated with this tag."""
+        if hasattr(obj, "tasks_total"):
+            return obj.tasks_total
+        if sharding_enabled():
+            return tag_task_counts().get(obj.pk, 0)
         return obj.tasks.filter(is_deleted=False).count()
     
     def validate_color(self, value):
@@ -117,7 +193,7 @@ class TagSerializer(serializers.ModelSerializer):
         return value
 
 
-class UserPreferenceSerializer(serializers.ModelSerializer):
+class UserPreferenceSerializer(NativeTemporalMixin, serializers.ModelSerializer):
     """
     Serializer for user preferences.
     """
@@ -133,7 +209,7 @@ class UserPreferenceSerializer(serializers.ModelSerializer):
         read_only_fields = ["id", "date_created", "date_updated"]
 
 
-class TaskCategorySerializer(serializers.ModelSerializer):
+class TaskCategorySerializer(NativeTemporalMixin, serializers.ModelSerializer):
     """
     Serializer for task categories with task count.
     """
@@ -147,13 +223,20 @@ class TaskCategorySerializer(serializers.ModelSerializer):
     @extend_schema_field(int)
     def get_tasks_count(self, obj) -> int:
         """Return the count of active tasks in this category."""
+        if hasattr(obj, "tasks_total"):
+            return obj.tasks_total
+        if sharding_enabled():
+            return category_task_counts().get(obj.pk, 0)
         return obj.tasks.filter(is_deleted=False).count()
 
 
-class SubTaskSerializer(serializers.ModelSerializer):
+class SubTaskSerializer(SparseFieldsMixin, NativeTemporalMixin, serializers.ModelSerializer):
     """
     Serializer for subtasks.
     """
+    sparse_plans = {
+        "assigned_user_name": FieldPlan(only=("assigned_user", "assigned_user__username"), select_related=("assigned_user",)),
+    }
     assigned_user_name = serializers.ReadOnlyField(source="assigned_user.username")
     
     class Meta:
@@ -172,10 +255,34 @@ class SubTaskSerializer(serializers.ModelSerializer):
         return value
 
 
-class TaskListSerializer(serializers.ModelSerializer):
+def tags_with_counts():
+    """
+    Prefetch tags with the active task count TagSerializer shows.
+    """
+    if sharding_enabled():
+        # Counted over every shard by TagSerializer
+        return "tags"
+    # A subquery, a join on tasks would only count the prefetched task
+    links = (
+        Task.tags.through.objects.filter(tag=OuterRef("pk"), task__is_deleted=False)
+        .order_by()
+        .values("tag")
+        .annotate(total=Count("pk"))
+        .values("total")
+    )
+    return Prefetch("tags", queryset=Tag.objects.annotate(tasks_total=Coalesce(Subquery(links), 0)))
+
+
+class TaskListSerializer(SparseFieldsMixin, NativeTemporalMixin, serializers.ModelSerializer):
     """
     Lightweight serializer for listing tasks.
     """
+    sparse_plans = {
+        "assigned_to": FieldPlan(only=("assigned_user", "assigned_user__username"), select_related=("assigned_user",)),
+        "category_name": FieldPlan(only=("category", "category__name"), select_related=("category",)),
+        "subtasks_count": FieldPlan(annotations={"subtasks_total": subtask_count()}),
+        "tags": FieldPlan(prefetch_related=(tags_with_counts(),)),
+    }
     assigned_to = serializers.ReadOnlyField(source="assigned_user.username")
     category_name = serializers.ReadOnlyField(source="category.name")
     subtasks_count = serializers.SerializerMethodField()
@@ -191,15 +298,135 @@ class TaskListSerializer(serializers.ModelSerializer):
     
     @extend_schema_field(int)
     def get_subtasks_count(self, obj) -> int:
+        if hasattr(obj, "subtasks_total"):
+            return obj.subtasks_total
         return obj.subtasks.count()
 
 
-class TaskDetailSerializer(serializers.ModelSerializer):
+class TaskDetailListSerializer(serializers.ListSerializer):
+    """
+    Creates many tasks with one INSERT per table instead of one per task.
+
+    An item that fails validation or names a missing user or category fails
+    the whole list. With ``context["partial_success"]`` it is left out
+    instead and ``item_errors`` maps its input index to the errors.
+    """
+    def to_internal_value(self, data):
+        self.item_errors = {}
+        self._item_index = 0
+        # Failed items come back as None, see run_child_validation()
+        valid = [(index, item) for index, item in enumerate(super().to_internal_value(data)) if item is not None]
+        for position, errors in self._check_references([item for _, item in valid]).items():
+            self.item_errors[valid[position][0]] = errors
+        
+        if self.item_errors and not self.context.get("partial_success"):
+            errors = dict(sorted(self.item_errors.items()))
+            if not api_settings.LIST_SERIALIZER_ERRORS_AS_DICT:
+                errors = [errors.get(index, {}) for index in range(len(data))]
+            raise serializers.ValidationError(errors)
+        return [item for index, item in valid if index not in self.item_errors]
+    
+    def run_child_validation(self, data):
+        # Collect item errors instead of raising, so the references of the
+        # other items are still checked
+        index = self._item_index
+        self._item_index += 1
+        try:
+            return super().run_child_validation(data)
+        except serializers.ValidationError as exc:
+            self.item_errors[index] = exc.detail
+            return None
+    
+    @staticmethod
+    def _check_references(items):
+        """
+        Find the items whose assigned user or category does not exist, with two queries.
+        """
+        user_ids = {item["assigned_user_id"] for item in items}
+        category_ids = {item.get("category_id") for item in items} - {None}
+        users = set(User.objects.filter(pk__in=user_ids).values_list("pk", flat=True))
+        categories = set(TaskCategory.objects.filter(pk__in=category_ids).values_list("pk", flat=True))
+        
+        missing = {}
+        for index, item in enumerate(items):
+            errors = {}
+            if item["assigned_user_id"] not in users:
+                errors["assigned_user_id"] = [f"User {item['assigned_user_id']} does not exist."]
+            if item.get("category_id") is not None and item["category_id"] not in categories:
+                errors["category_id"] = [f"Category {item['category_id']} does not exist."]
+            if errors:
+                missing[index] = errors
+        return missing
+    
+    def create(self, items):
+        """
+        Insert the valid items and return the tasks in input order.
+        """
+        # Unknown collaborators and tags are ignored, like when creating one task
+        users = set(User.objects.filter(
+            pk__in={pk for item in items for pk in item.get("collaborator_ids", ())}
+        ).values_list("pk", flat=True))
+        tags = set(Tag.objects.filter(
+            pk__in={pk for item in items for pk in item.get("tag_ids", ())}
+        ).values_list("pk", flat=True))
+        
+        tasks = bulk_create_tasks(
+            [
+                Task(**{key: value for key, value in item.items() if key not in ("collaborator_ids", "tag_ids")})
+                for item in items
+            ],
+            [[pk for pk in item.get("tag_ids", ()) if pk in tags] for item in items],
+            [[pk for pk in item.get("collaborator_ids", ()) if pk in users] for item in items],
+        )
+        loaded = reload(plan_queryset(Task.objects.all(), type(self.child)), tasks)
+        tasks = [loaded[task.pk] for task in tasks]
+        self._attach_counts(tasks)
+        return tasks
+    
+    @staticmethod
+    def _attach_counts(tasks):
+        """
+        Count the tasks of the nested users and categories once for the whole
+        list instead of once per nested object.
+        """
+        users = [user for task in tasks for user in (task.assigned_user, *task.collaborators.all())]
+        categories = [task.category for task in tasks if task.category is not None]
+        if sharding_enabled():
+            user_totals = assigned_task_counts({user.pk for user in users})
+            for user in users:
+                user.assigned_tasks_total = user_totals.get(user.pk, 0)
+            return
+        live = Task.objects.filter(is_deleted=False).order_by()
+        user_totals = dict(
+            live.filter(assigned_user__in={user.pk for user in users})
+            .values_list("assigned_user").annotate(total=Count("pk"))
+        )
+        category_totals = dict(
+            live.filter(category__in={category.pk for category in categories})
+            .values_list("category").annotate(total=Count("pk"))
+        )
+        for user in users:
+            user.assigned_tasks_total = user_totals.get(user.pk, 0)
+        for category in categories:
+            category.tasks_total = category_totals.get(category.pk, 0)
+
+
+class TaskDetailSerializer(SparseFieldsMixin, NativeTemporalMixin, serializers.ModelSerializer):
     """
     Detailed serializer for individual task view with nested data.
     """
+    sparse_plans = {
+        "assigned_user": FieldPlan(only=("assigned_user",), select_related=("assigned_user",)),
+        "category": FieldPlan(only=("category",), select_related=("category",)),
+        "collaborators": FieldPlan(prefetch_related=("collaborators",)),
+        "subtasks": FieldPlan(prefetch_related=(
+            Prefetch("subtasks", queryset=SubTask.objects.select_related("assigned_user")),
+        )),
+        "tags": FieldPlan(prefetch_related=(tags_with_counts(),)),
+    }
     assigned_user = UserSerializer(read_only=True)
-    assigned_user_id = serializers.IntegerField(write_only=True)
+    # Defaults to the requesting user on creation
+    assigned_user_id = serializers.IntegerField(write_only=True, required=False)
     category = TaskCategorySerializer(read_only=True)
     category_id = serializers.IntegerField(write_only=True, required=False, allow_null=True)
     subtasks = SubTaskSerializer(many=True, read_only=True)
@@ -228,11 +455,18 @@ class TaskDetailSerializer(serializers.ModelSerializer):
             "date_updated"
         ]
         read_only_fields = ["id", "is_notified", "is_expired", "date_created", "date_updated"]
+        list_serializer_class = TaskDetailListSerializer
     
     def validate(self, data):
         """
         Validate start date is before end date and other complex validations.
         """
+        if self.instance is None and "assigned_user_id" not in data:
+            request = self.context.get("request")
+            if request is None:
+                raise serializers.ValidationError({"assigned_user_id": ["This field is required."]})
+            data["assigned_user_id"] = request.user.id
+        
         # If both dates are provided, ensure start is before end
         start_date = data.get("start_date")
         end_date = data.get("end_date")
@@ -290,7 +524,7 @@ class TaskDetailSerializer(serializers.ModelSerializer):
         return instance
 
 
-class OtpCodeSerializer(serializers.ModelSerializer):
+class OtpCodeSerializer(NativeTemporalMixin, serializers.ModelSerializer):
     """
     Serializer for OTP codes with status info.
     """
@@ -311,7 +545,7 @@ class OtpCodeSerializer(serializers.ModelSerializer):
         return obj.get_status()
 
 
-class TaskSerializer(serializers.ModelSerializer):
+class TaskSerializer(NativeTemporalMixin, serializers.ModelSerializer):
     """
     Standard serializer for tasks with basic related fields.
     Use for general purpose task operations.
@@ -352,6 +586,34 @@ class TaskSerializer(serializers.ModelSerializer):
         return data
 
 
+class SyncTaskSerializer(TaskSerializer):
+    """
+    Flat task serializer with related ids for offline clients.
+    """
+    tag_ids = serializers.PrimaryKeyRelatedField(source="tags", many=True, read_only=True)
+    collaborator_ids = serializers.PrimaryKeyRelatedField(source="collaborators", many=True, read_only=True)
+    
+    class Meta(TaskSerializer.Meta):
+        fields = TaskSerializer.Meta.fields + ["tag_ids", "collaborator_ids"]
+
+
+class TaskImportSerializer(TaskSerializer):
+    """
+    Validates one row of a task import, with relations given by name.
+    """
+    assigned_user = serializers.CharField(max_length=150, required=False)
+    category = serializers.CharField(max_length=100, required=False)
+    tags = serializers.ListField(child=serializers.CharField(max_length=50), required=False)
+    collaborators = serializers.ListField(child=serializers.CharField(max_length=150), required=False)
+    
+    class Meta(TaskSerializer.Meta):
+        fields = [
+            "name", "description", "status", "start_date", "start_time",
+            "end_date", "end_time", "priority", "recurring", "progress",
+            "reminder_time", "assigned_user", "category", "tags", "collaborators"
+        ]
+
+
 class TaskRelationshipSerializer(serializers.Serializer):
     """
     Serializer for task relationship operations like assigning tags or collaborators.
@@ -401,4 +663,18 @@ class TaskBulkOperationSerializer(serializers.Serializer):
         if operation == "change_priority" and "priority" not in data:
             raise serializers.ValidationError("Priority field is required for 'change_priority' operation")
             
-        return data
\ No newline at end of file
+        return data
+
+class BatchRequestSerializer(serializers.Serializer):
+    """
+    Serializer for one sub-request of a batch.
+    """
+    method = serializers.ChoiceField(choices=["GET", "HEAD", "OPTIONS", "POST", "PUT", "PATCH", "DELETE"])
+    path = serializers.CharField()
+    body = serializers.JSONField(required=False, allow_null=True)
+    headers = serializers.DictField(child=serializers.CharField(), required=False)
+    
+    def validate_path(self, value):
+        if not value.startswith("/api/"):
+            raise serializers.ValidationError("Must be an API path starting with /api/.")
+        return value
@@ -0,0 +1,734 @@
+"""
+Sharding of task data by assigned user.
+
+With ``DB_SHARDS`` set, every task lives on the shard of its assigned user
+together with its subtasks and its tag and collaborator links. The default
+database is one of the shards and keeps everything else: users, tags and
+categories (copied to every shard, so task rows keep their foreign keys and
+joins), the shard map, the change log and the other per-user tables.
+
+- The shard map (UserShard) says where the tasks of each user live. New
+  users are spread over the shards by id, users without a row stay on the
+  default database.
+- Task and subtask ids come from a global sequence, so they are unique
+  across shards and survive moves.
+- Collaborators find the tasks they were added to on other shards through
+  CollaboratorIndex, kept on the default database. Requests spanning several
+  shards, like every request of a staff user, query each of them and merge
+  the results.
+- Tasks follow their assigned user to another shard when reassigned, and the
+  rebalance_shards command moves users between shards while they keep
+  working: their tasks are copied, the changes logged meanwhile are copied
+  again while writes to their tasks are briefly refused, then the map is
+  switched.
+
+A write to a shard and the change log rows it leaves on the default database
+commit separately.
+"""
+import datetime
+import itertools
+import logging
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, transaction
+from django.db.models import Count, Max
+from django.db.models.functions import Now
+from django.db.models.signals import m2m_changed, post_delete, post_migrate, post_save, pre_save
+from django.dispatch import receiver
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.permissions import SAFE_METHODS
+
+from TodoApp.routers import current_shard, shard_aliases, shard_scope, use_shard
+
+from .metrics import counters
+from .models import CollaboratorIndex, IdSequence, SubTask, SyncChange, Tag, Task, TaskCategory, UserShard
+from .versioning import CATEGORIES, TAGS, get_versions
+
+logger = logging.getLogger(__name__)
+
+SHARDED_MODELS = (Task, SubTask, Task.tags.through, Task.collaborators.through)
+# Copied from the default database to every shard, written through the default database only
+REFERENCE_MODELS = (User, Tag, TaskCategory)
+# Lookup of the user whose shard holds a row
+OWNER_LOOKUPS = {Task: "assigned_user_id", SubTask: "parent_task__assigned_user_id"}
+
+
+def sharding_enabled():
+    return bool(settings.DB_SHARD_ALIASES)
+
+
+def is_sharded(model):
+    return model in SHARDED_MODELS
+
+
+def using_shard(queryset, alias):
+    """Bind a queryset to a shard, leaving the default database to the routers"""
+    return queryset if alias == DEFAULT_DB_ALIAS else queryset.using(alias)
+
+
+def on_shards(aliases, func):
+    """Call ``func(alias)`` in the scope of each shard and return the results"""
+    results = []
+    for alias in aliases:
+        with shard_scope(alias):
+            results.append(func(alias))
+    return results
+
+
+# Shard map
+
+def map_key(user_id):
+    return f"user-shard:{user_id}"
+
+
+def user_shards(user_ids):
+    """
+    Map user ids to the shard holding their tasks and whether they are moving.
+
+    Entries are cached for ``SHARD_MAP_CACHE_SECONDS``, moves wait that long
+    for every process to see the change.
+    """
+    user_ids = set(user_ids)
+    if not sharding_enabled():
+        return dict.fromkeys(user_ids, (DEFAULT_DB_ALIAS, False))
+    cached = cache.get_many([map_key(user_id) for user_id in user_ids])
+    entries = {user_id: cached[map_key(user_id)] for user_id in user_ids if map_key(user_id) in cached}
+    missing = user_ids - entries.keys()
+    if missing:
+        loaded = dict.fromkeys(missing, (DEFAULT_DB_ALIAS, False))
+        rows = UserShard.objects.using(DEFAULT_DB_ALIAS).filter(user_id__in=missing)
+        loaded.update(
+            (user_id, (alias, moving)) for user_id, alias, moving in rows.values_list("user_id", "alias", "moving")
+        )
+        cache.set_many({map_key(user_id): entry for user_id, entry in loaded.items()}, settings.SHARD_MAP_CACHE_SECONDS)
+        entries.update(loaded)
+    return entries
+
+
+def home_shard(user_id):
+    return user_shards([user_id])[user_id][0]
+
+
+def set_user_shard(user_id, alias, moving=False):
+    UserShard.objects.using(DEFAULT_DB_ALIAS).update_or_create(
+        user_id=user_id, defaults={"alias": alias, "moving": moving}
+    )
+    cache.delete(map_key(user_id))
+
+
+def visible_shards(user):
+    """The shards holding tasks a user may see, the user's own first"""
+    if not sharding_enabled():
+        return [DEFAULT_DB_ALIAS]
+    home = home_shard(user.pk)
+    if user.is_staff:
+        return [home, *(alias for alias in shard_aliases() if alias != home)]
+    others = (
+        CollaboratorIndex.objects.using(DEFAULT_DB_ALIAS).filter(user_id=user.pk)
+        .exclude(shard=home).order_by().values_list("shard", flat=True).distinct()
+    )
+    return [home, *sorted(others)]
+
+
+def locate(model, pk, aliases):
+    """
+    Return the first of ``aliases`` holding the task or subtask with this pk
+    and the id of the user owning it, or None.
+    """
+    try:
+        pk = int(pk)
+    except (TypeError, ValueError):
+        return None
+    for alias in aliases:
+        row = model._base_manager.using(alias).filter(pk=pk).values_list(OWNER_LOOKUPS[model]).first()
+        if row is not None:
+            return alias, row[0]
+    return None
+
+
+def shard_of(instance):
+    """The shard a task or subtask belongs on, read from the instance or its parent"""
+    if instance._state.db is not None:
+        return instance._state.db
+    if isinstance(instance, Task):
+        return home_shard(instance.assigned_user_id) if instance.assigned_user_id else current_shard()
+    if isinstance(instance, SubTask):
+        if SubTask.parent_task.is_cached(instance):
+            return shard_of(instance.parent_task)
+        aliases = [current_shard(), *(alias for alias in shard_aliases() if alias != current_shard())]
+        found = locate(Task, instance.parent_task_id, aliases)
+        return found[0] if found else current_shard()
+    return current_shard()
+
+
+# Global ids
+
+class IdBlocks:
+    """
+    Ids of sharded models reserved by this process, ``SHARD_ID_BLOCK_SIZE`` at a time.
+    """
+    def __init__(self):
+        self._blocks = {}
+        self._lock = threading.Lock()
+
+    def next_id(self, model):
+        with self._lock:
+            block = self._blocks.get(model)
+            if block is None or block[0] == block[1]:
+                block = self._blocks[model] = list(reserve_ids(model, settings.SHARD_ID_BLOCK_SIZE))
+            block[0] += 1
+            return block[0] - 1
+
+    def reset(self):
+        self._blocks = {}
+        self._lock = threading.Lock()
+
+
+def reserve_ids(model, count):
+    """Reserve ``count`` consecutive ids of a sharded model, return the first and the one after the last"""
+    name = model._meta.label
+    for attempt in range(2):
+        try:
+            with transaction.atomic(using=DEFAULT_DB_ALIAS):
+                sequence = IdSequence.objects.using(DEFAULT_DB_ALIAS).select_for_update().filter(name=name).first()
+                if sequence is None:
+                    # Start above every id in use, the table was not sharded before
+                    last_id = max(
+                        model._base_manager.using(alias).aggregate(last_id=Max("pk"))["last_id"] or 0
+                        for alias in shard_aliases()
+                    )
+                    sequence = IdSequence.objects.using(DEFAULT_DB_ALIAS).create(name=name, next_id=last_id + 1)
+                first = sequence.next_id
+                sequence.next_id = first + count
+                sequence.save(update_fields=["next_id"])
+                return first, first + count
+        except IntegrityError:
+            # Another process created the sequence first
+            if attempt:
+                raise
+
+
+id_blocks = IdBlocks()
+# A forked worker must not hand out the ids its parent reserved
+os.register_at_fork(after_in_child=id_blocks.reset)
+
+
+def assign_ids(instances):
+    """Give unsaved tasks or subtasks their global ids, for bulk_create"""
+    for instance in instances:
+        if instance.pk is None and sharding_enabled():
+            instance.pk = id_blocks.next_id(type(instance))
+
+
+@receiver(pre_save, sender=Task)
+@receiver(pre_save, sender=SubTask)
+def assign_global_id(sender, instance, raw, **kwargs):
+    if not raw:
+        assign_ids([instance])
+
+
+def bulk_create_tasks(tasks, tag_ids, collaborator_ids, batch_size=None):
+    """
+    Task.bulk_create_with_relations for tasks of owners on different shards,
+    one transaction per shard.
+    """
+    assign_ids(tasks)
+    by_shard = defaultdict(list)
+    for index, task in enumerate(tasks):
+        by_shard[shard_of(task)].append(index)
+    for alias, indexes in by_shard.items():
+        with shard_scope(alias):
+            Task.bulk_create_with_relations(
+                [tasks[index] for index in indexes],
+                [tag_ids[index] for index in indexes],
+                [collaborator_ids[index] for index in indexes],
+                batch_size=batch_size,
+            )
+    return tasks
+
+
+def reload(queryset, instances):
+    """Load saved tasks again from the shards holding them, keyed by pk"""
+    by_shard = defaultdict(list)
+    for instance in instances:
+        by_shard[instance._state.db or DEFAULT_DB_ALIAS].append(instance.pk)
+    loaded = {}
+    for alias, pks in by_shard.items():
+        with shard_scope(alias):
+            loaded.update(using_shard(queryset, alias).in_bulk(pks))
+    return loaded
+
+
+# Reference copies
+
+def mirror(model, instances, aliases=None, update_fields=None):
+    """Copy rows of a reference model from the default database to the shards"""
+    fields = [
+        field for field in model._meta.concrete_fields
+        if not field.primary_key and (update_fields is None or field.name in update_fields)
+    ]
+    copies = [
+        model(**{field.attname: getattr(instance, field.attname) for field in model._meta.concrete_fields})
+        for instance in instances
+    ]
+    for alias in settings.DB_SHARD_ALIASES if aliases is None else aliases:
+        manager = model._base_manager.using(alias)
+        existing = set(manager.filter(pk__in=[copy.pk for copy in copies]).values_list("pk", flat=True))
+        if fields:
+            manager.bulk_update([copy for copy in copies if copy.pk in existing], [field.name for field in fields])
+        if update_fields is None:
+            manager.bulk_create([copy for copy in copies if copy.pk not in existing])
+
+
+def drop_reference(model, pk, alias):
+    """Delete the copy of a reference row from a shard, like the default database did"""
+    if model is User:
+        # Cascades to the user's tasks, with their signals
+        with shard_scope(alias):
+            User.objects.using(alias).filter(pk=pk).delete()
+        return
+    # Without signals, the default database already reported the deletion
+    if model is Tag:
+        Task.tags.through.objects.using(alias).filter(tag_id=pk)._raw_delete(alias)
+    else:
+        Task.objects.using(alias).filter(category_id=pk).update(category=None)
+    model._base_manager.using(alias).filter(pk=pk)._raw_delete(alias)
+
+
+def copy_references(alias):
+    """Bring the reference copies of a shard in line with the default database"""
+    for model in REFERENCE_MODELS:
+        kept = set(model._base_manager.using(DEFAULT_DB_ALIAS).values_list("pk", flat=True))
+        for pk in set(model._base_manager.using(alias).values_list("pk", flat=True)) - kept:
+            drop_reference(model, pk, alias)
+        rows = model._base_manager.using(DEFAULT_DB_ALIAS).order_by("pk").iterator(chunk_size=settings.SHARD_MOVE_BATCH_SIZE)
+        while batch := list(itertools.islice(rows, settings.SHARD_MOVE_BATCH_SIZE)):
+            mirror(model, batch, [alias])
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=TaskCategory)
+def mirror_reference_saved(sender, instance, created, raw, using, update_fields, **kwargs):
+    if raw or using != DEFAULT_DB_ALIAS or not sharding_enabled():
+        return
+    mirror(sender, [instance], update_fields=update_fields)
+    if sender is User and created:
+        aliases = shard_aliases()
+        set_user_shard(instance.pk, aliases[instance.pk % len(aliases)])
+
+
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=TaskCategory)
+def drop_reference_deleted(sender, instance, using, **kwargs):
+    if using != DEFAULT_DB_ALIAS or not sharding_enabled():
+        return
+    for alias in settings.DB_SHARD_ALIASES:
+        drop_reference(sender, instance.pk, alias)
+    if sender is User:
+        cache.delete(map_key(instance.pk))
+        CollaboratorIndex.objects.using(DEFAULT_DB_ALIAS).filter(user_id=instance.pk).delete()
+
+
+@receiver(post_migrate)
+def copy_references_migrated(sender, using, **kwargs):
+    if sender.name == "ApiDevt" and using in settings.DB_SHARD_ALIASES:
+        copy_references(using)
+
+
+# Collaborator index
+
+@receiver(m2m_changed, sender=Task.collaborators.through)
+def index_collaborators(sender, instance, action, reverse, pk_set, using, **kwargs):
+    if not sharding_enabled():
+        return
+    if action == "pre_clear":
+        # Remember who is being removed, post_clear does not tell
+        if reverse:
+            instance._cleared_index_pairs = [
+                (task_id, instance.pk) for task_id in instance.collaborated_tasks.values_list("id", flat=True)
+            ]
+        else:
+            instance._cleared_index_pairs = [
+                (instance.pk, user_id) for user_id in instance.collaborators.values_list("id", flat=True)
+            ]
+        return
+    if action == "post_add":
+        pairs = [(task_id, instance.pk) for task_id in pk_set] if reverse else [(instance.pk, user_id) for user_id in pk_set]
+        CollaboratorIndex.objects.using(DEFAULT_DB_ALIAS).bulk_create(
+            [CollaboratorIndex(task_id=task_id, user_id=user_id, shard=using) for task_id, user_id in pairs],
+            update_conflicts=True, update_fields=["shard"], unique_fields=["user_id", "task_id"],
+        )
+    elif action in ("post_remove", "post_clear"):
+        if action == "post_clear":
+            pairs = getattr(instance, "_cleared_index_pairs", [])
+        elif reverse:
+            pairs = [(task_id, instance.pk) for task_id in pk_set]
+        else:
+            pairs = [(instance.pk, user_id) for user_id in pk_set]
+        for task_id, user_id in pairs:
+            CollaboratorIndex.objects.using(DEFAULT_DB_ALIAS).filter(task_id=task_id, user_id=user_id).delete()
+
+
+@receiver(post_delete, sender=Task)
+def unindex_task(sender, instance, **kwargs):
+    if sharding_enabled():
+        CollaboratorIndex.objects.using(DEFAULT_DB_ALIAS).filter(task_id=instance.pk).delete()
+
+
+def rebuild_collaborator_index():
+    """Rebuild the collaborator index from the links on every shard, return the number of entries"""
+    with transaction.atomic(using=DEFAULT_DB_ALIAS):
+        CollaboratorIndex.objects.using(DEFAULT_DB_ALIAS).all().delete()
+        total = 0
+        for alias in shard_aliases():
+            links = Task.collaborators.through.objects.using(alias).values_list("task_id", "user_id").iterator()
+            while batch := list(itertools.islice(links, settings.SHARD_MOVE_BATCH_SIZE)):
+                CollaboratorIndex.objects.using(DEFAULT_DB_ALIAS).bulk_create(
+                    [CollaboratorIndex(task_id=task_id, user_id=user_id, shard=alias) for task_id, user_id in batch],
+                    ignore_conflicts=True,
+                )
+                total += len(batch)
+    return total
+
+
+# Moves
+
+def copy_tasks(task_ids, source, target):
+    """
+    Copy tasks with their subtasks and links from one shard to another,
+    replacing the copies already there.
+    """
+    tasks = list(Task._base_manager.using(source).filter(pk__in=task_ids))
+    subtasks = list(SubTask._base_manager.using(source).filter(parent_task_id__in=task_ids))
+    links = {
+        through: list(through.objects.using(source).filter(task_id__in=task_ids))
+        for through in (Task.tags.through, Task.collaborators.through)
+    }
+    with transaction.atomic(using=target):
+        delete_tasks(task_ids, target)
+        Task._base_manager.using(target).bulk_create(tasks)
+        SubTask._base_manager.using(target).bulk_create(subtasks)
+        for through, rows in links.items():
+            # Link ids are local to each shard
+            for row in rows:
+                row.pk = None
+            through.objects.using(target).bulk_create(rows)
+
+
+def delete_tasks(task_ids, alias):
+    """Delete tasks with their subtasks and links from a shard, without signals: they live on elsewhere"""
+    for through in (Task.tags.through, Task.collaborators.through):
+        through.objects.using(alias).filter(task_id__in=task_ids)._raw_delete(alias)
+    SubTask._base_manager.using(alias).filter(parent_task_id__in=task_ids)._raw_delete(alias)
+    Task._base_manager.using(alias).filter(pk__in=task_ids)._raw_delete(alias)
+
+
+def move_tasks(task_ids, source, target):
+    copy_tasks(task_ids, source, target)
+    CollaboratorIndex.objects.using(DEFAULT_DB_ALIAS).filter(task_id__in=task_ids).update(shard=target)
+    delete_tasks(task_ids, source)
+
+
+@receiver(post_save, sender=Task)
+def follow_assigned_user(sender, instance, raw, using, **kwargs):
+    """Move a task reassigned to a user of another shard there"""
+    if raw or not sharding_enabled():
+        return
+    target = home_shard(instance.assigned_user_id)
+    if target != using:
+        counters.incr("shards.tasks_moved")
+        move_tasks([instance.pk], using, target)
+        instance._state.db = target
+        # The rest of the request writes the task's links on its new shard
+        use_shard(target)
+
+
+def _batches(ids):
+    ids = iter(ids)
+    while batch := list(itertools.islice(ids, settings.SHARD_MOVE_BATCH_SIZE)):
+        yield batch
+
+
+def move_user(user_id, target, log=logger.info):
+    """
+    Move the tasks of a user to another shard while they keep being used.
+
+    Writes to them are refused from when every process saw the user marked
+    as moving until every process saw the new shard, the copy is then brought
+    up to date with the changes logged meanwhile. Returns the number of tasks moved.
+    """
+    entry = UserShard.objects.using(DEFAULT_DB_ALIAS).filter(user_id=user_id).first()
+    source = entry.alias if entry else DEFAULT_DB_ALIAS
+    if source == target:
+        return 0
+    settle = settings.SHARD_MAP_CACHE_SECONDS + settings.SHARD_MOVE_GRACE_SECONDS
+
+    # Writes in flight may still log changes older than this cursor
+    cursor = (
+        SyncChange.objects.using(DEFAULT_DB_ALIAS)
+        .filter(date_created__lt=Now() - datetime.timedelta(seconds=settings.SHARD_MOVE_GRACE_SECONDS))
+        .aggregate(last_id=Max("id"))["last_id"] or 0
+    )
+    task_ids = list(Task._base_manager.using(source).filter(assigned_user_id=user_id).order_by("pk").values_list("pk", flat=True))
+    for batch in _batches(task_ids):
+        copy_tasks(batch, source, target)
+    log(f"Copied {len(task_ids)} tasks of user {user_id} from {source} to {target}.")
+
+    set_user_shard(user_id, source, moving=True)
+    log(f"Waiting {settle}s for writes to the user's tasks to stop.")
+    time.sleep(settle)
+
+    changed = set(
+        SyncChange.objects.using(DEFAULT_DB_ALIAS)
+        .filter(id__gt=cursor, user_id=user_id, kind=SyncChange.TASK).values_list("object_id", flat=True)
+    )
+    subtask_ids = set(
+        SyncChange.objects.using(DEFAULT_DB_ALIAS)
+        .filter(id__gt=cursor, user_id=user_id, kind=SyncChange.SUBTASK).values_list("object_id", flat=True)
+    )
+    for alias in (source, target):
+        changed.update(
+            SubTask._base_manager.using(alias).filter(pk__in=subtask_ids).values_list("parent_task_id", flat=True)
+        )
+    owned = set(Task._base_manager.using(source).filter(pk__in=changed, assigned_user_id=user_id).values_list("pk", flat=True))
+    for batch in _batches(sorted(owned)):
+        copy_tasks(batch, source, target)
+    delete_tasks(sorted(changed - owned), target)
+    log(f"Copied {len(changed)} tasks changed during the copy again.")
+
+    task_ids = list(Task._base_manager.using(target).filter(assigned_user_id=user_id).values_list("pk", flat=True))
+    for batch in _batches(task_ids):
+        CollaboratorIndex.objects.using(DEFAULT_DB_ALIAS).filter(task_id__in=batch).update(shard=target)
+    set_user_shard(user_id, target)
+    log(f"Switched user {user_id} to {target}, waiting {settings.SHARD_MAP_CACHE_SECONDS}s before cleaning up.")
+    time.sleep(settings.SHARD_MAP_CACHE_SECONDS)
+
+    for batch in _batches(task_ids):
+        delete_tasks(batch, source)
+    counters.incr("shards.users_moved")
+    return len(task_ids)
+
+
+def plan_rebalance(max_moves):
+    """
+    Pick users to move from the fullest shard to the emptiest one, each move
+    narrowing the gap between them. Returns (user id, source, target, tasks) tuples.
+    """
+    loads = Counter(dict.fromkeys(shard_aliases(), 0))
+    users = {}
+    for alias in shard_aliases():
+        rows = (
+            Task._base_manager.using(alias).order_by()
+            .values_list("assigned_user_id").annotate(total=Count("pk"))
+        )
+        homes = dict(rows)
+        for user_id, (home, _) in user_shards(homes).items():
+            if home == alias:
+                users[user_id] = (alias, homes[user_id])
+                loads[alias] += homes[user_id]
+
+    moves = []
+    while len(moves) < max_moves:
+        fullest, emptiest = max(loads, key=loads.get), min(loads, key=loads.get)
+        half_gap = (loads[fullest] - loads[emptiest]) // 2
+        candidates = [
+            (total, user_id) for user_id, (alias, total) in users.items()
+            if alias == fullest and 0 < total <= half_gap
+        ]
+        if not candidates:
+            break
+        total, user_id = max(candidates)
+        moves.append((user_id, fullest, emptiest, total))
+        users[user_id] = (emptiest, total)
+        loads[fullest] -= total
+        loads[emptiest] += total
+    return moves
+
+
+# Requests
+
+class ShardMoving(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "These tasks are being moved to another database, try again shortly."
+    default_code = "shard_moving"
+
+    def __init__(self):
+        super().__init__()
+        # Sent as Retry-After
+        self.wait = settings.SHARD_MAP_CACHE_SECONDS
+
+
+def refuse_moving(user_ids):
+    """Raise ShardMoving if the tasks of any of these users are being moved"""
+    if any(moving for _, moving in user_shards(user_ids).values()):
+        counters.incr("shards.writes_refused")
+        raise ShardMoving()
+
+
+def requested_owner_ids(data, default):
+    """The assigned users named by the items of a task creation body, ``default`` where none is"""
+    owner_ids = set()
+    for item in data if isinstance(data, list) else [data]:
+        try:
+            owner_ids.add(int(item.get("assigned_user_id", default)))
+        except (AttributeError, TypeError, ValueError):
+            # Invalid, validation rejects the item
+            continue
+    return owner_ids
+
+
+class ShardedViewMixin:
+    """
+    Run the requests of a viewset on the shards holding their tasks.
+
+    ``shards`` lists the shards holding tasks the user may see. Requests about
+    one object, located by ``locate_shard()``, run on its shard, the others on
+    the user's own shard. Lists span every shard in ``shards`` through
+    ``on_shards()``. Writes to the tasks of a user who is moving are refused.
+    """
+    shards = (DEFAULT_DB_ALIAS,)
+
+    def locate_shard(self, request):
+        """Return the shard the request's object lives or will live on and the ids of its owners, or None"""
+        return None
+
+    def enter_shard(self, request):
+        if not sharding_enabled() or not request.user.is_authenticated:
+            return None
+        self.shards = visible_shards(request.user)
+        located = self.locate_shard(request)
+        if located is None:
+            return self.shards[0]
+        alias, owner_ids = located
+        if request.method not in SAFE_METHODS:
+            refuse_moving(owner_ids)
+        return alias
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        use_shard(self.enter_shard(request))
+
+    async def ainitial(self, request, *args, **kwargs):
+        await super().ainitial(request, *args, **kwargs)
+        use_shard(await sync_to_async(self.enter_shard)(request))
+
+    def dispatch(self, request, *args, **kwargs):
+        with shard_scope():
+            return super().dispatch(request, *args, **kwargs)
+
+    async def adispatch(self, request, *args, **kwargs):
+        with shard_scope():
+            return await super().adispatch(request, *args, **kwargs)
+
+    def on_shards(self, func):
+        return on_shards(self.shards, func)
+
+    def sharded_values(self, queryset, *fields):
+        """
+        Read ``values_list(*fields)`` rows of a queryset from every shard of
+        the request, merged in the queryset's order and without the copies a
+        move leaves on two shards. The first field must identify the row.
+        Shards follow each other when the order is not made of plain fields.
+        """
+        ordering = list(queryset.query.order_by)
+        if not all(isinstance(name, str) and name != "?" for name in ordering):
+            ordering = []
+        names = list(fields)
+        keys = []
+        for name in ordering:
+            lookup = name.lstrip("-")
+            if lookup not in names:
+                names.append(lookup)
+            keys.append((names.index(lookup), name.startswith("-")))
+
+        rows = list(itertools.chain.from_iterable(
+            self.on_shards(lambda alias: list(using_shard(queryset, alias).values_list(*names)))
+        ))
+        for index, descending in reversed(keys):
+            # Nulls first, as SQLite orders them
+            rows.sort(key=lambda row: (row[index] is not None, row[index]), reverse=descending)
+        unique = {}
+        for row in rows:
+            unique.setdefault(row[0], row[:len(fields)])
+        return list(unique.values())
+
+    def load_sharded(self, queryset, pks):
+        """Load the rows with these pks from the shards of the request, in the same order"""
+        loaded = {}
+        for rows in self.on_shards(lambda alias: using_shard(queryset, alias).in_bulk(pks)):
+            for pk, row in rows.items():
+                loaded.setdefault(pk, row)
+        return [loaded[pk] for pk in pks if pk in loaded]
+
+
+# Counts over every shard
+
+# Latest counts of this process per name, with their version
+_count_snapshots = {}
+
+
+def _sum_on_shards(count):
+    totals = Counter()
+    for alias in shard_aliases():
+        totals.update(dict(count(alias)))
+    return dict(totals)
+
+
+def _counts(name, version_key, count):
+    """
+    Sum ``count(alias)`` rows over the shards once per version of ``version_key``.
+
+    The version is checked on every call, cached representations tagged with
+    a version must not hold counts of an older one.
+    """
+    # The version before the data, like every versioned read
+    version = get_versions([version_key])[version_key]
+    snapshot = _count_snapshots.get(name)
+    if snapshot is None or snapshot[0] != version:
+        shared_key = f"{name}:{version}"
+        counts = cache.get(shared_key)
+        if counts is None:
+            counts = _sum_on_shards(count)
+            cache.set(shared_key, counts, settings.REFCACHE_TTL)
+        snapshot = _count_snapshots[name] = (version, counts)
+    return snapshot[1]
+
+
+def tag_task_counts():
+    """Live task count of every tag"""
+    return _counts("tag-task-counts", TAGS, lambda alias: (
+        Task.tags.through.objects.using(alias).filter(task__is_deleted=False)
+        .order_by().values_list("tag_id").annotate(total=Count("pk"))
+    ))
+
+
+def category_task_counts():
+    """Live task count of every category"""
+    return _counts("category-task-counts", CATEGORIES, lambda alias: (
+        Task._base_manager.using(alias).filter(is_deleted=False, category__isnull=False)
+        .order_by().values_list("category_id").annotate(total=Count("pk"))
+    ))
+
+
+def assigned_task_counts(user_ids):
+    """Live task count of each user, read from the user's shard"""
+    by_shard = defaultdict(list)
+    for user_id, (alias, _) in user_shards(user_ids).items():
+        by_shard[alias].append(user_id)
+    totals = {}
+    for alias, ids in by_shard.items():
+        totals.update(
+            using_shard(Task.objects.filter(is_deleted=False, assigned_user__in=ids), alias)
+            .order_by().values_list("assigned_user").annotate(total=Count("pk"))
+        )
+    return totals
@@ -0,0 +1,63 @@
+from collections import namedtuple
+
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import Signal, receiver
+
+# Sent with ``transitions``, a list of TaskTransition, whenever tasks are created,
+# updated or deleted. Bulk paths that bypass model signals send it explicitly.
+task_transitioned = Signal()
+
+# ``before`` and ``after`` hold the Task.TRACKED_FIELDS values around the write.
+# ``before`` is None for created tasks and ``after`` is None for deleted ones.
+TaskTransition = namedtuple("TaskTransition", ["task_id", "before", "after"])
+
+
+def send_task_transitions(sender, transitions):
+    """
+    Broadcast task transitions to the task_transitioned receivers.
+    """
+    if transitions:
+        task_transitioned.send(sender=sender, transitions=transitions)
+
+
+@receiver(pre_save, sender="ApiDevt.Task")
+def remember_unknown_task_state(sender, instance, raw, **kwargs):
+    """
+    Load the stored tracked values for tasks that were not fully loaded from the database.
+    """
+    if raw or instance._state.adding or getattr(instance, "_tracked_state", None) is not None:
+        return
+    instance._tracked_state = (
+        sender.objects.filter(pk=instance.pk).values(*sender.TRACKED_FIELDS).first()
+    )
+
+
+@receiver(post_save, sender="ApiDevt.Task")
+def broadcast_task_saved(sender, instance, created, update_fields, raw, **kwargs):
+    """
+    Turn single task saves into task transitions.
+    """
+    if raw:
+        return
+    before = None if created else getattr(instance, "_tracked_state", None)
+    if before is not None and update_fields is not None:
+        # Only the saved fields reached the database
+        saved = {sender._meta.get_field(name).attname for name in update_fields}
+        after = {
+            field: getattr(instance, field) if field in saved else value
+            for field, value in before.items()
+        }
+    else:
+        after = instance.tracked_state()
+    instance._tracked_state = after
+    send_task_transitions(sender, [TaskTransition(instance.pk, before, after)])
+
+
+@receiver(post_delete, sender="ApiDevt.Task")
+def broadcast_task_deleted(sender, instance, **kwargs):
+    """
+    Turn hard task deletions into task transitions.
+    """
+    before = getattr(instance, "_tracked_state", None) or instance.tracked_state()
+    if before is not None:
+        send_task_transitions(sender, [TaskTransition(instance.pk, before, None)])
@@ -0,0 +1,78 @@
+import functools
+from collections import namedtuple
+
+from rest_framework.exceptions import ValidationError
+
+# What a serializer field needs from the database besides its own column
+FieldPlan = namedtuple(
+    "FieldPlan",
+    ["only", "select_related", "prefetch_related", "annotations"],
+    defaults=((), (), (), {}),
+)
+
+
+@functools.lru_cache(maxsize=None)
+def readable_fields(serializer_class):
+    """
+    Return the names of the fields a serializer outputs, in output order.
+    """
+    return tuple(name for name, field in serializer_class().fields.items() if not field.write_only)
+
+
+def _split(value):
+    return {name.strip() for name in value.split(",") if name.strip()}
+
+
+def requested_fields(request, serializer_class):
+    """
+    Return the fields selected with ``?fields=`` and ``?exclude=``, or None for all of them.
+    """
+    fields = request.query_params.get("fields")
+    exclude = request.query_params.get("exclude")
+    if not fields and not exclude:
+        return None
+
+    available = readable_fields(serializer_class)
+    selected = _split(fields) if fields else set(available)
+    excluded = _split(exclude) if exclude else set()
+    unknown = (selected | excluded) - set(available)
+    if unknown:
+        raise ValidationError({"fields": [f"Unknown field(s): {', '.join(sorted(unknown))}."]})
+    return frozenset(selected - excluded)
+
+
+def plan_queryset(queryset, serializer_class, fields=None):
+    """
+    Load only what the selected fields of ``serializer_class`` read.
+
+    Fields planned by the serializer's ``get_sparse_plans()`` bring their joins,
+    prefetches and annotations, any other field is assumed to be a column of
+    the model. Everything else is deferred.
+    """
+    fields = readable_fields(serializer_class) if fields is None else fields
+    plans = serializer_class.get_sparse_plans()
+    columns = {field.name for field in queryset.model._meta.concrete_fields}
+
+    only = {queryset.model._meta.pk.name}
+    select_related = set()
+    prefetch_related = []
+    annotations = {}
+    for name in fields:
+        plan = plans.get(name)
+        if plan is None:
+            if name in columns:
+                only.add(name)
+            continue
+        only.update(plan.only)
+        select_related.update(plan.select_related)
+        prefetch_related.extend(plan.prefetch_related)
+        annotations.update(plan.annotations)
+
+    queryset = queryset.only(*only)
+    if select_related:
+        queryset = queryset.select_related(*select_related)
+    if prefetch_related:
+        queryset = queryset.prefetch_related(*prefetch_related)
+    if annotations:
+        queryset = queryset.annotate(**annotations)
+    return queryset
@@ -0,0 +1,168 @@
+import datetime
+from collections import defaultdict
+
+from django.db.models import Case, Count, F, Q, When
+from django.dispatch import receiver
+from django.utils import timezone
+
+from TodoApp.routers import shard_aliases
+
+from .models import Task, UserTaskStats
+from .sharding import user_shards, using_shard
+from .signals import task_transitioned
+
+OPEN_STATUSES = ("Not Started", "In Progress", "On Hold")
+COUNTER_FIELDS = ("open_count", "overdue_count", "due_this_week_count", "completed_count")
+
+
+def current_week_start():
+    """
+    Return the Monday of the current week.
+    """
+    today = timezone.now().date()
+    return today - datetime.timedelta(days=today.weekday())
+
+
+def _contribution(state, week_start):
+    """
+    Return what a task in the given tracked state adds to its assignee's counters.
+    """
+    if state is None or state["is_deleted"]:
+        return None, (0, 0, 0, 0)
+    is_open = state["status"] in OPEN_STATUSES
+    is_expired = state["is_expired"]
+    week_end = week_start + datetime.timedelta(days=6)
+    return state["assigned_user_id"], (
+        int(is_open),
+        int(is_open and is_expired),
+        int(is_open and not is_expired and week_start <= state["end_date"] <= week_end),
+        int(state["status"] == "Completed"),
+    )
+
+
+@receiver(task_transitioned)
+def apply_task_transitions(sender, transitions, **kwargs):
+    """
+    Apply the counter deltas of task transitions, one UPDATE per affected user.
+
+    Users without a stats row are skipped, their row is built from scratch on first read.
+    """
+    week_start = current_week_start()
+    deltas = defaultdict(lambda: [0, 0, 0, 0])
+    for transition in transitions:
+        old_user, old = _contribution(transition.before, week_start)
+        new_user, new = _contribution(transition.after, week_start)
+        if old_user == new_user and old == new:
+            continue
+        for index in range(len(COUNTER_FIELDS)):
+            if old_user is not None:
+                deltas[old_user][index] -= old[index]
+            if new_user is not None:
+                deltas[new_user][index] += new[index]
+
+    now = timezone.now()
+    for user_id, delta in deltas.items():
+        if not any(delta):
+            continue
+        open_delta, overdue_delta, due_delta, completed_delta = delta
+        UserTaskStats.objects.filter(user_id=user_id).update(
+            open_count=F("open_count") + open_delta,
+            overdue_count=F("overdue_count") + overdue_delta,
+            # A row still on a previous week is rebuilt on read instead
+            due_this_week_count=Case(
+                When(week_start=week_start, then=F("due_this_week_count") + due_delta),
+                default=F("due_this_week_count"),
+            ),
+            completed_count=F("completed_count") + completed_delta,
+            date_updated=now,
+        )
+
+
+def compute_user_stats(user_ids=None):
+    """
+    Count the stats of the given users (or everyone with tasks) from the task table.
+
+    Returns a mapping of user id to counter values in a single grouped query
+    per shard. Each user is counted on their own shard only, a user being
+    moved has copies of their tasks on another one.
+    """
+    counted = {}
+    for alias in shard_aliases():
+        rows = _count_user_stats(using_shard(Task.objects.all(), alias), user_ids)
+        homes = user_shards(rows)
+        counted.update((user_id, row) for user_id, row in rows.items() if homes[user_id][0] == alias)
+    return counted
+
+
+def _count_user_stats(queryset, user_ids):
+    week_start = current_week_start()
+    open_tasks = Q(status__in=OPEN_STATUSES)
+    queryset = queryset.filter(is_deleted=False)
+    if user_ids is not None:
+        queryset = queryset.filter(assigned_user_id__in=user_ids)
+    rows = (
+        queryset.order_by()
+        .values("assigned_user_id")
+        .annotate(
+            open_count=Count("id", filter=open_tasks),
+            overdue_count=Count("id", filter=open_tasks & Q(is_expired=True)),
+            due_this_week_count=Count(
+                "id",
+                filter=open_tasks & Q(
+                    is_expired=False,
+                    end_date__gte=week_start,
+                    end_date__lte=week_start + datetime.timedelta(days=6),
+                ),
+            ),
+            completed_count=Count("id", filter=Q(status="Completed")),
+        )
+    )
+    return {row.pop("assigned_user_id"): row for row in rows}
+
+
+def reconcile_user_stats(user_ids=None):
+    """
+    Rebuild the stats rows of the given users (or every user with a row or tasks).
+
+    Returns the number of rows that were created or corrected.
+    """
+    week_start = current_week_start()
+    counted = compute_user_stats(user_ids)
+    existing = UserTaskStats.objects.all()
+    if user_ids is not None:
+        existing = existing.filter(user_id__in=user_ids)
+    existing = {stats.user_id: stats for stats in existing}
+
+    zero = dict.fromkeys(COUNTER_FIELDS, 0)
+    targets = set(counted) | set(existing) | set(user_ids or ())
+    to_create, to_update = [], []
+    for user_id in targets:
+        values = counted.get(user_id, zero)
+        stats = existing.get(user_id)
+        if stats is None:
+            to_create.append(UserTaskStats(user_id=user_id, week_start=week_start, **values))
+        elif stats.week_start != week_start or any(
+            getattr(stats, field) != values[field] for field in COUNTER_FIELDS
+        ):
+            for field, value in values.items():
+                setattr(stats, field, value)
+            stats.week_start = week_start
+            stats.date_updated = timezone.now()
+            to_update.append(stats)
+
+    UserTaskStats.objects.bulk_create(to_create, ignore_conflicts=True)
+    UserTaskStats.objects.bulk_update(
+        to_update, [*COUNTER_FIELDS, "week_start", "date_updated"], batch_size=500
+    )
+    return len(to_create) + len(to_update)
+
+
+def get_user_stats(user):
+    """
+    Return the stats row of a user, building it on first use or when the week rolled over.
+    """
+    stats = UserTaskStats.objects.filter(user=user).first()
+    if stats is None or stats.week_start != current_week_start():
+        reconcile_user_stats([user.pk])
+        stats = UserTaskStats.objects.get(user=user)
+    return stats
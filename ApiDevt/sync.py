@@ -0,0 +1,330 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import BooleanField, ExpressionWrapper, Q
+from django.db.models.functions import Now
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from TodoApp.routers import shard_scope
+
+from .events import publish_changes
+from .models import SubTask, SyncChange, Tag, Task, TaskCategory
+from .serializer import SubTaskSerializer, SyncTaskSerializer, TagSerializer, TaskCategorySerializer
+from .sharding import using_shard, visible_shards
+from .signals import task_transitioned
+from .versioning import CATEGORIES, TAGS, TASKS, bump_versions, category_key, tag_key, task_key, user_key
+
+SYNC_BATCH_SIZE = 500
+
+
+def _collaborators_by_task(task_ids):
+    collaborators = defaultdict(set)
+    pairs = Task.collaborators.through.objects.filter(task_id__in=task_ids).values_list("task_id", "user_id")
+    for task_id, user_id in pairs:
+        collaborators[task_id].add(user_id)
+    return collaborators
+
+
+def record_changes(changes):
+    """
+    Save SyncChange rows and publish them as events once committed.
+    """
+    SyncChange.objects.bulk_create(changes, batch_size=SYNC_BATCH_SIZE)
+    publish_changes(changes)
+
+
+def log_task_changes(task_ids, lost_users=None):
+    """
+    Record that the given tasks changed for everyone who can currently see them.
+
+    ``lost_users`` maps task ids to users who may have lost sight of the task,
+    they get a tombstone unless they can still see it.
+    """
+    lost_users = lost_users or {}
+    task_ids = set(task_ids) | set(lost_users)
+    tasks = Task.objects.filter(pk__in=task_ids).values_list("id", "assigned_user_id", "is_deleted")
+    collaborators = _collaborators_by_task(task_ids)
+
+    audiences = {task_id: set() for task_id in task_ids}
+    for task_id, assigned_user_id, is_deleted in tasks:
+        if not is_deleted:
+            audiences[task_id] = {assigned_user_id} | collaborators[task_id]
+
+    changes = []
+    for task_id, audience in audiences.items():
+        for user_id in audience:
+            changes.append(SyncChange(kind=SyncChange.TASK, object_id=task_id, user_id=user_id))
+        for user_id in lost_users.get(task_id, set()) - audience:
+            changes.append(SyncChange(
+                kind=SyncChange.TASK, object_id=task_id, user_id=user_id, op=SyncChange.DELETE
+            ))
+    record_changes(changes)
+    bump_versions(
+        TASKS,
+        *(task_key(task_id) for task_id in task_ids),
+        *(user_key(change.user_id) for change in changes),
+    )
+
+
+def log_global_change(kind, object_id, op=SyncChange.UPSERT):
+    """
+    Record a change of an object every user can see.
+    """
+    record_changes([SyncChange(kind=kind, object_id=object_id, op=op)])
+    if kind == SyncChange.TAG:
+        bump_versions(TAGS, tag_key(object_id))
+    else:
+        bump_versions(CATEGORIES, category_key(object_id))
+
+
+def bump_tag_counts(task_ids):
+    """
+    Move the versions of the tags of these tasks forward, their task counts
+    change with the tasks.
+    """
+    tag_ids = Task.tags.through.objects.filter(task_id__in=task_ids).values_list("tag_id", flat=True)
+    bump_versions(*map(tag_key, set(tag_ids)))
+
+
+@receiver(task_transitioned)
+def log_task_transitions(sender, transitions, **kwargs):
+    lost_users = {}
+    collaborators = _collaborators_by_task([transition.task_id for transition in transitions])
+    for transition in transitions:
+        if transition.before is not None:
+            lost_users[transition.task_id] = (
+                {transition.before["assigned_user_id"]} | collaborators[transition.task_id]
+            )
+    log_task_changes([transition.task_id for transition in transitions], lost_users)
+
+    # Tag and category representations count the live tasks using them
+    if any(
+        transition.before is None or transition.after is None
+        or transition.before["is_deleted"] != transition.after["is_deleted"]
+        or transition.before["category_id"] != transition.after["category_id"]
+        for transition in transitions
+    ):
+        bump_versions(TAGS, CATEGORIES)
+    # Hard deleted tasks lost their tags already, see bump_deleted_task_tags()
+    bump_tag_counts([
+        transition.task_id for transition in transitions
+        if transition.after is not None and (
+            transition.before is None or transition.before["is_deleted"] != transition.after["is_deleted"]
+        )
+    ])
+
+
+@receiver(pre_delete, sender=Task)
+def log_task_collaborators_deleted(sender, instance, **kwargs):
+    """
+    Tombstone hard deleted tasks for their collaborators before the memberships are gone.
+    """
+    record_changes([
+        SyncChange(kind=SyncChange.TASK, object_id=instance.pk, user_id=user_id, op=SyncChange.DELETE)
+        for user_id in instance.collaborators.values_list("id", flat=True)
+    ])
+
+
+@receiver(pre_delete, sender=Task)
+def bump_deleted_task_tags(sender, instance, **kwargs):
+    bump_tag_counts([instance.pk])
+
+
+@receiver(m2m_changed, sender=Task.collaborators.through)
+def log_collaborator_changes(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == "pre_clear":
+        # Remember who is being removed, post_clear does not tell
+        if reverse:
+            instance._cleared_sync_pairs = [
+                (task_id, instance.pk) for task_id in instance.collaborated_tasks.values_list("id", flat=True)
+            ]
+        else:
+            instance._cleared_sync_pairs = [
+                (instance.pk, user_id) for user_id in instance.collaborators.values_list("id", flat=True)
+            ]
+        return
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+
+    if action == "post_clear":
+        pairs = getattr(instance, "_cleared_sync_pairs", [])
+    elif reverse:
+        pairs = [(task_id, instance.pk) for task_id in pk_set]
+    else:
+        pairs = [(instance.pk, user_id) for user_id in pk_set]
+
+    lost_users = defaultdict(set)
+    task_ids = set()
+    for task_id, user_id in pairs:
+        task_ids.add(task_id)
+        if action != "post_add":
+            lost_users[task_id].add(user_id)
+    if not reverse:
+        # The remaining collaborators see the membership change too
+        task_ids.add(instance.pk)
+    log_task_changes(task_ids, lost_users)
+
+
+@receiver(m2m_changed, sender=Task.tags.through)
+def log_tag_membership_changes(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == "pre_clear":
+        if reverse:
+            instance._cleared_sync_tasks = list(instance.tasks.values_list("id", flat=True))
+        else:
+            instance._cleared_tag_ids = list(instance.tags.values_list("id", flat=True))
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if reverse:
+        tag_ids = [instance.pk]
+    elif action == "post_clear":
+        tag_ids = getattr(instance, "_cleared_tag_ids", [])
+    else:
+        tag_ids = pk_set
+    bump_versions(TAGS, *map(tag_key, tag_ids))
+    if not reverse:
+        log_task_changes([instance.pk])
+    elif action == "post_clear":
+        log_task_changes(getattr(instance, "_cleared_sync_tasks", []))
+    else:
+        log_task_changes(pk_set)
+
+
+@receiver(pre_save, sender=SubTask)
+def remember_subtask_parent(sender, instance, raw, **kwargs):
+    if raw or instance._state.adding:
+        return
+    instance._previous_parent_task_id = (
+        sender.objects.filter(pk=instance.pk).values_list("parent_task_id", flat=True).first()
+    )
+
+
+def _log_subtask_change(subtask, op):
+    task_ids = {subtask.parent_task_id, getattr(subtask, "_previous_parent_task_id", None)} - {None}
+    tasks = Task.objects.filter(pk__in=task_ids).values_list("id", "assigned_user_id")
+    collaborators = _collaborators_by_task(task_ids)
+    changes = []
+    for task_id, assigned_user_id in tasks:
+        # Users of a previous parent lose sight of a moved subtask
+        task_op = op if task_id == subtask.parent_task_id else SyncChange.DELETE
+        for user_id in {assigned_user_id} | collaborators[task_id]:
+            changes.append(SyncChange(kind=SyncChange.SUBTASK, object_id=subtask.pk, user_id=user_id, op=task_op))
+    record_changes(changes)
+    bump_versions(
+        TASKS,
+        *(task_key(task_id) for task_id in task_ids),
+        *(user_key(change.user_id) for change in changes),
+    )
+
+
+@receiver(post_save, sender=SubTask)
+def log_subtask_saved(sender, instance, raw, **kwargs):
+    if not raw:
+        _log_subtask_change(instance, SyncChange.UPSERT)
+
+
+@receiver(post_delete, sender=SubTask)
+def log_subtask_deleted(sender, instance, **kwargs):
+    _log_subtask_change(instance, SyncChange.DELETE)
+
+
+@receiver(post_save, sender=Tag)
+def log_tag_saved(sender, instance, raw, **kwargs):
+    if not raw:
+        log_global_change(SyncChange.TAG, instance.pk)
+
+
+@receiver(post_delete, sender=Tag)
+def log_tag_deleted(sender, instance, **kwargs):
+    log_global_change(SyncChange.TAG, instance.pk, SyncChange.DELETE)
+
+
+@receiver(post_save, sender=TaskCategory)
+def log_category_saved(sender, instance, raw, **kwargs):
+    if not raw:
+        log_global_change(SyncChange.CATEGORY, instance.pk)
+
+
+@receiver(post_delete, sender=TaskCategory)
+def log_category_deleted(sender, instance, **kwargs):
+    log_global_change(SyncChange.CATEGORY, instance.pk, SyncChange.DELETE)
+
+
+def build_sync_page(user, since, limit):
+    """
+    Return the objects that changed for a user after the ``since`` cursor.
+
+    Changes are read in cursor order and collapsed per object. Objects are then
+    loaded in their current state, tasks and subtasks from every shard the user
+    can see, anything the user can no longer see (or that no longer exists)
+    becomes a tombstone.
+
+    Concurrent transactions commit out of id order, a change with a lower id
+    can still appear after a higher one was read. The cursor therefore stops
+    before the first change of the last SYNC_CURSOR_GRACE_SECONDS: every
+    change with a lower id was written before it and has committed by then.
+    Newer changes are sent anyway and sent again by the next sync. Changes
+    are stamped and compared by the database clock, so the clocks of the
+    application servers play no part.
+    """
+    changes = SyncChange.objects.filter(id__gt=since)
+    if not user.is_staff:
+        changes = changes.filter(Q(user_id=user.id) | Q(user_id__isnull=True))
+    settled_before = Now() - timedelta(seconds=settings.SYNC_CURSOR_GRACE_SECONDS)
+    rows = list(
+        changes.order_by("id")
+        .annotate(settled=ExpressionWrapper(Q(date_created__lt=settled_before), output_field=BooleanField()))
+        .values_list("id", "kind", "object_id", "settled")[:limit + 1]
+    )
+    rows, extra = rows[:limit], rows[limit:]
+
+    settled = next((i for i, row in enumerate(rows) if not row[3]), len(rows))
+    cursor = rows[settled - 1][0] if settled else since
+    # Beyond an unsettled change the next page starts at the cursor again
+    has_more = bool(extra) and settled == len(rows)
+
+    changed = defaultdict(set)
+    for _, kind, object_id, _ in rows:
+        changed[kind].add(object_id)
+
+    visible_tasks = Task.objects.visible_to(user)
+    task_shards = visible_shards(user)
+    sources = {
+        SyncChange.TASK: (
+            "tasks",
+            visible_tasks.filter(is_deleted=False).prefetch_related("tags", "collaborators")
+            .select_related("assigned_user", "category"),
+            SyncTaskSerializer,
+            task_shards,
+        ),
+        SyncChange.SUBTASK: (
+            "subtasks",
+            SubTask.objects.select_related("assigned_user") if user.is_staff
+            else SubTask.objects.filter(parent_task__in=visible_tasks.values("pk")).select_related("assigned_user"),
+            SubTaskSerializer,
+            task_shards,
+        ),
+        SyncChange.TAG: ("tags", Tag.objects.all(), TagSerializer, [DEFAULT_DB_ALIAS]),
+        SyncChange.CATEGORY: ("categories", TaskCategory.objects.all(), TaskCategorySerializer, [DEFAULT_DB_ALIAS]),
+    }
+
+    page = {
+        "cursor": cursor,
+        "has_more": has_more,
+        "deleted": {},
+    }
+    for kind, (name, queryset, serializer_class, aliases) in sources.items():
+        object_ids = changed[kind]
+        objects = {}
+        if object_ids:
+            for alias in aliases:
+                with shard_scope(alias):
+                    for obj in using_shard(queryset.filter(pk__in=object_ids), alias):
+                        # A user being moved has copies on two shards
+                        objects.setdefault(obj.pk, obj)
+        objects = [objects[pk] for pk in sorted(objects)]
+        page[name] = serializer_class(objects, many=True).data
+        page["deleted"][name] = sorted(object_ids - {obj.pk for obj in objects})
+    return page
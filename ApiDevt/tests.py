@@ -1,3 +1,1486 @@
-from django.test import TestCase
+import asyncio
+import csv
+import datetime
+import functools
+import io
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import types
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connections
+from django.db.models import Max
+from django.db.migrations.recorder import MigrationRecorder
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import include, path
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.routers import DefaultRouter
+from rest_framework.test import APIClient, APIRequestFactory
+
+from ApiDevt.fragments import local_fragments, render_fragments
+from ApiDevt.history import rollup_task_events
+from ApiDevt.models import (
+    CollaboratorIndex, SubTask, SyncChange, Tag, Task, TaskCategory, TaskEvent, UserPreference, UserShard,
+    UserTaskStats,
+)
+from ApiDevt.sharding import id_blocks, move_user, set_user_shard
+from ApiDevt.stats import COUNTER_FIELDS, compute_user_stats, current_week_start, get_user_stats, reconcile_user_stats
+from ApiDevt.transfer import EXPORT_FIELDS
+from ApiDevt.versioning import get_versions
+from ApiDevt import batch, health
+from ApiDevt.asyncviews import aauthenticate
+from ApiDevt.coalescing import coalesce_key, coalesced
+from ApiDevt.metrics import counters
+from ApiDevt.pagination import EstimatedCountPaginator, estimate_count
+from ApiDevt.refcache import preference_key, reference_cache
+from ApiDevt.replicas import ReplicaSet, pin_key
+from ApiDevt.serializer import TaskListSerializer
+from ApiDevt.views import TaskViewSet, UserViewSet, fragment_versions, list_fragment_keys
+from TodoApp.backends.pool import ConnectionPool, PoolTimeout
+from TodoApp.backends.sqlite3.base import (
+    DatabaseWrapper as PooledSQLiteWrapper, TunedDatabaseWrapper, retry_locked,
+)
+from TodoApp.prefork import parse_bind
+from TodoApp.renderers import MessagePackParser, msgpack_dumps
+from TodoApp.routers import ReplicaRouter, read_database, read_from, read_scope, require_fresh, shard_aliases
+
+
+def make_task(user, **fields):
+    return Task.objects.create(**{
+        "name": "task", "description": "description", "start_date": datetime.date(2025, 5, 1),
+        "start_time": datetime.time(9), "end_date": datetime.date(2025, 5, 2), "end_time": datetime.time(10),
+        "assigned_user": user, **fields,
+    })
+
+
+@functools.cache
+def migrate_shard_test_database(alias):
+    # The shard databases were created while sharding was off, without tables
+    with override_settings(DB_SHARD_ALIASES=settings.SHARD_TEST_ALIASES):
+        MigrationRecorder(connections[alias]).flush()
+        call_command("migrate", database=alias, verbosity=0)
+
+
+class CalendarTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("calendar", "calendar@example.com", "password")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.weekly = make_task(self.user, recurring="Weekly")
+        self.spanning = make_task(
+            self.user, start_date=datetime.date(2025, 4, 28), end_date=datetime.date(2025, 5, 3)
+        )
+        make_task(self.user, start_date=datetime.date(2025, 6, 1), end_date=datetime.date(2025, 6, 2))
+        self.window = {"from": "2025-05-01", "to": "2025-05-14"}
+        self.days = {
+            "2025-05-01": [[self.weekly.pk, 2], [self.spanning.pk, 3]],
+            "2025-05-08": [[self.weekly.pk, 2]],
+        }
+
+    def test_recurrences_are_expanded_and_clipped(self):
+        response = self.client.get("/api/v1/tasks/calendar", self.window)
+        self.assertEqual(response.status_code, 200)
+        calendar = response.json()
+        self.assertEqual(sorted(calendar["tasks"]), sorted([str(self.weekly.pk), str(self.spanning.pk)]))
+        self.assertEqual(calendar["days"], self.days)
+
+    @override_settings(CALENDAR_STREAM_THRESHOLD_DAYS=7)
+    def test_wide_windows_are_streamed(self):
+        response = self.client.get("/api/v1/tasks/calendar", self.window)
+        self.assertTrue(response.streaming)
+        self.assertEqual(json.loads(b"".join(response.streaming_content))["days"], self.days)
+
+    def test_window_is_bounded(self):
+        response = self.client.get("/api/v1/tasks/calendar", {"from": "2025-05-02", "to": "2025-05-01"})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get("/api/v1/tasks/calendar", {"from": "2020-01-01", "to": "2025-01-01"})
+        self.assertEqual(response.status_code, 400)
+
+
+class TaskFacetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("facets", "facets@example.com", "password")
+        other = User.objects.create_user("other", "other@example.com", "password")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.tag = Tag.objects.create(name="urgent")
+        work = TaskCategory.objects.create(name="Work")
+        make_task(self.user, category=work).tags.add(self.tag)
+        make_task(self.user, status="In Progress", priority="High")
+        # Visible through two collaborator rows, counted once
+        shared = make_task(other, category=work)
+        shared.collaborators.add(self.user, User.objects.create_user("third", "third@example.com", "password"))
+        shared.tags.add(self.tag)
+        make_task(other)
+
+    def facets(self, **params):
+        response = self.client.get("/api/v1/tasks/facets", params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_counts_visible_tasks_once(self):
+        facets = self.facets()
+        self.assertEqual(facets["total"], 3)
+        self.assertEqual(facets["status"]["Not Started"], 2)
+        self.assertEqual(facets["priority"], {"Low": 0, "Medium": 2, "High": 1, "Urgent": 0})
+        self.assertEqual([(category["name"], category["count"]) for category in facets["category"]], [("Work", 2), (None, 1)])
+        self.assertEqual([(tag["name"], tag["count"]) for tag in facets["tags"]], [("urgent", 2)])
+
+    def test_filters_apply(self):
+        facets = self.facets(status="In Progress")
+        self.assertEqual((facets["total"], facets["tags"]), (1, []))
+
+    def test_changes_refresh_the_counts(self):
+        self.assertEqual(self.facets()["total"], 3)
+        with self.captureOnCommitCallbacks(execute=True):
+            make_task(self.user)
+        self.assertEqual(self.facets()["total"], 4)
+
+
+class SyncCursorTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("sync", "sync@example.com", "password")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.first, self.second, self.late = (Tag.objects.create(name=name) for name in ("first", "second", "late"))
+        SyncChange.objects.all().delete()
+        self.old = timezone.now() - datetime.timedelta(minutes=1)
+
+    def sync(self, since):
+        response = self.client.get("/api/v1/sync", {"since": since})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_cursor_waits_for_changes_committed_out_of_order(self):
+        SyncChange.objects.create(id=1, kind=SyncChange.TAG, object_id=self.first.pk, date_created=self.old)
+        # Id 2 belongs to a transaction still open, id 3 commits first
+        SyncChange.objects.create(id=3, kind=SyncChange.TAG, object_id=self.second.pk)
+
+        page = self.sync(0)
+        self.assertEqual([tag["name"] for tag in page["tags"]], ["first", "second"])
+        self.assertEqual(page["cursor"], 1)
+        self.assertFalse(page["has_more"])
+
+        SyncChange.objects.create(id=2, kind=SyncChange.TAG, object_id=self.late.pk)
+        page = self.sync(page["cursor"])
+        self.assertEqual([tag["name"] for tag in page["tags"]], ["second", "late"])
+
+    def test_cursor_ignores_the_app_server_clock(self):
+        SyncChange.objects.create(id=1, kind=SyncChange.TAG, object_id=self.first.pk, date_created=self.old)
+        SyncChange.objects.create(id=3, kind=SyncChange.TAG, object_id=self.second.pk)
+        # A server whose clock runs ahead would take id 3 as settled
+        ahead = timezone.now() + datetime.timedelta(hours=1)
+        with mock.patch("django.utils.timezone.now", return_value=ahead):
+            page = self.sync(0)
+        self.assertEqual(page["cursor"], 1)
+
+        SyncChange.objects.create(id=2, kind=SyncChange.TAG, object_id=self.late.pk)
+        self.assertEqual([tag["name"] for tag in self.sync(page["cursor"])["tags"]], ["second", "late"])
+
+    def test_cursor_passes_settled_changes(self):
+        for pk, tag in enumerate((self.first, self.second, self.late), 1):
+            SyncChange.objects.create(id=pk, kind=SyncChange.TAG, object_id=tag.pk, date_created=self.old)
+
+        page = self.sync(0)
+        self.assertEqual(page["cursor"], 3)
+        self.assertEqual(self.sync(3)["tags"], [])
+
+
+class TaskTrendParamsTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user("staff", "staff@example.com", "password", is_staff=True))
+
+    def test_non_integer_ids_are_rejected(self):
+        for name in ("user", "category"):
+            response = self.client.get(
+                "/api/v1/task-trends/daily", {"from": "2025-01-01", "to": "2025-01-31", name: "abc"}
+            )
+            self.assertEqual(response.status_code, 400)
+            self.assertIn(name, response.json())
+
+    def test_completion_rate_of_tasks_created_before_the_window(self):
+        user = User.objects.create_user("trend", "trend@example.com", "password")
+        first_day, second_day = datetime.date(2025, 1, 1), datetime.date(2025, 1, 2)
+
+        def at(day):
+            return timezone.make_aware(datetime.datetime.combine(day, datetime.time(12)))
+
+        events = [(first_day, TaskEvent.CREATED, "", "Not Started"), (second_day, TaskEvent.CREATED, "", "Not Started")]
+        events += [(second_day, TaskEvent.STATUS, "Not Started", "Completed")] * 2
+        TaskEvent.objects.bulk_create([
+            TaskEvent(task_id=task_id, user_id=user.pk, kind=kind, old_value=old, new_value=new, timestamp=at(day))
+            for task_id, (day, kind, old, new) in enumerate(events, 1)
+        ])
+        rollup_task_events(first_day, second_day)
+
+        response = self.client.get("/api/v1/task-trends/daily", {"from": "2025-01-02", "to": "2025-01-02"})
+        totals = response.json()["totals"]
+        self.assertEqual((totals["created_count"], totals["completed_count"]), (1, 2))
+        self.assertEqual(totals["completion_rate"], 1.0)
+        response = self.client.get("/api/v1/task-trends/daily", {"from": "2025-01-01", "to": "2025-01-02"})
+        self.assertEqual(response.json()["totals"]["completion_rate"], 1.0)
+
+    def test_integer_ids_filter(self):
+        response = self.client.get(
+            "/api/v1/task-trends/daily", {"from": "2025-01-01", "to": "2025-01-31", "user": "1", "category": "2"}
+        )
+        self.assertEqual(response.status_code, 200)
+
+
+class FastJSONTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("json", "json@example.com", "password")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_dates_round_trip(self):
+        body = (
+            b'{"name": "caf\xc3\xa9\xe2\x80\xa8menu", "description": "description", "start_date": "2025-05-01",'
+            b' "start_time": "09:30", "end_date": "2025-05-02", "end_time": "10:00"}'
+        )
+        response = self.client.post("/api/v1/tasks", body, content_type="application/json")
+        self.assertEqual(response.status_code, 201)
+        task = Task.objects.get()
+        self.assertEqual(
+            (task.name, task.start_date, task.start_time),
+            ("café\u2028menu", datetime.date(2025, 5, 1), datetime.time(9, 30)),
+        )
+
+        response = self.client.get(f"/api/v1/tasks/{task.pk}")
+        self.assertIn(b"\\u2028", response.content)
+        data = json.loads(response.content)
+        self.assertEqual(
+            (data["name"], data["start_date"], data["end_date"]), ("café\u2028menu", "2025-05-01", "2025-05-02")
+        )
+        self.assertEqual(data["start_time"], "09:30:00")
+        self.assertTrue(data["date_created"].endswith("Z"))
+        self.assertEqual(datetime.datetime.fromisoformat(data["date_created"]), task.date_created)
+
+    def test_malformed_json_is_a_parse_error(self):
+        response = self.client.post("/api/v1/tasks", b'{"name": ', content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("JSON parse error", response.json()["detail"])
+        self.assertFalse(Task.objects.exists())
+
+
+class MessagePackTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("msgpack", "msgpack@example.com", "password")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get(self, path):
+        response = self.client.get(path, HTTP_ACCEPT="application/msgpack")
+        self.assertEqual(response["Content-Type"], "application/msgpack")
+        return MessagePackParser().parse(io.BytesIO(response.content))
+
+    def test_dates_round_trip(self):
+        body = msgpack_dumps({
+            "name": "packed", "description": "description", "start_date": datetime.date(1969, 12, 31),
+            "start_time": "09:30", "end_date": datetime.date(2025, 5, 2), "end_time": "10:00",
+        })
+        response = self.client.post(
+            "/api/v1/tasks", body, content_type="application/msgpack", HTTP_ACCEPT="application/msgpack"
+        )
+        self.assertEqual(response.status_code, 201)
+        task = Task.objects.get()
+        self.assertEqual((task.start_date, task.end_date), (datetime.date(1969, 12, 31), datetime.date(2025, 5, 2)))
+
+        data = self.get(f"/api/v1/tasks/{task.pk}")
+        self.assertEqual((data["start_date"], data["end_date"]), (task.start_date, task.end_date))
+        self.assertEqual(data["start_time"], "09:30:00")
+        self.assertEqual(data["date_created"], task.date_created)
+        row = self.get("/api/v1/tasks")["results"][0]
+        self.assertEqual((row["id"], row["start_date"]), (task.pk, task.start_date))
+
+    def test_json_stays_the_default(self):
+        response = self.client.get("/api/v1/tasks")
+        self.assertEqual(response["Content-Type"], "application/json")
+
+    def test_malformed_body_is_a_parse_error(self):
+        response = self.client.post("/api/v1/tasks", b"\xc1", content_type="application/msgpack")
+        self.assertEqual(response.status_code, 400)
+
+
+class ColumnarTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("columnar", "columnar@example.com", "password")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        category = TaskCategory.objects.create(name="Work")
+        urgent, later = Tag.objects.create(name="urgent"), Tag.objects.create(name="later")
+        make_task(self.user, name="first", category=category).tags.add(urgent, later)
+        make_task(self.user, name="second", status="Completed").tags.add(urgent)
+        make_task(self.user, name="third", category=category)
+
+    def decode(self, data):
+        rows = []
+        for values in zip(*data["columns"]):
+            row = {}
+            for name, value in zip(data["fields"], values):
+                dictionary = data["dictionaries"].get(name)
+                if dictionary is not None and value is not None:
+                    value = [dictionary[code] for code in value] if isinstance(value, list) else dictionary[value]
+                row[name] = value
+            rows.append(row)
+        return rows
+
+    def test_columns_decode_to_the_json_rows(self):
+        response = self.client.get("/api/v1/tasks?format=columnar&ordering=start_date,name")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/vnd.todo.columnar+json")
+        data = response.json()["results"]
+        self.assertEqual(data["dictionaries"]["assigned_to"], ["columnar"])
+        self.assertEqual(data["dictionaries"]["category_name"], ["Work"])
+        self.assertEqual(data["dictionaries"]["tags"], ["urgent", "later"])
+        self.assertEqual(data["columns"][data["fields"].index("tags")], [[0, 1], [0], []])
+        self.assertEqual(data["columns"][data["fields"].index("category_name")], [0, None, 0])
+
+        rows = self.client.get("/api/v1/tasks?ordering=start_date,name").json()["results"]
+        for columnar, row in zip(self.decode(data), rows, strict=True):
+            row["tags"] = [tag["name"] for tag in row["tags"]]
+            self.assertEqual(columnar, {**columnar, **row})
+
+    def test_accept_header_selects_columnar(self):
+        response = self.client.get("/api/v1/tasks", HTTP_ACCEPT="application/vnd.todo.columnar+json")
+        self.assertEqual(set(response.json()["results"]), {"fields", "dictionaries", "columns"})
+        self.assertIsInstance(self.client.get("/api/v1/tasks").json()["results"], list)
+
+
+@override_settings(TASK_EXPORT_CHUNK_SIZE=2)
+class TaskExportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("export", "export@example.com", "password")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        collaborator = User.objects.create_user("helper", "helper@example.com", "password")
+        category = TaskCategory.objects.create(name="Work")
+        first = make_task(self.user, name="first", category=category)
+        first.tags.add(Tag.objects.create(name="urgent"), Tag.objects.create(name="later"))
+        first.collaborators.add(collaborator)
+        make_task(self.user, name="second", status="Completed")
+        make_task(self.user, name="third, with a comma", priority="High")
+        make_task(collaborator, name="not visible")
+
+    def export(self, query=""):
+        response = self.client.get(f"/api/v1/tasks/export{query}")
+        self.assertEqual(response.status_code, 200)
+        return response, b"".join(response.streaming_content).decode()
+
+    def test_ndjson(self):
+        response, body = self.export()
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        self.assertEqual(response["Content-Disposition"], 'attachment; filename="tasks.ndjson"')
+        rows = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual([row["name"] for row in rows], ["first", "second", "third, with a comma"])
+        self.assertEqual(list(rows[0]), list(EXPORT_FIELDS))
+        self.assertEqual(
+            (rows[0]["assigned_user"], rows[0]["category"], rows[0]["tags"], rows[0]["collaborators"]),
+            ("export", "Work", ["urgent", "later"], ["helper"]),
+        )
+        self.assertEqual((rows[1]["category"], rows[1]["tags"]), (None, []))
+        self.assertEqual(rows[0]["start_date"], "2025-05-01")
+
+    def test_csv_with_filters(self):
+        response, body = self.export("?format=csv&ordering=-date_created")
+        self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+        rows = list(csv.DictReader(io.StringIO(body)))
+        self.assertEqual([row["name"] for row in rows], ["third, with a comma", "second", "first"])
+        self.assertEqual(
+            (rows[2]["tags"], rows[2]["collaborators"], rows[2]["is_expired"]), ("urgent|later", "helper", "false")
+        )
+        self.assertEqual((rows[0]["category"], rows[0]["reminder_time"]), ("", ""))
+
+        _, body = self.export("?format=csv&status=Completed")
+        self.assertEqual([row["name"] for row in csv.DictReader(io.StringIO(body))], ["second"])
+
+
+@override_settings(TASK_IMPORT_BATCH_SIZE=2)
+class TaskImportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("import", "import@example.com", "password")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        User.objects.create_user("helper", "helper@example.com", "password")
+        self.tag = Tag.objects.create(name="urgent")
+
+    def row(self, name, **fields):
+        return {
+            "name": name, "description": "description", "start_date": "2025-05-01", "start_time": "09:00",
+            "end_date": "2025-05-02", "end_time": "10:00", **fields,
+        }
+
+    def post(self, body, content_type):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post("/api/v1/tasks/import", body, content_type=content_type)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_ndjson_rows_are_imported_or_reported(self):
+        missing_end = self.row("missing end")
+        del missing_end["end_date"]
+        lines = [
+            json.dumps(self.row("first", tags=["urgent", "new"], category="Home", collaborators=["helper"])),
+            "",
+            "{not json",
+            json.dumps(missing_end),
+            json.dumps(self.row("stranger", assigned_user="nobody")),
+            json.dumps(self.row("for helper", assigned_user="helper", category="Home", id=999, is_expired=True)),
+            json.dumps(["not", "an", "object"]),
+        ]
+        report = self.post("\n".join(lines), "application/x-ndjson")
+
+        self.assertEqual((report["total"], report["created"], report["failed"]), (6, 2, 4))
+        self.assertEqual([error["row"] for error in report["errors"]], [2, 3, 4, 6])
+        self.assertIn("JSON parse error", report["errors"][0]["errors"]["non_field_errors"][0])
+        self.assertIn("end_date", report["errors"][1]["errors"])
+        self.assertEqual(report["errors"][2]["errors"], {"assigned_user": ["Unknown user: nobody."]})
+
+        first = Task.objects.get(name="first")
+        self.assertEqual(first.assigned_user, self.user)
+        self.assertEqual(sorted(first.tags.values_list("name", flat=True)), ["new", "urgent"])
+        self.assertEqual(list(first.collaborators.values_list("username", flat=True)), ["helper"])
+        self.assertEqual(Tag.objects.filter(name="urgent").get(), self.tag)
+        helper_task = Task.objects.get(name="for helper")
+        self.assertEqual((helper_task.assigned_user.username, helper_task.is_expired), ("helper", False))
+        self.assertNotEqual(helper_task.pk, 999)
+        self.assertEqual(first.category_id, helper_task.category_id)
+        self.assertEqual(TaskCategory.objects.get().name, "Home")
+        self.assertFalse(Task.objects.filter(name__in=["missing end", "stranger"]).exists())
+
+    def test_csv_export_columns(self):
+        rows = [
+            self.row("first", tags="urgent|later", collaborators="", category=""),
+            self.row("second", tags="", collaborators="helper|nobody", category="Work"),
+        ]
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+        report = self.post("\ufeff" + buffer.getvalue(), "text/csv")
+
+        self.assertEqual((report["total"], report["created"], report["failed"]), (2, 1, 1))
+        self.assertEqual(report["errors"], [{"row": 2, "errors": {"collaborators": ["Unknown user(s): nobody."]}}])
+        first = Task.objects.get(name="first")
+        self.assertEqual(first.category, None)
+        self.assertEqual(sorted(first.tags.values_list("name", flat=True)), ["later", "urgent"])
+        self.assertFalse(TaskCategory.objects.exists())
+
+
+class BatchTests(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("batch", "batch@example.com", "password")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.task = make_task(self.user)
+
+    def post(self, items):
+        response = self.client.post("/api/v1/batch", items, format="json")
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_writes_are_ordered_between_concurrent_reads(self):
+        # Reads of a run meet at the barrier, so the batch only finishes if they run concurrently
+        barrier = threading.Barrier(2, timeout=5)
+        events = []
+        run_sub_request = batch.run_sub_request
+
+        def run(sub_request):
+            index = int(sub_request.GET["i"])
+            events.append(("start", index))
+            if sub_request.method == "GET":
+                barrier.wait()
+            result = run_sub_request(sub_request)
+            events.append(("end", index))
+            return result
+
+        detail = f"/api/v1/tasks/{self.task.pk}"
+        new_task = {
+            "name": "created", "description": "description", "start_date": "2025-05-01", "start_time": "09:00",
+            "end_date": "2025-05-02", "end_time": "10:00",
+        }
+        items = [
+            {"method": "GET", "path": f"{detail}?i=0"},
+            {"method": "GET", "path": "/api/v1/tasks?i=1"},
+            {"method": "POST", "path": "/api/v1/tasks?i=2", "body": new_task},
+            {"method": "GET", "path": f"{detail}?i=3"},
+            {"method": "GET", "path": "/api/v1/tasks?i=4"},
+            {"method": "PATCH", "path": f"{detail}?i=5", "body": {"name": "renamed"}},
+            {"method": "GET", "path": f"{detail}?i=6"},
+            {"method": "GET", "path": "/api/v1/tasks?i=7"},
+        ]
+        with mock.patch("ApiDevt.batch.run_sub_request", run):
+            results = self.post(items)
+
+        self.assertEqual([result["status"] for result in results], [200, 200, 201, 200, 200, 200, 200, 200])
+        self.assertEqual([results[i]["body"]["count"] for i in (1, 4, 7)], [1, 2, 2])
+        self.assertEqual([results[i]["body"]["name"] for i in (0, 3, 6)], ["task", "task", "renamed"])
+        self.assertIn("ETag", results[6]["headers"])
+        for write in (2, 5):
+            position = events.index(("start", write))
+            self.assertEqual({index for _, index in events[:position]}, set(range(write)))
+            self.assertEqual(events[position + 1], ("end", write))
+
+    def test_item_errors_stay_in_their_entry(self):
+        results = self.post([
+            {"method": "GET", "path": "/api/v1/nowhere"},
+            {"method": "POST", "path": "/api/v1/batch", "body": []},
+            {"method": "GET", "path": "/api/v1/tasks/999999"},
+        ])
+        self.assertEqual([result["status"] for result in results], [404, 400, 404])
+
+    @override_settings(BATCH_MAX_REQUESTS=2)
+    def test_invalid_batches_are_rejected(self):
+        item = {"method": "GET", "path": "/api/v1/tasks"}
+        self.assertEqual(self.client.post("/api/v1/batch", [item] * 3, format="json").status_code, 400)
+        self.assertEqual(self.client.post("/api/v1/batch", [], format="json").status_code, 400)
+        response = self.client.post("/api/v1/batch", [{"method": "GET", "path": "/admin/"}], format="json")
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(EVENTS_PUBSUB_URL=None, EVENTS_HEARTBEAT_SECONDS=0.05)
+class EventStreamTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("events", "events@example.com", "password")
+        other = User.objects.create_user("other", "other@example.com", "password")
+        self.tasks = [make_task(self.user, name=f"task {number}") for number in range(3)]
+        make_task(other)
+        self.changes = list(
+            SyncChange.objects.filter(user_id=self.user.pk, kind=SyncChange.TASK)
+            .order_by("id").values_list("id", flat=True)
+        )
+
+    async def open(self, **headers):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get("/api/v1/events", headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        stream = aiter(response.streaming_content)
+        self.assertEqual(await self.read(stream), b"retry: 3000\n\n")
+        return stream
+
+    async def read(self, stream):
+        return await asyncio.wait_for(anext(stream), 5)
+
+    async def read_events(self, stream):
+        """The events up to the next heartbeat"""
+        chunks = []
+        while (chunk := await self.read(stream)) != b": heartbeat\n\n":
+            chunks.append(chunk)
+        return chunks
+
+    def event(self, change_id, task):
+        return b'id: %d\nevent: task\ndata: {"id":%d,"op":"upsert"}\n\n' % (change_id, task.pk)
+
+    async def test_last_event_id_replays_the_missed_changes(self):
+        stream = await self.open(last_event_id=str(self.changes[0]))
+        self.assertEqual(
+            await self.read_events(stream),
+            [self.event(change_id, task) for change_id, task in zip(self.changes[1:], self.tasks[1:])],
+        )
+        await stream.aclose()
+
+    @override_settings(EVENTS_MAX_REPLAY=1)
+    async def test_too_many_missed_changes_ask_for_a_resync(self):
+        stream = await self.open(last_event_id="0")
+        latest = await SyncChange.objects.aaggregate(last=Max("id"))
+        self.assertEqual(
+            await self.read_events(stream), [b'id: %d\nevent: resync\ndata: {"since":0}\n\n' % latest["last"]]
+        )
+        await stream.aclose()
+
+    async def test_committed_changes_are_streamed(self):
+        stream = await self.open()
+        self.assertEqual(await self.read_events(stream), [])
+        task = await sync_to_async(self.commit_task)()
+        change_id = await (
+            SyncChange.objects.filter(object_id=task.pk, kind=SyncChange.TASK).values_list("id", flat=True).aget()
+        )
+        self.assertEqual(await self.read_events(stream), [self.event(change_id, task)])
+        await stream.aclose()
+
+    def commit_task(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return make_task(self.user, name="live")
+
+    def test_invalid_requests(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get("/api/v1/events").status_code, 501)
+        self.assertEqual(self.client.get("/api/v1/events", HTTP_LAST_EVENT_ID="x").status_code, 400)
+        self.assertEqual(self.client.get("/api/v1/events?last_event_id=-1").status_code, 400)
+
+
+class AsyncReadTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Viewsets pick their async path when their views are built
+        with override_settings(ASYNC_VIEWS=True):
+            router = DefaultRouter(trailing_slash=False)
+            router.register("tasks", TaskViewSet)
+            router.register("users", UserViewSet)
+            cls.urlconf = types.ModuleType("async_urls")
+            cls.urlconf.urlpatterns = [path("api/v1/", include(router.urls))]
+
+    def setUp(self):
+        self.user = User.objects.create_user("async", "async@example.com", "password")
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.category = TaskCategory.objects.create(name="Work")
+        self.task = make_task(self.user, category=self.category, end_date=timezone.localdate())
+        self.task.tags.add(Tag.objects.create(name="urgent"))
+        make_task(self.user, name="other")
+        make_task(User.objects.create_user("other", "other@example.com", "password"), name="not visible")
+
+    async def aget(self, path, headers=None):
+        """GET through the async views, checking they took the coroutine path"""
+        headers = {"Authorization": f"Token {self.token.key}"} if headers is None else headers
+        with self.settings(ROOT_URLCONF=self.urlconf), mock.patch(
+            "ApiDevt.asyncviews.aauthenticate", wraps=aauthenticate
+        ) as authenticate:
+            response = await self.async_client.get(path, headers=headers)
+        self.assertTrue(authenticate.called)
+        return response
+
+    async def test_reads_match_the_sync_views(self):
+        for path in (
+            "/api/v1/tasks?ordering=date_created",
+            f"/api/v1/tasks?category={self.category.pk}",
+            "/api/v1/tasks?fields=id,name&ordering=date_created",
+            f"/api/v1/tasks/{self.task.pk}",
+            "/api/v1/tasks/upcoming",
+            "/api/v1/users/me",
+        ):
+            with self.subTest(path=path):
+                expected = await sync_to_async(self.client.get)(path)
+                response = await self.aget(path)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.json(), expected.json())
+
+    async def test_errors(self):
+        self.assertEqual((await self.aget("/api/v1/tasks", headers={})).status_code, 401)
+        self.assertEqual((await self.aget("/api/v1/tasks", headers={"Authorization": "Token nope"})).status_code, 401)
+        self.assertEqual((await self.aget("/api/v1/tasks/999999")).status_code, 404)
+        self.assertEqual((await self.aget("/api/v1/tasks?category=999999")).status_code, 400)
+
+    async def test_session_authentication(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.aget("/api/v1/users/me", headers={})
+        self.assertEqual(response.json()["username"], "async")
+
+    async def test_writes_take_the_sync_view(self):
+        body = {
+            "name": "created", "description": "description", "start_date": "2025-05-01", "start_time": "09:00",
+            "end_date": "2025-05-02", "end_time": "10:00",
+        }
+        headers = {"Authorization": f"Token {self.token.key}"}
+        with self.settings(ROOT_URLCONF=self.urlconf), mock.patch("ApiDevt.asyncviews.aauthenticate") as authenticate:
+            response = await self.async_client.post(
+                "/api/v1/tasks", body, content_type="application/json", headers=headers
+            )
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(authenticate.called)
+
+
+class ReadinessTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(health, "_migrated", False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_ready(self):
+        response = APIClient().get("/api/v1/ready")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json(), {"ready": True, "checks": {"database": "ok", "migrations": "ok", "caches": "ok"}}
+        )
+        self.assertTrue(health._migrated)
+
+    def test_failed_checks_are_reported(self):
+        with (
+            mock.patch("ApiDevt.health.MigrationExecutor.migration_plan", return_value=[("migration", False)]),
+            mock.patch.dict(health.CHECKS, caches=mock.Mock(side_effect=ConnectionError("refused"))),
+        ):
+            response = APIClient().get("/api/v1/ready")
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json(), {
+            "ready": False,
+            "checks": {
+                "database": "ok",
+                "migrations": "failed: Unapplied migrations on default.",
+                "caches": "failed: refused",
+            },
+        })
+        self.assertFalse(health._migrated)
+
+
+class SQLiteTuningTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.name = os.path.join(directory.name, "tuned.sqlite3")
+
+    def connect(self, **options):
+        settings_dict = {**connections["default"].settings_dict, "NAME": self.name, "OPTIONS": options}
+        connection = TunedDatabaseWrapper(settings_dict, alias="tuned")
+        self.addCleanup(connection.close)
+        return connection
+
+    def locked(self):
+        exc = sqlite3.OperationalError("database is locked")
+        exc.sqlite_errorcode = sqlite3.SQLITE_BUSY
+        return exc
+
+    def test_pragmas_are_set_on_new_connections(self):
+        connection = self.connect(pragmas={"busy_timeout": 1234, "journal_mode": "WAL", "synchronous": "NORMAL"})
+        with connection.cursor() as cursor:
+            for pragma, value in (("busy_timeout", 1234), ("journal_mode", "wal"), ("synchronous", 1)):
+                self.assertEqual(cursor.execute(f"PRAGMA {pragma}").fetchone()[0], value)
+
+    def test_locked_statements_are_retried(self):
+        connection = self.connect(pragmas={"busy_timeout": 0}, lock_retries=3, lock_backoff=0.01)
+        with connection.cursor() as cursor:
+            cursor.execute("CREATE TABLE item (id integer)")
+        holder = sqlite3.connect(self.name, isolation_level=None)
+        self.addCleanup(holder.close)
+        holder.execute("BEGIN IMMEDIATE")
+        retried = counters.snapshot().get("db.lock_retried", 0)
+
+        # The lock is let go during the first backoff
+        release = mock.patch("TodoApp.backends.sqlite3.base.time.sleep", side_effect=lambda seconds: holder.commit())
+        with release as sleep, connection.cursor() as cursor:
+            cursor.execute("INSERT INTO item VALUES (1)")
+        self.assertEqual(sleep.call_count, 1)
+        self.assertEqual(counters.snapshot()["db.lock_retried"], retried + 1)
+        self.assertEqual(holder.execute("SELECT count(*) FROM item").fetchone()[0], 1)
+
+    def test_retries_give_up(self):
+        failed = counters.snapshot().get("db.lock_failed", 0)
+        func = mock.Mock(side_effect=self.locked())
+        with (
+            mock.patch("TodoApp.backends.sqlite3.base.time.sleep") as sleep,
+            self.assertRaises(sqlite3.OperationalError),
+        ):
+            retry_locked(func, 2, 0.05)
+        self.assertEqual(func.call_count, 3)
+        self.assertEqual(len(sleep.call_args_list), 2)
+        self.assertLessEqual(sleep.call_args_list[1].args[0], 0.1)
+        self.assertEqual(counters.snapshot()["db.lock_failed"], failed + 1)
+
+    def test_other_errors_are_not_retried(self):
+        func = mock.Mock(side_effect=sqlite3.OperationalError("no such table: item"))
+        with (
+            mock.patch("TodoApp.backends.sqlite3.base.time.sleep") as sleep,
+            self.assertRaises(sqlite3.OperationalError),
+        ):
+            retry_locked(func, 2, 0.05)
+        self.assertEqual(func.call_count, 1)
+        sleep.assert_not_called()
+
+
+class ConnectionPoolTests(SimpleTestCase):
+    def pool(self, size=1, **options):
+        pool = ConnectionPool("pooled", size, **options)
+        opened = []
+
+        def connect():
+            opened.append(mock.Mock(name=f"connection {len(opened)}"))
+            return opened[-1]
+        return pool, opened, connect
+
+    def test_connections_are_reused(self):
+        pool, opened, connect = self.pool(size=2)
+        first = pool.checkout(connect, mock.Mock())
+        second = pool.checkout(connect, mock.Mock())
+        pool.checkin(first)
+        self.assertEqual(pool.stats(), {"size": 2, "open": 2, "idle": 1})
+        self.assertIs(pool.checkout(connect, mock.Mock()), first)
+        self.assertEqual(opened, [first, second])
+
+    def test_checkout_times_out_when_full(self):
+        pool, opened, connect = self.pool(timeout=0.01)
+        pool.checkout(connect, mock.Mock())
+        timeouts = counters.snapshot().get("db.pool.timeouts", 0)
+        with self.assertRaisesMessage(PoolTimeout, "all 1 are in use"):
+            pool.checkout(connect, mock.Mock())
+        self.assertEqual(counters.snapshot()["db.pool.timeouts"], timeouts + 1)
+        self.assertEqual(len(opened), 1)
+
+    def test_waiters_get_the_next_connection_in_order(self):
+        pool, opened, connect = self.pool(timeout=5)
+        connection = pool.checkout(connect, mock.Mock())
+        received = []
+
+        def wait():
+            received.append(pool.checkout(connect, mock.Mock()))
+            pool.discard(received[-1])
+
+        threads = [threading.Thread(target=wait) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+            # Queued one after the other
+            while len(pool._waiters) < threads.index(thread) + 1:
+                time.sleep(0.001)
+        pool.checkin(connection)
+        for thread in threads:
+            thread.join()
+        # The first waiter got the connection, the second the slot it freed
+        self.assertEqual(received, opened)
+        self.assertIs(received[0], connection)
+        self.assertEqual(pool.stats(), {"size": 1, "open": 0, "idle": 0})
+
+    def test_discard_closes_and_frees_the_slot(self):
+        pool, opened, connect = self.pool()
+        connection = pool.checkout(connect, mock.Mock())
+        pool.discard(connection)
+        connection.close.assert_called_once_with()
+        self.assertIsNot(pool.checkout(connect, mock.Mock()), connection)
+        self.assertEqual(pool.stats()["open"], 1)
+
+    def test_stale_connections_are_replaced(self):
+        pool, opened, connect = self.pool(check_after=0)
+        connection = pool.checkout(connect, mock.Mock())
+        pool.checkin(connection)
+        self.assertIs(pool.checkout(connect, mock.Mock()), connection)
+        pool.checkin(connection)
+        replaced = pool.checkout(connect, mock.Mock(side_effect=OperationalError("gone")))
+        self.assertIsNot(replaced, connection)
+        connection.close.assert_called_once_with()
+
+        pool, opened, connect = self.pool(recycle=0)
+        connection = pool.checkout(connect, mock.Mock())
+        pool.checkin(connection)
+        self.assertIsNot(pool.checkout(connect, mock.Mock()), connection)
+        self.assertEqual(pool.stats()["open"], 1)
+
+    def test_failed_connect_frees_the_slot(self):
+        pool, opened, connect = self.pool()
+        with self.assertRaises(OperationalError):
+            pool.checkout(mock.Mock(side_effect=OperationalError("refused")), mock.Mock())
+        self.assertEqual(pool.stats()["open"], 0)
+        pool.checkout(connect, mock.Mock())
+
+    def test_database_wrapper_checks_connections_in_and_out(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_dict = {
+            **connections["default"].settings_dict, "NAME": os.path.join(directory.name, "pooled.sqlite3"),
+            "OPTIONS": {}, "POOL": {"SIZE": 1, "TIMEOUT": 0.01},
+        }
+        pools = mock.patch.dict("TodoApp.backends.pool._pools")
+        pools.start()
+        self.addCleanup(pools.stop)
+        connection = PooledSQLiteWrapper(settings_dict, alias="pooled")
+        connection.ensure_connection()
+        raw = connection.connection
+        connection.close()
+        self.assertEqual(connection.connection_pool.stats(), {"size": 1, "open": 1, "idle": 1})
+        connection.ensure_connection()
+        self.assertIs(connection.connection, raw)
+
+        # Closed while a transaction is open, the connection is not reused
+        connection.set_autocommit(False)
+        connection.close()
+        self.assertEqual(connection.connection_pool.stats(), {"size": 1, "open": 0, "idle": 0})
+        connection.ensure_connection()
+        self.assertIsNot(connection.connection, raw)
+        connection.close()
+
+
+class ServeCommandTests(SimpleTestCase):
+    def test_parse_bind(self):
+        self.assertEqual(parse_bind("0.0.0.0:8000"), ("0.0.0.0", 8000))
+        self.assertEqual(parse_bind("[::1]:8000"), ("::1", 8000))
+        for bind in ("8000", ":8000", "localhost:http"):
+            with self.subTest(bind=bind), self.assertRaises(ValueError):
+                parse_bind(bind)
+
+    def test_invalid_bind_is_a_command_error(self):
+        with self.assertRaisesMessage(CommandError, "Expected host:port, got 'localhost'."):
+            call_command("serve", bind="localhost")
+
+
+class TaskAdminTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_superuser("admin", "admin@example.com", "password")
+        self.client.force_login(self.user)
+        self.tasks = [make_task(self.user, status="Completed" if number % 2 else "Not Started") for number in range(5)]
+        self.other = make_task(User.objects.create_user("other", "other@example.com", "password"))
+
+    def changelist(self, query=""):
+        response = self.client.get(f"/admin/ApiDevt/task/{query}")
+        self.assertEqual(response.status_code, 200)
+        return response.context["cl"]
+
+    def test_small_counts_are_exact(self):
+        changelist = self.changelist()
+        self.assertIsInstance(changelist.paginator, EstimatedCountPaginator)
+        self.assertEqual(changelist.result_count, 6)
+        newest_first = sorted(Task.objects.values_list("pk", flat=True), reverse=True)
+        self.assertEqual([task.pk for task in changelist.result_list], newest_first)
+
+    @override_settings(ADMIN_EXACT_COUNT_LIMIT=2)
+    def test_large_counts_are_estimated(self):
+        # Without table statistics the span of the primary keys is the estimate
+        self.tasks[2].delete()
+        self.assertEqual(self.changelist().result_count, 6)
+        # A filtered count has no estimate, it stops after the limit
+        self.assertEqual(self.changelist("?status__exact=Not+Started").result_count, 3)
+        with connections["default"].cursor() as cursor:
+            cursor.execute("ANALYZE")
+        self.assertEqual(estimate_count(Task.objects.all()), 5)
+
+    def test_search_by_id_or_exact_username(self):
+        self.assertEqual([task.pk for task in self.changelist(f"?q={self.other.pk}").result_list], [self.other.pk])
+        self.assertEqual([task.pk for task in self.changelist("?q=other").result_list], [self.other.pk])
+        self.assertEqual(len(self.changelist("?q=admin").result_list), 5)
+        self.assertEqual(len(self.changelist("?q=oth").result_list), 0)
+
+
+class TaskListCreateTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("bulk", "bulk@example.com", "password")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.tag = Tag.objects.create(name="urgent")
+        self.category = TaskCategory.objects.create(name="Work")
+        make_task(self.user, category=self.category).tags.add(self.tag)
+
+    def item(self, name, **fields):
+        return {
+            "name": name, "description": "description", "start_date": "2025-05-01", "start_time": "09:00",
+            "end_date": "2025-05-02", "end_time": "10:00", "tag_ids": [self.tag.pk], "category_id": self.category.pk,
+            **fields,
+        }
+
+    def mixed(self):
+        invalid = self.item("no name")
+        del invalid["name"]
+        return [self.item("first"), invalid, self.item("no category", category_id=999999), self.item("last")]
+
+    def test_valid_list_is_created(self):
+        response = self.client.post("/api/v1/tasks", [self.item("first"), self.item("second")], format="json")
+        self.assertEqual(response.status_code, 201)
+        rows = response.json()
+        self.assertEqual([row["name"] for row in rows], ["first", "second"])
+        for row in rows:
+            self.assertEqual(row["subtasks"], [])
+            self.assertEqual([tag["tasks_count"] for tag in row["tags"]], [3])
+            self.assertEqual(row["category"]["tasks_count"], 3)
+            self.assertEqual(row["assigned_user"]["assigned_tasks_count"], 3)
+        self.assertEqual(Task.objects.count(), 3)
+
+    def test_partial_success_reports_item_errors(self):
+        response = self.client.post("/api/v1/tasks?atomic=false", self.mixed(), format="json")
+        self.assertEqual(response.status_code, 207)
+        rows = response.json()
+        self.assertEqual([row.get("name") for row in rows], ["first", None, None, "last"])
+        self.assertIn("name", rows[1]["errors"])
+        self.assertIn("category_id", rows[2]["errors"])
+        self.assertEqual(sorted(Task.objects.exclude(name="task").values_list("name", flat=True)), ["first", "last"])
+
+    def test_atomic_list_creates_nothing(self):
+        response = self.client.post("/api/v1/tasks", self.mixed(), format="json")
+        self.assertEqual(response.status_code, 400)
+        # Keyed by the index of each invalid item
+        errors = response.json()
+        self.assertEqual(sorted(errors), ["1", "2"])
+        self.assertIn("name", errors["1"])
+        self.assertIn("category_id", errors["2"])
+        self.assertEqual(Task.objects.count(), 1)
+
+
+class UserTaskStatsTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user("alice", "alice@example.com", "password")
+        self.bob = User.objects.create_user("bob", "bob@example.com", "password")
+        for user in (self.alice, self.bob):
+            get_user_stats(user)
+        self.task = make_task(self.alice, end_date=current_week_start() + datetime.timedelta(days=2))
+
+    def counters(self, user):
+        stats = UserTaskStats.objects.get(user=user)
+        return {field: getattr(stats, field) for field in COUNTER_FIELDS}
+
+    def assertReconciled(self, open_count):
+        counted = compute_user_stats([self.alice.pk, self.bob.pk])
+        for user in (self.alice, self.bob):
+            self.assertEqual(self.counters(user), counted.get(user.pk, dict.fromkeys(COUNTER_FIELDS, 0)))
+        self.assertEqual(reconcile_user_stats(), 0)
+        self.assertEqual(self.counters(self.alice)["open_count"], open_count)
+
+    def update(self, **fields):
+        for name, value in fields.items():
+            setattr(self.task, name, value)
+        self.task.save()
+
+    def test_transitions_keep_the_counters_reconciled(self):
+        self.assertReconciled(open_count=1)
+        self.assertEqual(self.counters(self.alice)["due_this_week_count"], 1)
+        self.update(status="Completed")
+        self.assertReconciled(open_count=0)
+        self.update(status="In Progress", is_expired=True)
+        self.assertReconciled(open_count=1)
+        self.assertEqual(self.counters(self.alice)["overdue_count"], 1)
+        self.update(is_deleted=True)
+        self.assertReconciled(open_count=0)
+        self.update(is_deleted=False)
+        self.assertReconciled(open_count=1)
+        self.update(assigned_user=self.bob)
+        self.assertReconciled(open_count=0)
+        self.assertEqual(self.counters(self.bob)["overdue_count"], 1)
+        self.task.delete()
+        self.assertReconciled(open_count=0)
+        self.assertEqual(self.counters(self.bob)["open_count"], 0)
+
+    def test_stats_of_a_past_week_are_rebuilt_on_read(self):
+        UserTaskStats.objects.filter(user=self.alice).update(
+            week_start=current_week_start() - datetime.timedelta(weeks=1), open_count=7, due_this_week_count=0,
+        )
+        client = APIClient()
+        client.force_authenticate(self.alice)
+        response = client.get("/api/v1/users/me/stats")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.json()["open_count"], response.json()["due_this_week_count"]), (1, 1))
+        self.assertEqual(UserTaskStats.objects.get(user=self.alice).week_start, current_week_start())
+
+
+class TaskETagTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("etag", "etag@example.com", "password")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.tag = Tag.objects.create(name="urgent")
+        self.category = TaskCategory.objects.create(name="Work")
+        self.task = make_task(self.user, category=self.category)
+        self.task.tags.add(self.tag)
+        self.urls = ["/api/v1/tasks", f"/api/v1/tasks/{self.task.pk}"]
+
+    def etags(self):
+        etags = []
+        for url in self.urls:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            etags.append(response["ETag"])
+        return etags
+
+    def test_matching_etag_is_not_modified(self):
+        for url, etag in zip(self.urls, self.etags()):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH='"stale"').status_code, 200)
+
+    def test_changes_move_the_etags_once_committed(self):
+        other = User.objects.create_user("other", "other@example.com", "password")
+
+        def rename(obj):
+            obj.name = f"{obj.name}!"
+            obj.save()
+
+        changes = {
+            "task": lambda: rename(self.task),
+            "tag": lambda: rename(self.tag),
+            "category": lambda: rename(self.category),
+            "collaborator": lambda: self.task.collaborators.add(other),
+        }
+        for name, change in changes.items():
+            with self.subTest(name):
+                before = self.etags()
+                with self.captureOnCommitCallbacks() as callbacks:
+                    change()
+                # Versions move after the commit, a reader never pairs a new ETag with old rows
+                self.assertEqual(self.etags()[0], before[0])
+                for callback in callbacks:
+                    callback()
+                after = self.etags()
+                self.assertNotEqual(after[0], before[0])
+                self.assertNotEqual(after[1], before[1])
+
+
+class TaskFragmentTests(TestCase):
+    def setUp(self):
+        local_fragments.clear()
+        self.user = User.objects.create_user("fragments", "fragments@example.com", "password")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.tag = Tag.objects.create(name="urgent")
+        self.category = TaskCategory.objects.create(name="Work")
+        self.task = make_task(self.user, category=self.category)
+        self.task.tags.add(self.tag)
+        self.other = make_task(self.user, name="other")
+
+    def test_only_missing_fragments_are_loaded(self):
+        loaded = []
+
+        def load(task_ids):
+            loaded.append(sorted(task_ids))
+            return list(Task.objects.filter(pk__in=task_ids))
+
+        versions = {self.task.pk: "1", self.other.pk: "1"}
+        first = render_fragments(TaskListSerializer, versions, load)
+        self.assertEqual(render_fragments(TaskListSerializer, versions, load), first)
+        render_fragments(TaskListSerializer, {**versions, self.other.pk: "2"}, load)
+        self.assertEqual(loaded, [sorted(versions), [self.other.pk]])
+        self.assertEqual([row["id"] for row in first], [self.task.pk, self.other.pk])
+
+    def test_fragments_follow_the_rows_they_show(self):
+        def row():
+            response = self.client.get("/api/v1/tasks")
+            self.assertEqual(response.status_code, 200)
+            return next(task for task in response.json()["results"] if task["id"] == self.task.pk)
+
+        def rename(obj, field, value):
+            with self.captureOnCommitCallbacks(execute=True):
+                setattr(obj, field, value)
+                obj.save()
+
+        self.assertEqual(row()["tags"][0]["name"], "urgent")
+        rename(self.tag, "name", "later")
+        self.assertEqual(row()["tags"][0]["name"], "later")
+        rename(self.category, "name", "Home")
+        self.assertEqual(row()["category_name"], "Home")
+        rename(self.user, "username", "renamed")
+        self.assertEqual(row()["assigned_to"], "renamed")
+        with self.captureOnCommitCallbacks(execute=True):
+            SubTask.objects.create(name="subtask", parent_task=self.task, assigned_user=self.user)
+        self.assertEqual(row()["subtasks_count"], 1)
+
+    def test_other_tasks_keep_their_fragment_version(self):
+        version = fragment_versions(list_fragment_keys([self.task.pk]))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.other.name = "renamed"
+            self.other.save()
+        self.assertEqual(fragment_versions(list_fragment_keys([self.task.pk])), version)
+
+
+class PreferenceCacheTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("pref", "pref@example.com", "password")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        reference_cache.invalidate(preference_key(self.user.pk))
+        # Compare versions on every read
+        patcher = mock.patch.object(reference_cache, "check_interval", 0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def me(self):
+        response = self.client.get("/api/v1/user-preferences/me")
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_task_changes_keep_the_snapshot(self):
+        self.assertEqual(self.me()["theme"], "System")
+        # Bypasses the signals, a rebuilt snapshot would show it
+        UserPreference.objects.filter(user=self.user).update(theme="Dark")
+        with self.captureOnCommitCallbacks(execute=True):
+            make_task(self.user)
+        self.assertEqual(self.me()["theme"], "System")
+
+    def test_rename_rebuilds_the_snapshot(self):
+        self.me()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.username = "renamed"
+            self.user.save()
+        self.assertEqual(self.me()["username"], "renamed")
+
+
+class CoalescedView:
+    action = "probe"
+
+    def __init__(self, release, error=None):
+        self.release = release
+        self.error = error
+        self.calls = 0
+
+    def get_list_versions(self):
+        return {}
+
+    @coalesced
+    def probe(self, request):
+        self.calls += 1
+        self.release.wait(5)
+        if self.error is not None:
+            raise self.error
+        return Response({"call": self.calls})
+
+
+@override_settings(ALLOWED_HOSTS=["*"])
+class CoalescingTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.release = threading.Event()
+
+    def request(self, host="testserver"):
+        request = Request(APIRequestFactory().get("/probe", SERVER_NAME=host))
+        request.accepted_renderer = JSONRenderer()
+        return request
+
+    def run_concurrently(self, view, count):
+        """Start a leader and ``count - 1`` followers, return their responses or errors"""
+        results = [None] * count
+
+        def run(index):
+            try:
+                results[index] = view.probe(self.request())
+            except Exception as exc:
+                results[index] = exc
+
+        waiting = counters.snapshot().get("coalesce.probe.coalesced_local", 0) + count - 1
+        threads = [threading.Thread(target=run, args=(index,)) for index in range(count)]
+        threads[0].start()
+        while view.calls == 0:
+            time.sleep(0.01)
+        for thread in threads[1:]:
+            thread.start()
+        while counters.snapshot().get("coalesce.probe.coalesced_local", 0) < waiting:
+            time.sleep(0.01)
+        self.release.set()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_followers_share_the_leaders_response(self):
+        view = CoalescedView(self.release)
+        results = self.run_concurrently(view, 3)
+        self.assertEqual(view.calls, 1)
+        self.assertEqual([response.data for response in results], [{"call": 1}] * 3)
+
+    def test_followers_get_the_leaders_exception(self):
+        view = CoalescedView(self.release, ValueError("broken"))
+        results = self.run_concurrently(view, 2)
+        self.assertEqual(view.calls, 1)
+        self.assertTrue(all(isinstance(result, ValueError) for result in results))
+
+    @override_settings(COALESCE_LOCK_SECONDS=0.1)
+    def test_follower_stops_waiting_for_a_hung_leader(self):
+        view = CoalescedView(self.release)
+        leader = threading.Thread(target=view.probe, args=(self.request(),))
+        leader.start()
+        while view.calls == 0:
+            time.sleep(0.01)
+        # Frees both handlers later, the follower must stop waiting before that
+        threading.Timer(0.5, self.release.set).start()
+        response = view.probe(self.request())
+        leader.join()
+        self.assertEqual(view.calls, 2)
+        self.assertEqual(response.data, {"call": 2})
+
+    def test_key_includes_the_host(self):
+        view = CoalescedView(self.release)
+        self.assertNotEqual(
+            coalesce_key(view, self.request("one.example.com")), coalesce_key(view, self.request("two.example.com"))
+        )
+
+
+@override_settings(REPLICA_CHECK_SECONDS=3600)
+class ReplicaTests(TransactionTestCase):
+    # shard1 stands in for a replica holding an older copy of the task
+    databases = {"default", "shard1"}
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        migrate_shard_test_database("shard1")
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("replica", "replica@example.com", "password")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.task = make_task(self.user, name="primary")
+        # The flush after each test leaves databases without migrations alone
+        self.addCleanup(User.objects.using("shard1").filter(pk=self.user.pk).delete)
+        User.objects.using("shard1").create(pk=self.user.pk, username="replica")
+        copy = Task.objects.get(pk=self.task.pk)
+        copy.name = "replica copy"
+        Task.objects.using("shard1").bulk_create([copy])
+
+        replica_set = ReplicaSet(["shard1"])
+        self.replica = replica_set.replicas["shard1"]
+        self.replica.caught_up_at = time.time() + 60
+        self.replica.checked_at = time.monotonic()
+        patcher = mock.patch("ApiDevt.replicas.replicas", replica_set)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def task_name(self):
+        response = self.client.get(f"/api/v1/tasks/{self.task.pk}")
+        self.assertEqual(response.status_code, 200)
+        return response.json()["name"]
+
+    def test_reads_go_to_a_fresh_replica(self):
+        self.assertEqual(self.task_name(), "replica copy")
+
+    def test_writers_read_their_writes(self):
+        response = self.client.patch(f"/api/v1/tasks/{self.task.pk}", {"progress": 50}, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(cache.get(pin_key(self.user.pk)))
+        pinned = counters.snapshot().get("replicas.pinned", 0)
+        self.assertEqual(self.task_name(), "primary")
+        self.assertEqual(counters.snapshot()["replicas.pinned"], pinned + 1)
+
+    def test_lagging_replicas_are_skipped(self):
+        self.replica.caught_up_at = time.time() - 3600
+        self.assertEqual(self.task_name(), "primary")
+
+    def test_newer_versions_send_the_request_to_the_primary(self):
+        router = ReplicaRouter()
+        switched = counters.snapshot().get("replicas.switched_to_primary", 0)
+        with read_scope():
+            read_from("shard1", time.time() + 60)
+            get_versions(["replica-test"])
+            self.assertEqual(router.db_for_read(Task), "shard1")
+            read_from("shard1", time.time() - 60)
+            self.assertEqual(router.db_for_read(Task), "shard1")
+            get_versions(["replica-test"])
+            self.assertIsNone(router.db_for_read(Task))
+            self.assertEqual(router.db_for_write(Task), "default")
+        self.assertEqual(counters.snapshot()["replicas.switched_to_primary"], switched + 1)
+
+    def test_read_scope_restores_the_primary(self):
+        with read_scope():
+            read_from("shard1", time.time())
+            self.assertEqual(read_database(), "shard1")
+            require_fresh(0)
+            self.assertEqual(read_database(), "shard1")
+        self.assertIsNone(read_database())
+
+
+@override_settings(
+    DB_SHARD_ALIASES=settings.SHARD_TEST_ALIASES, SHARD_MAP_CACHE_SECONDS=0, SHARD_MOVE_GRACE_SECONDS=0
+)
+class ShardingTests(TransactionTestCase):
+    # Writes commit: versions move forward and reads see them
+    databases = {"default", *settings.SHARD_TEST_ALIASES}
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        for alias in settings.SHARD_TEST_ALIASES:
+            migrate_shard_test_database(alias)
+
+    def setUp(self):
+        cache.clear()
+        id_blocks.reset()
+        self.alice = User.objects.create_user("alice", "alice@example.com", "password")
+        self.bob = User.objects.create_user("bob", "bob@example.com", "password")
+        set_user_shard(self.alice.pk, "shard1")
+        set_user_shard(self.bob.pk, "shard2")
+        self.tag = Tag.objects.create(name="urgent")
+        self.as_alice, self.as_bob = APIClient(), APIClient()
+        self.as_alice.force_authenticate(self.alice)
+        self.as_bob.force_authenticate(self.bob)
+
+    def create_task(self, client, **fields):
+        body = {
+            "name": "task", "description": "description", "start_date": "2025-05-01", "start_time": "09:00",
+            "end_date": "2025-05-02", "end_time": "10:00", "tag_ids": [self.tag.pk], **fields,
+        }
+        response = client.post("/api/v1/tasks", body, format="json")
+        self.assertEqual(response.status_code, 201)
+        return response.json()["id"]
+
+    def shards_of(self, task_id):
+        return [alias for alias in shard_aliases() if Task._base_manager.using(alias).filter(pk=task_id).exists()]
+
+    def test_ids_are_unique_across_shards(self):
+        self.assertEqual(shard_aliases(), ["default", "shard1", "shard2"])
+        carol = User.objects.create_user("carol", "carol@example.com", "password")
+        set_user_shard(carol.pk, "default")
+        as_carol = APIClient()
+        as_carol.force_authenticate(carol)
+
+        ids = {alias: [] for alias in shard_aliases()}
+        for _ in range(3):
+            for client, alias in ((self.as_alice, "shard1"), (self.as_bob, "shard2"), (as_carol, "default")):
+                ids[alias].append(self.create_task(client))
+        for alias, task_ids in ids.items():
+            self.assertEqual(
+                sorted(Task._base_manager.using(alias).values_list("pk", flat=True)), sorted(task_ids)
+            )
+        every_id = [task_id for task_ids in ids.values() for task_id in task_ids]
+        self.assertEqual(len(set(every_id)), 9)
+
+    def test_reassigned_task_follows_user(self):
+        task_id = self.create_task(self.as_alice, collaborator_ids=[self.alice.pk])
+        response = self.as_alice.post("/api/v1/subtasks", {"name": "subtask", "parent_task": task_id}, format="json")
+        self.assertEqual(response.status_code, 201)
+        subtask_id = response.json()["id"]
+        self.assertEqual(self.shards_of(task_id), ["shard1"])
+
+        response = self.as_alice.patch(f"/api/v1/tasks/{task_id}", {"assigned_user_id": self.bob.pk}, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.shards_of(task_id), ["shard2"])
+        self.assertTrue(SubTask._base_manager.using("shard2").filter(pk=subtask_id).exists())
+        self.assertEqual(list(Task.tags.through.objects.using("shard2").values_list("task_id", "tag_id")), [(task_id, self.tag.pk)])
+        self.assertEqual(CollaboratorIndex.objects.get(task_id=task_id, user_id=self.alice.pk).shard, "shard2")
+
+        response = self.as_bob.get(f"/api/v1/tasks/{task_id}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["assigned_user"]["username"], "bob")
+        # Alice still reaches it as a collaborator
+        self.assertEqual(self.as_alice.get(f"/api/v1/tasks/{task_id}").status_code, 200)
+
+    def test_collaborators_see_tasks_on_other_shards(self):
+        task_id = self.create_task(self.as_alice, name="shared", collaborator_ids=[self.bob.pk])
+        self.create_task(self.as_alice, name="private")
+        self.assertEqual(
+            list(CollaboratorIndex.objects.values_list("task_id", "user_id", "shard")), [(task_id, self.bob.pk, "shard1")]
+        )
+
+        response = self.as_bob.get("/api/v1/tasks")
+        self.assertEqual([task["name"] for task in response.json()["results"]], ["shared"])
+        self.assertEqual(self.as_bob.get(f"/api/v1/tasks/{task_id}").status_code, 200)
+
+        response = self.as_alice.patch(f"/api/v1/tasks/{task_id}", {"collaborator_ids": []}, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(CollaboratorIndex.objects.exists())
+        self.assertEqual(self.as_bob.get("/api/v1/tasks").json()["results"], [])
+        self.assertEqual(self.as_bob.get(f"/api/v1/tasks/{task_id}").status_code, 404)
+
+    def test_move_keeps_writes_made_during_it(self):
+        first, second = (self.create_task(self.as_alice, collaborator_ids=[self.bob.pk]) for _ in range(2))
+        statuses = []
+
+        def write(task_id, **fields):
+            statuses.append(self.as_alice.patch(f"/api/v1/tasks/{task_id}", fields, format="json").status_code)
+
+        def log(message):
+            if message.startswith("Copied 2 tasks"):
+                # Lands on the source after the first copy
+                write(second, name="renamed")
+
+        def sleep(seconds):
+            if UserShard.objects.get(user_id=self.alice.pk).moving:
+                write(first, progress=50)
+            else:
+                write(first, progress=80)
+
+        with mock.patch("ApiDevt.sharding.time.sleep", sleep):
+            self.assertEqual(move_user(self.alice.pk, "shard2", log=log), 2)
+
+        self.assertEqual(statuses, [200, 503, 200])
+        self.assertEqual(self.shards_of(first), ["shard2"])
+        self.assertEqual(self.shards_of(second), ["shard2"])
+        self.assertEqual(Task._base_manager.using("shard2").get(pk=second).name, "renamed")
+        self.assertEqual(Task._base_manager.using("shard2").get(pk=first).progress, 80)
+        self.assertEqual(set(CollaboratorIndex.objects.values_list("shard", flat=True)), {"shard2"})
+        shard = UserShard.objects.get(user_id=self.alice.pk)
+        self.assertEqual((shard.alias, shard.moving), ("shard2", False))
+        self.assertEqual(self.as_bob.get("/api/v1/tasks").json()["count"], 2)
@@ -0,0 +1,276 @@
+import csv
+import itertools
+
+from django.contrib.auth.models import User
+from django.db.models import Prefetch
+from rest_framework.exceptions import ParseError, ValidationError
+from rest_framework.settings import api_settings
+
+from TodoApp.renderers import json_dumps
+
+from .models import Tag, Task, TaskCategory
+from .serializer import TaskImportSerializer
+from .sharding import bulk_create_tasks
+
+# Columns of an exported task, in output order. Relations are exported by
+# name: the assigned user and collaborators by username, category and tags by name.
+EXPORT_FIELDS = (
+    "id", "name", "description", "status", "priority",
+    "start_date", "start_time", "end_date", "end_time", "recurring",
+    "progress", "is_expired", "reminder_time",
+    "assigned_user", "category", "tags", "collaborators",
+    "date_created", "date_updated",
+)
+
+# Joins the tag names and collaborator usernames of a CSV cell
+LIST_SEPARATOR = "|"
+
+_TASK_COLUMNS = (
+    "id", "name", "description", "status", "priority",
+    "start_date", "start_time", "end_date", "end_time", "recurring",
+    "progress", "is_expired", "reminder_time", "date_created", "date_updated",
+    "assigned_user__username", "category__name",
+)
+
+
+def export_queryset(queryset):
+    """
+    Load what an exported row needs, in a stable order.
+    """
+    if not queryset.ordered:
+        queryset = queryset.order_by("pk")
+    return (
+        queryset.select_related("assigned_user", "category")
+        .only(*_TASK_COLUMNS)
+        .prefetch_related(
+            Prefetch("tags", queryset=Tag.objects.only("id", "name").order_by("pk")),
+            Prefetch("collaborators", queryset=User.objects.only("id", "username").order_by("pk")),
+        )
+    )
+
+
+def export_row(task):
+    return {
+        "id": task.id,
+        "name": task.name,
+        "description": task.description,
+        "status": task.status,
+        "priority": task.priority,
+        "start_date": task.start_date,
+        "start_time": task.start_time,
+        "end_date": task.end_date,
+        "end_time": task.end_time,
+        "recurring": task.recurring,
+        "progress": task.progress,
+        "is_expired": task.is_expired,
+        "reminder_time": task.reminder_time,
+        "assigned_user": task.assigned_user.username,
+        "category": task.category.name if task.category_id else None,
+        "tags": [tag.name for tag in task.tags.all()],
+        "collaborators": [user.username for user in task.collaborators.all()],
+        "date_created": task.date_created,
+        "date_updated": task.date_updated,
+    }
+
+
+def _batches(querysets, chunk_size):
+    """
+    Yield lists of export rows of up to ``chunk_size`` tasks, from one
+    queryset per shard in turn.
+
+    ``iterator()`` reads through a server-side cursor where the database has
+    one and runs the tag and collaborator prefetches once per chunk, so only
+    one chunk of tasks is ever held in memory.
+    """
+    tasks = (
+        export_row(task)
+        for queryset in querysets
+        for task in export_queryset(queryset).iterator(chunk_size=chunk_size)
+    )
+    while batch := list(itertools.islice(tasks, chunk_size)):
+        yield batch
+
+
+def iter_ndjson(querysets, chunk_size):
+    """
+    Yield the tasks of the querysets as newline delimited JSON, one chunk per yield.
+    """
+    for batch in _batches(querysets, chunk_size):
+        yield b"".join(json_dumps(row) + b"\n" for row in batch)
+
+
+class _Lines:
+    """File-like object handing back what csv.writer writes to it"""
+    def write(self, value):
+        return value
+
+
+def _csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, list):
+        return LIST_SEPARATOR.join(value)
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return value
+
+
+def iter_csv(querysets, chunk_size):
+    """
+    Yield the tasks of the querysets as CSV with a header row, one chunk per yield.
+    """
+    writer = csv.writer(_Lines())
+    yield writer.writerow(EXPORT_FIELDS).encode()
+    for batch in _batches(querysets, chunk_size):
+        yield "".join(
+            writer.writerow([_csv_value(row[name]) for name in EXPORT_FIELDS]) for row in batch
+        ).encode()
+
+
+class TaskImport:
+    """
+    Validate and insert streamed task rows in batches.
+
+    Rows are validated as they are read, relation names are resolved once per
+    batch and each batch is inserted with bulk_create in its own transaction.
+    Missing tags and categories are created, unknown usernames fail the row.
+    Invalid rows are reported by their 1-based position and skipped, the
+    other rows are imported.
+    """
+    def __init__(self, user, batch_size, max_errors):
+        self.user = user
+        self.batch_size = batch_size
+        self.max_errors = max_errors
+        self.validator = TaskImportSerializer()
+        self.total = 0
+        self.created = 0
+        self.failed = 0
+        self.errors = []
+        # Resolved names, kept across batches
+        self.user_ids = {user.username: user.pk}
+        self.tag_ids = {}
+        self.category_ids = {}
+
+    def run(self, rows):
+        """
+        Import an iterable of row dicts and return the report.
+        """
+        pending = []
+        for number, row in enumerate(rows, 1):
+            self.total = number
+            data = self._validate(number, row)
+            if data is None:
+                continue
+            pending.append((number, data))
+            if len(pending) >= self.batch_size:
+                self._insert(pending)
+                pending = []
+        if pending:
+            self._insert(pending)
+        return {
+            "total": self.total,
+            "created": self.created,
+            "failed": self.failed,
+            "errors": sorted(self.errors, key=lambda error: error["row"]),
+        }
+
+    def _fail(self, number, errors):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({"row": number, "errors": errors})
+
+    def _validate(self, number, row):
+        if isinstance(row, ParseError):
+            self._fail(number, {api_settings.NON_FIELD_ERRORS_KEY: [row.detail]})
+            return None
+        if not isinstance(row, dict):
+            self._fail(number, {api_settings.NON_FIELD_ERRORS_KEY: ["Expected an object."]})
+            return None
+        try:
+            return self.validator.run_validation(_clean_row(row))
+        except ValidationError as exc:
+            self._fail(number, exc.detail)
+            return None
+
+    def _insert(self, pending):
+        self._resolve_users(pending)
+        rows = []
+        for number, data in pending:
+            errors = {}
+            if data.get("assigned_user", self.user.username) not in self.user_ids:
+                errors["assigned_user"] = [f"Unknown user: {data['assigned_user']}."]
+            unknown = [name for name in data.get("collaborators", ()) if name not in self.user_ids]
+            if unknown:
+                errors["collaborators"] = [f"Unknown user(s): {', '.join(unknown)}."]
+            if errors:
+                self._fail(number, errors)
+            else:
+                rows.append(data)
+        if not rows:
+            return
+        self._resolve_tags(rows)
+        self._resolve_categories(rows)
+
+        tasks = []
+        for data in rows:
+            data = dict(data)
+            assigned_user = data.pop("assigned_user", None)
+            category = data.pop("category", None)
+            data.pop("tags", None)
+            data.pop("collaborators", None)
+            tasks.append(Task(
+                **data,
+                assigned_user_id=self.user_ids[assigned_user] if assigned_user else self.user.pk,
+                category_id=self.category_ids[category] if category else None,
+            ))
+
+        bulk_create_tasks(
+            tasks,
+            [[self.tag_ids[name] for name in data.get("tags", ())] for data in rows],
+            [[self.user_ids[name] for name in data.get("collaborators", ())] for data in rows],
+            batch_size=self.batch_size,
+        )
+        self.created += len(tasks)
+
+    def _resolve_users(self, pending):
+        names = {
+            name for _, data in pending
+            for name in (data.get("assigned_user"), *data.get("collaborators", ()))
+            if name is not None
+        } - self.user_ids.keys()
+        if names:
+            self.user_ids.update(User.objects.filter(username__in=names).values_list("username", "id"))
+
+    def _resolve_tags(self, rows):
+        names = {name for data in rows for name in data.get("tags", ())} - self.tag_ids.keys()
+        if not names:
+            return
+        self.tag_ids.update(Tag.objects.filter(name__in=names).values_list("name", "id"))
+        for name in sorted(names - self.tag_ids.keys()):
+            # Created one by one so the tag signals run, there are few of them
+            self.tag_ids[name] = Tag.objects.get_or_create(name=name)[0].pk
+
+    def _resolve_categories(self, rows):
+        names = {data["category"] for data in rows if data.get("category")} - self.category_ids.keys()
+        if not names:
+            return
+        # Category names are not unique, the oldest category wins
+        for name, category_id in (
+            TaskCategory.objects.filter(name__in=names).order_by("-pk").values_list("name", "id")
+        ):
+            self.category_ids[name] = category_id
+        for name in sorted(names - self.category_ids.keys()):
+            self.category_ids[name] = TaskCategory.objects.create(name=name).pk
+
+
+def _clean_row(row):
+    """
+    Drop empty values and split the CSV cells holding tag or collaborator names.
+    """
+    row = {key: value for key, value in row.items() if value not in (None, "")}
+    for name in ("tags", "collaborators"):
+        if isinstance(row.get(name), str):
+            row[name] = [item for item in row[name].split(LIST_SEPARATOR) if item]
+    return row
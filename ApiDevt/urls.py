@@ -4,13 +4,19 @@ from .views import (
     IndexView,
     LoginView,
     LogoutView,
+    SyncView,
+    MetricsView,
+    ReadinessView,
+    BatchView,
+    EventsView,
     UserViewSet,
     TaskViewSet,
     TaskCategoryViewSet,
     OtpCodeViewSet,
     SubTaskViewSet,
     TagViewSet,
-    UserPreferenceViewSet
+    UserPreferenceViewSet,
+    TaskTrendViewSet
 )
 
 # Create a router and register our viewsets
@@ -23,11 +29,17 @@ router.register(r'otp-codes', OtpCodeViewSet)
 router.register(r'subtasks', SubTaskViewSet)
 router.register(r'tags', TagViewSet)
 router.register(r'user-preferences', UserPreferenceViewSet)
+router.register(r'task-trends', TaskTrendViewSet, basename='task-trends')
 
 # API URLs
 urlpatterns = [
     path('', IndexView.as_view(), name='index'),
     path('v1/auth/login/', LoginView.as_view(), name='login'),
     path('v1/auth/logout/', LogoutView.as_view(), name='logout'),
+    path('v1/sync', SyncView.as_view(), name='sync'),
+    path('v1/metrics', MetricsView.as_view(), name='metrics'),
+    path('v1/batch', BatchView.as_view(), name='batch'),
+    path('v1/ready', ReadinessView.as_view(), name='ready'),
+    path('v1/events', EventsView.as_view(), name='events'),
     path('v1/', include(router.urls)),
 ]
@@ -0,0 +1,144 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from TodoApp.routers import current_shard, require_fresh
+
+# Version keys for data shared by every task representation
+TASKS = "tasks"  # Any task, used for staff who see them all
+TAGS = "tags"
+CATEGORIES = "categories"
+USERS = "users"
+
+
+def task_key(task_id):
+    return f"task:{task_id}"
+
+
+def user_key(user_id):
+    return f"user:{user_id}"
+
+
+# Versions of single rows shown inside task representations. user_key follows
+# the tasks a user sees, account_key the user row itself.
+
+def account_key(user_id):
+    return f"account:{user_id}"
+
+
+def tag_key(tag_id):
+    return f"tag:{tag_id}"
+
+
+def category_key(category_id):
+    return f"category:{category_id}"
+
+
+def _cache():
+    return caches[settings.VERSION_CACHE_ALIAS]
+
+
+def get_versions(keys):
+    """
+    Return the current version of each key.
+
+    Versions are nanosecond timestamps that only move forward. Unknown or
+    evicted keys start at the current time so they never repeat an old value.
+    """
+    keys = list(keys)
+    versions, started = _fill_versions(keys, _cache().get_many([f"ver:{key}" for key in keys]))
+    if started:
+        _cache().set_many(started, timeout=None)
+    _require_fresh(versions)
+    return versions
+
+
+async def aget_versions(keys):
+    """get_versions through the cache's async API, for coroutine handlers"""
+    keys = list(keys)
+    versions, started = _fill_versions(keys, await _cache().aget_many([f"ver:{key}" for key in keys]))
+    if started:
+        await _cache().aset_many(started, timeout=None)
+    _require_fresh(versions)
+    return versions
+
+
+def _fill_versions(keys, cached):
+    """
+    Return the versions of ``keys`` from the ``cached`` entries, and the
+    entries to store for the keys that start now.
+    """
+    versions = {key: cached.get(f"ver:{key}") for key in keys}
+    now = time.time_ns()
+    started = {key: now for key, version in versions.items() if version is None}
+    versions.update(started)
+    return versions, {f"ver:{key}": version for key, version in started.items()}
+
+
+def _require_fresh(versions):
+    # Rows of these versions are read next, a lagging replica may not hold them yet
+    if versions:
+        require_fresh(version_time(versions))
+
+
+def version_time(versions):
+    """
+    Return the wall clock time of the newest of a set of versions, in seconds.
+    """
+    return max(versions.values()) / 1_000_000_000
+
+
+def _bump(keys):
+    current = _cache().get_many([f"ver:{key}" for key in keys])
+    now = time.time_ns()
+    _cache().set_many(
+        {f"ver:{key}": max(now, current.get(f"ver:{key}", 0) + 1) for key in keys},
+        timeout=None,
+    )
+
+
+def bump_versions(*keys):
+    """
+    Move the given version keys forward once the current transaction commits.
+
+    Bumping after the commit means a reader that saw the new version also sees
+    the new data, as long as it reads versions before querying. Changes to the
+    tasks of a shard wait for its transaction too.
+    """
+    keys = set(keys)
+    if not keys:
+        return
+    shard = current_shard()
+    if shard == DEFAULT_DB_ALIAS:
+        transaction.on_commit(lambda: _bump(keys))
+    else:
+        transaction.on_commit(lambda: transaction.on_commit(lambda: _bump(keys)), using=shard)
+
+
+def make_etag(*parts):
+    """
+    Build a strong ETag from the versions and request details a representation depends on.
+    """
+    digest = hashlib.sha1(repr(parts).encode()).hexdigest()
+    return f'"{digest}"'
+
+
+def last_modified(versions):
+    """
+    Return the last modification time in seconds represented by a set of versions.
+    """
+    return max(versions.values()) // 1_000_000_000
+
+
+@receiver(post_save, sender=User)
+def bump_user_version(sender, instance, raw, update_fields, **kwargs):
+    # Logins only touch last_login, which no task representation shows
+    if raw or (update_fields is not None and set(update_fields) <= {"last_login"}):
+        return
+    bump_versions(user_key(instance.pk), account_key(instance.pk), USERS)
@@ -1,22 +1,65 @@
 import datetime
+import hashlib
+import json
+import os
+from collections import defaultdict
+from collections.abc import Iterator
+from django.conf import settings
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.models import User
-from django.db.models import Q
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import Count, Q
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
 from drf_spectacular.utils import extend_schema, OpenApiParameter, OpenApiResponse, OpenApiExample
 from drf_spectacular.types import OpenApiTypes
 from rest_framework import status, viewsets, generics, filters
 from rest_framework.decorators import api_view, permission_classes, action
-from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser, SAFE_METHODS
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.authtoken.models import Token
 from django_filters.rest_framework import DjangoFilterBackend
 import random
 import string
+from asgiref.sync import sync_to_async
 
-from .models import Task, TaskCategory, OtpCode, SubTask, Tag, UserPreference
+from TodoApp.backends.pool import pool_stats
+from TodoApp.renderers import (
+    ColumnarJSONRenderer, CSVParser, CSVRenderer, EventStreamRenderer, FastJSONRenderer, NDJSONParser,
+    NDJSONRenderer, json_dumps, wants_native_temporals
+)
+
+from .asyncviews import AsyncReadMixin
+from .batch import run_batch
+from .coalescing import acoalesced, coalesced
+from .events import stream_events
+from .columnar import SUBTASK_COLUMNS, TASK_COLUMNS, task_rows, task_values, to_columnar, values_for
+from .fragments import arender_fragments, render_fragments, version_token
+from .health import run_checks
+from .history import summarize_rollups
+from .metrics import counters
+from .models import Task, TaskCategory, OtpCode, SubTask, Tag, UserPreference, TaskDailyRollup
+from .pagination import LargePagePagination
+from .recurrence import RRULE_FREQUENCIES, iter_calendar_days
+from .refcache import preference_key, reference_cache
+from .replicas import ReplicaReadMixin, replicas
+from .sharding import (
+    ShardedViewMixin, assigned_task_counts, home_shard, locate, requested_owner_ids, sharding_enabled, using_shard
+)
+from .sparse import plan_queryset, requested_fields
+from .stats import get_user_stats
+from .sync import build_sync_page
+from .transfer import TaskImport, iter_csv, iter_ndjson
+from .versioning import (
+    CATEGORIES, TAGS, TASKS, USERS, account_key, aget_versions, category_key, get_versions, last_modified,
+    make_etag, tag_key, task_key, user_key
+)
 from .serializer import (
     LoginSerializer, 
     UserSerializer, 
@@ -27,9 +70,270 @@ from .serializer import (
     TagSerializer,
     UserPreferenceSerializer,
     TaskListSerializer,
-    TaskDetailSerializer
+    TaskDetailSerializer,
+    UserTaskStatsSerializer,
+    BatchRequestSerializer
 )
 
+def parse_date_param(request, name):
+    """Parse a required ISO date query parameter"""
+    value = request.query_params.get(name)
+    if not value:
+        raise ValidationError({name: ["This query parameter is required."]})
+    try:
+        return datetime.date.fromisoformat(value)
+    except ValueError:
+        raise ValidationError({name: ["Date has wrong format. Use YYYY-MM-DD."]})
+
+
+def parse_id_param(request, name):
+    """Parse an optional ID query parameter, None when absent"""
+    value = request.query_params.get(name)
+    if not value:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise ValidationError({name: ["A valid integer is required."]})
+
+
+def load_list_tasks(task_ids, fields=None):
+    """Load tasks with what the selected TaskListSerializer fields read"""
+    return list(plan_queryset(Task.objects.filter(pk__in=task_ids), TaskListSerializer, fields))
+
+
+async def aload_list_tasks(task_ids, fields=None):
+    """load_list_tasks through the async ORM"""
+    return [task async for task in plan_queryset(Task.objects.filter(pk__in=task_ids), TaskListSerializer, fields)]
+
+
+def _list_fragment_references(task_ids, fields):
+    """
+    Querysets of the rows a list fragment shows besides its task, each with
+    the version key functions of the ids in its rows after the task id.
+    """
+    if fields is None or fields & {"assigned_to", "category_name"}:
+        yield (
+            Task.objects.filter(pk__in=task_ids).values_list("pk", "assigned_user_id", "category_id"),
+            (account_key, category_key),
+        )
+    if fields is None or "tags" in fields:
+        yield Task.tags.through.objects.filter(task_id__in=task_ids).values_list("task_id", "tag_id"), (tag_key,)
+
+
+def _add_references(keys, rows, key_functions):
+    for task_id, *ids in rows:
+        keys[task_id].update(key(row_id) for key, row_id in zip(key_functions, ids) if row_id is not None)
+
+
+def list_fragment_keys(task_ids, fields=None):
+    """
+    Map task ids to the version keys of their list fragments: the task and
+    the user, category and tag rows it shows. The tag counts they show move
+    the tag versions, so other writes leave the fragments cached.
+    """
+    keys = {task_id: {task_key(task_id)} for task_id in task_ids}
+    for queryset, key_functions in _list_fragment_references(task_ids, fields):
+        _add_references(keys, queryset, key_functions)
+    return keys
+
+
+async def alist_fragment_keys(task_ids, fields=None):
+    """list_fragment_keys through the async ORM"""
+    keys = {task_id: {task_key(task_id)} for task_id in task_ids}
+    for queryset, key_functions in _list_fragment_references(task_ids, fields):
+        _add_references(keys, [row async for row in queryset], key_functions)
+    return keys
+
+
+def fragment_versions(keys, fields=None, versions=None):
+    """Fold the versions of the keys of each task into the version of its fragment"""
+    if versions is None:
+        versions = get_versions(set().union(*keys.values()))
+    variant = sorted(fields) if fields else None
+    return {
+        task_id: version_token(sorted((key, versions[key]) for key in task_keys), variant)
+        for task_id, task_keys in keys.items()
+    }
+
+
+class SparseFieldsViewMixin:
+    """
+    Honour ``?fields=`` and ``?exclude=`` on the read-only ``sparse_actions``:
+    the serializer outputs only the selected fields and the queryset loads
+    only the columns, relations and counts they need.
+    """
+    sparse_actions = ()
+    
+    def get_sparse_fields(self):
+        if self.action not in self.sparse_actions or self.request.method not in SAFE_METHODS:
+            return None
+        return requested_fields(self.request, self.get_serializer_class())
+    
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context["sparse_fields"] = self.get_sparse_fields()
+        return context
+    
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in self.sparse_actions and self.request.method in SAFE_METHODS:
+            queryset = plan_queryset(queryset, self.get_serializer_class(), self.get_sparse_fields())
+        return queryset
+
+
+class ColumnarMixin:
+    """
+    Offer the columnar list format (``?format=columnar``) on ``columnar_actions``.
+    """
+    columnar_actions = ()
+    
+    def get_renderers(self):
+        renderers = super().get_renderers()
+        if self.action in self.columnar_actions:
+            # Last, so only requests asking for it by format or media type get it
+            renderers.append(ColumnarJSONRenderer())
+        return renderers
+    
+    def wants_columnar(self):
+        renderer = getattr(self.request, "accepted_renderer", None)
+        return getattr(renderer, "format", None) == ColumnarJSONRenderer.format
+    
+    def get_columnar_response(self, rows, columns, expand=None):
+        """Paginate a values_list queryset and return the page column by column"""
+        page = self.paginate_queryset(rows)
+        rows = list(rows) if page is None else page
+        if expand is not None:
+            rows = expand(rows)
+        data = to_columnar(columns, rows)
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
+
+
+class TaskFragmentMixin(ColumnarMixin):
+    """
+    Serve pages of tasks from cached TaskListSerializer fragments.
+    """
+    def get_task_page_response(self, queryset):
+        """Paginate a task queryset and assemble the page from cached fragments"""
+        if len(self.shards) > 1:
+            return self.get_sharded_task_page_response(queryset)
+        if self.wants_columnar():
+            return self.get_columnar_response(task_values(queryset), TASK_COLUMNS, task_rows)
+        
+        fields = requested_fields(self.request, TaskListSerializer)
+        task_ids = self.paginate_queryset(queryset.values_list("pk", flat=True))
+        paginated = task_ids is not None
+        if not paginated:
+            task_ids = list(queryset.values_list("pk", flat=True))
+        
+        data = render_fragments(
+            TaskListSerializer,
+            self.get_task_fragment_versions(task_ids, fields),
+            lambda task_ids: load_list_tasks(task_ids, fields),
+            context={**self.get_serializer_context(), "sparse_fields": fields},
+        )
+        
+        if paginated:
+            return self.get_paginated_response(data)
+        return Response(data)
+    
+    async def aget_task_page_response(self, queryset):
+        """get_task_page_response through the async ORM"""
+        if len(self.shards) > 1:
+            # Merging shards stays sync
+            return await sync_to_async(self.get_sharded_task_page_response)(queryset)
+        if self.wants_columnar():
+            # Rare enough to stay sync
+            return await sync_to_async(self.get_columnar_response)(task_values(queryset), TASK_COLUMNS, task_rows)
+        
+        fields = requested_fields(self.request, TaskListSerializer)
+        task_ids = await self.apaginate_queryset(queryset.values_list("pk", flat=True))
+        paginated = task_ids is not None
+        if not paginated:
+            task_ids = [task_id async for task_id in queryset.values_list("pk", flat=True)]
+        
+        data = await arender_fragments(
+            TaskListSerializer,
+            await self.aget_task_fragment_versions(task_ids, fields),
+            lambda task_ids: aload_list_tasks(task_ids, fields),
+            context={**self.get_serializer_context(), "sparse_fields": fields},
+        )
+        
+        if paginated:
+            return self.get_paginated_response(data)
+        return Response(data)
+    
+    def get_sharded_task_page_response(self, queryset):
+        """get_task_page_response for tasks spread over several shards"""
+        task_ids = [task_id for task_id, in self.sharded_values(queryset, "pk")]
+        page = self.paginate_queryset(task_ids)
+        if page is not None:
+            task_ids = page
+        
+        if self.wants_columnar():
+            def load_rows(alias):
+                return task_rows(list(task_values(using_shard(Task.objects.filter(pk__in=task_ids), alias))))
+            rows = {row[0]: row for shard_rows in self.on_shards(load_rows) for row in shard_rows}
+            data = to_columnar(TASK_COLUMNS, [rows[task_id] for task_id in task_ids if task_id in rows])
+        else:
+            fields = requested_fields(self.request, TaskListSerializer)
+            data = render_fragments(
+                TaskListSerializer,
+                self.get_task_fragment_versions(task_ids, fields),
+                lambda task_ids: self.load_sharded(
+                    plan_queryset(Task.objects.all(), TaskListSerializer, fields), task_ids
+                ),
+                context={**self.get_serializer_context(), "sparse_fields": fields},
+            )
+        
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
+    
+    def get_task_fragment_versions(self, task_ids, fields):
+        """Map task ids to the versions of their list fragments"""
+        if len(self.shards) == 1:
+            return fragment_versions(list_fragment_keys(task_ids, fields), fields)
+        keys = defaultdict(set)
+        for shard_keys in self.on_shards(lambda alias: list_fragment_keys(task_ids, fields)):
+            for task_id, task_keys in shard_keys.items():
+                keys[task_id] |= task_keys
+        return fragment_versions(keys, fields)
+    
+    async def aget_task_fragment_versions(self, task_ids, fields):
+        """get_task_fragment_versions through the async ORM and cache API, for a single shard"""
+        keys = await alist_fragment_keys(task_ids, fields)
+        return fragment_versions(keys, fields, await aget_versions(set().union(*keys.values())))
+
+
+class ReferenceListMixin:
+    """
+    Serve the unfiltered list of a small shared table from the reference data cache.
+    """
+    reference_version_key = None
+
+    def list(self, request, *args, **kwargs):
+        """List from the cached snapshot unless the request searches or orders"""
+        if request.query_params.get("search") or request.query_params.get("ordering"):
+            return super().list(request, *args, **kwargs)
+
+        # Renderers that encode dates themselves need a snapshot of their own
+        name = self.reference_version_key
+        if wants_native_temporals({"request": request}):
+            name = f"{name}:native"
+        data = reference_cache.get(
+            name,
+            [self.reference_version_key],
+            lambda: list(self.get_serializer(self.get_queryset(), many=True).data),
+        )
+        page = self.paginate_queryset(data)
+        if page is not None:
+            return self.get_paginated_response(page)
+        return Response(data)
+
+
 # Add this new serializer for logout
 from rest_framework import serializers
 class LogoutSerializer(serializers.Serializer):
@@ -164,11 +468,273 @@ class LogoutView(APIView):
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+@extend_schema(tags=['Sync'])
+class SyncView(APIView):
+    """
+    Delta sync for offline clients.
+    """
+    permission_classes = [IsAuthenticated]
+    
+    @extend_schema(
+        summary="Sync changes",
+        description=(
+            "Get the tasks, subtasks, tags and categories that changed after a cursor, plus "
+            "the ids of those that were deleted or are no longer visible. A deleted task "
+            "implies its subtasks are gone too. Pass the returned cursor as `since` on the "
+            "next call and keep paging while `has_more` is true. Omit `since` for a full sync. "
+            "Changes of the last few seconds are sent again by the next call."
+        ),
+        parameters=[
+            OpenApiParameter("since", OpenApiTypes.INT, description="Cursor returned by the previous sync"),
+            OpenApiParameter("limit", OpenApiTypes.INT, description="Maximum number of changes to read"),
+        ],
+        responses={
+            200: OpenApiResponse(
+                description="Changed objects and tombstones",
+                examples=[
+                    OpenApiExample(
+                        "Sync page",
+                        value={
+                            "cursor": 1042,
+                            "has_more": False,
+                            "tasks": [{"id": 12, "name": "Write report", "tag_ids": [3], "collaborator_ids": []}],
+                            "subtasks": [],
+                            "tags": [],
+                            "categories": [],
+                            "deleted": {"tasks": [9], "subtasks": [], "tags": [], "categories": []}
+                        }
+                    )
+                ]
+            ),
+            400: OpenApiResponse(description="Invalid cursor or limit")
+        }
+    )
+    def get(self, request):
+        """Get the changes visible to the current user after a cursor"""
+        try:
+            since = int(request.query_params.get("since", 0))
+            limit = int(request.query_params.get("limit", settings.SYNC_PAGE_SIZE))
+        except ValueError:
+            raise ValidationError({"since": ["Cursor and limit must be integers."]})
+        if since < 0 or limit < 1:
+            raise ValidationError({"since": ["Cursor and limit must be positive."]})
+        
+        limit = min(limit, settings.SYNC_MAX_PAGE_SIZE)
+        return Response(build_sync_page(request.user, since, limit))
+
+
+@extend_schema(tags=['Metrics'])
+class MetricsView(APIView):
+    """
+    Counters of the serving process.
+    """
+    permission_classes = [IsAdminUser]
+    
+    @extend_schema(
+        summary="Get metrics",
+        description=(
+            "Get the counters of the process that serves the request, such as how many "
+            "requests were computed or coalesced per action or how often a database "
+            "connection was checked out of the pool or waited for, the open and idle "
+            "connections of each database pool, and how far behind each read replica is "
+            "in seconds. Counters are per process."
+        ),
+        responses={
+            200: OpenApiResponse(
+                description="Process id, counters, connection pools and read replicas",
+                examples=[
+                    OpenApiExample(
+                        "Metrics",
+                        value={
+                            "pid": 4242,
+                            "counters": {
+                                "coalesce.upcoming.computed": 12, "coalesce.upcoming.coalesced_local": 30,
+                                "db.pool.checkouts": 310, "db.pool.waits": 4, "db.pool.opened": 5
+                            },
+                            "pools": {"default": {"size": 5, "open": 5, "idle": 4}},
+                            "replicas": {"replica1": {"lag": 0.412, "down": False}}
+                        }
+                    )
+                ]
+            )
+        }
+    )
+    def get(self, request):
+        """Get the counters, connection pools and read replicas of this process"""
+        return Response({
+            "pid": os.getpid(), "counters": counters.snapshot(), "pools": pool_stats(),
+            "replicas": replicas.stats(),
+        })
+
+
+@extend_schema(tags=['Health'])
+class ReadinessView(APIView):
+    """
+    Readiness probe for load balancers and orchestrators.
+    """
+    authentication_classes = []
+    permission_classes = [AllowAny]
+    
+    @extend_schema(
+        summary="Check readiness",
+        description=(
+            "Tell whether the serving process can handle requests: the database answers, "
+            "every migration is applied and the caches answer. Needs no authentication."
+        ),
+        responses={
+            200: OpenApiResponse(
+                description="Ready",
+                examples=[
+                    OpenApiExample(
+                        "Ready",
+                        value={"ready": True, "checks": {"database": "ok", "migrations": "ok", "caches": "ok"}}
+                    )
+                ]
+            ),
+            503: OpenApiResponse(description="Not ready, the failed checks say why")
+        }
+    )
+    def get(self, request):
+        """Check that this process can serve requests"""
+        ready, checks = run_checks()
+        return Response(
+            {"ready": ready, "checks": checks},
+            status=status.HTTP_200_OK if ready else status.HTTP_503_SERVICE_UNAVAILABLE,
+        )
+
+
+@extend_schema(tags=['Batch'])
+class BatchView(APIView):
+    """
+    Several API requests in one round trip.
+    """
+    permission_classes = [IsAuthenticated]
+    
+    @extend_schema(
+        summary="Run a batch of requests",
+        description=(
+            "Run up to 20 API requests, each given as a method, a path with its query string, "
+            "an optional JSON body and optional headers. They are authenticated as the batch "
+            "request and answered in order with their status, ETag, Last-Modified and Location "
+            "headers and body. Consecutive GET, HEAD and OPTIONS requests run concurrently, "
+            "any other request runs after the ones before it."
+        ),
+        request=BatchRequestSerializer(many=True),
+        responses={
+            200: OpenApiResponse(
+                description="One result per request, in order",
+                examples=[
+                    OpenApiExample(
+                        "Batch",
+                        request_only=True,
+                        value=[
+                            {"method": "GET", "path": "/api/v1/users/me"},
+                            {"method": "GET", "path": "/api/v1/tasks/upcoming?page=1"}
+                        ]
+                    ),
+                    OpenApiExample(
+                        "Batch results",
+                        response_only=True,
+                        value=[
+                            {"status": 200, "headers": {}, "body": {"id": 1, "username": "alice"}},
+                            {"status": 200, "headers": {}, "body": {"count": 0, "next": None, "previous": None, "results": []}}
+                        ]
+                    )
+                ]
+            ),
+            400: OpenApiResponse(description="Invalid or too many requests")
+        }
+    )
+    def post(self, request):
+        """Run the requests of a batch"""
+        serializer = BatchRequestSerializer(
+            data=request.data, many=True, allow_empty=False, max_length=settings.BATCH_MAX_REQUESTS
+        )
+        serializer.is_valid(raise_exception=True)
+        return Response(run_batch(request, serializer.validated_data))
+
+
+@extend_schema(tags=['Events'])
+class EventsView(APIView):
+    """
+    Server-sent change events.
+    """
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [EventStreamRenderer, FastJSONRenderer]
+    
+    @extend_schema(
+        summary="Stream change events",
+        description=(
+            "Open a `text/event-stream` of the task, subtask, tag and category changes visible "
+            "to the current user. Each event is named after the kind of object and carries its "
+            "id and whether it was upserted or deleted, load the object itself through the API "
+            "or the delta sync. Event ids are sync cursors: reconnecting with `Last-Event-ID` "
+            "resumes after the last event received. A `resync` event means too many changes "
+            "were missed, run a delta sync from the cursor it gives. Comments are sent as "
+            "heartbeats while the stream is idle. Only served over ASGI."
+        ),
+        parameters=[
+            OpenApiParameter(
+                "Last-Event-ID", OpenApiTypes.INT, OpenApiParameter.HEADER,
+                description="Id of the last event received, to resume after it"
+            ),
+            OpenApiParameter(
+                "last_event_id", OpenApiTypes.INT,
+                description="Same as the Last-Event-ID header, for clients that cannot set headers"
+            ),
+        ],
+        responses={
+            (200, 'text/event-stream'): OpenApiResponse(
+                response=OpenApiTypes.STR,
+                description="Event stream",
+                examples=[
+                    OpenApiExample(
+                        "Events",
+                        value=(
+                            'retry: 3000\n\n'
+                            'id: 1043\nevent: task\ndata: {"id":12,"op":"upsert"}\n\n'
+                            'id: 1044\nevent: subtask\ndata: {"id":31,"op":"delete"}\n\n'
+                            ': heartbeat\n\n'
+                        )
+                    )
+                ]
+            ),
+            400: OpenApiResponse(description="Invalid Last-Event-ID"),
+            501: OpenApiResponse(description="The server does not run under ASGI")
+        }
+    )
+    def get(self, request):
+        """Stream the changes visible to the current user"""
+        last_event_id = request.headers.get("Last-Event-ID", request.query_params.get("last_event_id"))
+        if last_event_id is not None:
+            try:
+                last_event_id = int(last_event_id)
+            except ValueError:
+                raise ValidationError({"last_event_id": ["Event ids must be integers."]})
+            if last_event_id < 0:
+                raise ValidationError({"last_event_id": ["Event ids must be positive."]})
+        if not isinstance(request._request, ASGIRequest):
+            # A WSGI worker would be held for as long as the stream is open
+            return Response(
+                {"detail": "Event streams are only served over ASGI."}, status=status.HTTP_501_NOT_IMPLEMENTED
+            )
+        
+        response = StreamingHttpResponse(
+            stream_events(request.user, last_event_id), content_type="text/event-stream"
+        )
+        response["Cache-Control"] = "no-cache"
+        # Keep nginx from buffering the events
+        response["X-Accel-Buffering"] = "no"
+        return response
+
+
 @extend_schema(tags=['Users'])
-class UserViewSet(viewsets.ModelViewSet):
+class UserViewSet(AsyncReadMixin, SparseFieldsViewMixin, viewsets.ModelViewSet):
     """
     CRUD operations for users
     """
+    async_actions = ("me",)
+    sparse_actions = ("list", "retrieve", "me")
     queryset = User.objects.all().order_by('-date_joined')
     serializer_class = UserSerializer
     filter_backends = [DjangoFilterBackend, filters.SearchFilter]
@@ -197,6 +763,19 @@ class UserViewSet(viewsets.ModelViewSet):
             self.permission_denied(self.request)
         return obj
     
+    def get_serializer(self, *args, **kwargs):
+        if args and args[0] is not None and sharding_enabled():
+            self.attach_task_counts(args[0] if isinstance(args[0], list) else [args[0]])
+        return super().get_serializer(*args, **kwargs)
+    
+    @staticmethod
+    def attach_task_counts(users):
+        """Count the tasks of users on their shards, where tasks cannot be joined to users"""
+        users = [user for user in users if not hasattr(user, "assigned_tasks_total")]
+        totals = assigned_task_counts({user.pk for user in users})
+        for user in users:
+            user.assigned_tasks_total = totals.get(user.pk, 0)
+    
     @extend_schema(
         summary="Create new user",
         description="Register a new user account",
@@ -212,6 +791,10 @@ class UserViewSet(viewsets.ModelViewSet):
     @extend_schema(
         summary="List users",
         description="Get list of all users (admin only)",
+        parameters=[
+            OpenApiParameter("fields", OpenApiTypes.STR, description="Comma separated fields to return"),
+            OpenApiParameter("exclude", OpenApiTypes.STR, description="Comma separated fields to leave out"),
+        ],
         responses={
             200: UserSerializer(many=True),
             403: OpenApiResponse(description="Permission denied")
@@ -272,6 +855,26 @@ class UserViewSet(viewsets.ModelViewSet):
         """Get the current authenticated user's details"""
         serializer = self.get_serializer(request.user)
         return Response(serializer.data)
+    
+    async def ame(self, request):
+        """me through the async ORM, loaded with the counts its fields need"""
+        user = await self.get_queryset().aget(pk=request.user.pk)
+        if sharding_enabled():
+            await sync_to_async(self.attach_task_counts)([user])
+        return Response(self.get_serializer(user).data)
+    
+    @extend_schema(
+        summary="Get my task stats",
+        description="Get the open, overdue, due this week and completed task counters of the current user",
+        responses={
+            200: UserTaskStatsSerializer,
+        }
+    )
+    @action(detail=False, methods=['get'], url_path='me/stats')
+    def me_stats(self, request):
+        """Get the current user's dashboard task counters"""
+        serializer = UserTaskStatsSerializer(get_user_stats(request.user))
+        return Response(serializer.data)
 
 
 @extend_schema(tags=['OTP Codes'])
@@ -370,10 +973,11 @@ class OtpCodeViewSet(viewsets.ModelViewSet):
 
 
 @extend_schema(tags=['Task Categories'])
-class TaskCategoryViewSet(viewsets.ModelViewSet):
+class TaskCategoryViewSet(ReplicaReadMixin, ReferenceListMixin, viewsets.ModelViewSet):
     """
     CRUD operations for task categories
     """
+    reference_version_key = CATEGORIES
     queryset = TaskCategory.objects.all().order_by('name')
     serializer_class = TaskCategorySerializer
     permission_classes = [IsAuthenticated]
@@ -443,11 +1047,18 @@ class TaskCategoryViewSet(viewsets.ModelViewSet):
 
 
 @extend_schema(tags=['Tasks'])
-class TaskViewSet(viewsets.ModelViewSet):
+class TaskViewSet(
+    ReplicaReadMixin, ShardedViewMixin, AsyncReadMixin, SparseFieldsViewMixin, TaskFragmentMixin, viewsets.ModelViewSet
+):
     """
     CRUD operations for tasks
     """
+    async_actions = ("list", "retrieve", "upcoming", "overdue")
+    # List actions select fields of their cached fragments instead
+    sparse_actions = ("retrieve",)
     queryset = Task.objects.filter(is_deleted=False)
+    pagination_class = LargePagePagination
+    columnar_actions = ("list", "upcoming", "overdue")
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_fields = {
         'assigned_user': ['exact'],
@@ -469,16 +1080,23 @@ class TaskViewSet(viewsets.ModelViewSet):
         - Staff can see all tasks
         - Regular users can see tasks assigned to them or where they are collaborators
         """
-        queryset = super().get_queryset()
-        
-        if not self.request.user.is_staff:
-            # Regular users can see tasks they're assigned to or collaborating on
-            queryset = queryset.filter(
-                Q(assigned_user=self.request.user) | 
-                Q(collaborators=self.request.user)
-            ).distinct()
-            
-        return queryset
+        return super().get_queryset().visible_to(self.request.user)
+    
+    def locate_shard(self, request):
+        if "pk" in self.kwargs:
+            located = locate(Task, self.kwargs["pk"], self.shards)
+            if located is None:
+                return None
+            alias, owner_id = located
+            # Its new owner's tasks too when it is reassigned
+            return alias, {owner_id} | requested_owner_ids(request.data, owner_id)
+        if self.action == "create":
+            owner_ids = requested_owner_ids(request.data, request.user.pk)
+            if isinstance(request.data, dict) and owner_ids:
+                return home_shard(next(iter(owner_ids))), owner_ids
+            # Lists go to the shards of their items' owners
+            return self.shards[0], owner_ids
+        return None
     
     def get_serializer_class(self):
         """
@@ -490,6 +1108,31 @@ class TaskViewSet(viewsets.ModelViewSet):
             return TaskListSerializer
         return TaskDetailSerializer
     
+    def get_list_versions(self):
+        """
+        Get the versions the task lists of the current user depend on.
+        
+        Versions must be read before the data so a stale page is never tagged
+        with a newer version.
+        """
+        return get_versions(self.get_list_version_keys())
+    
+    async def aget_list_versions(self):
+        """get_list_versions through the cache's async API"""
+        return await aget_versions(self.get_list_version_keys())
+    
+    def get_list_version_keys(self):
+        user = self.request.user
+        return [TASKS if user.is_staff else user_key(user.pk), TAGS, CATEGORIES, USERS]
+    
+    @staticmethod
+    def _not_modified(request, etag, modified=None):
+        """Return a 304 response if the client already holds this representation"""
+        response = get_conditional_response(request, etag=etag, last_modified=modified)
+        if response is not None:
+            response["ETag"] = etag
+        return response
+    
     @extend_schema(
         summary="List tasks",
         description="Get a filtered list of tasks",
@@ -502,29 +1145,94 @@ class TaskViewSet(viewsets.ModelViewSet):
             OpenApiParameter("end_date__lte", OpenApiTypes.DATE, description="Filter by end date (less than or equal)"),
             OpenApiParameter("search", OpenApiTypes.STR, description="Search in name and description"),
             OpenApiParameter("ordering", OpenApiTypes.STR, description="Order by field (prefix with - for descending)"),
+            OpenApiParameter("page_size", OpenApiTypes.INT, description="Tasks per page, at most 1000"),
+            OpenApiParameter("fields", OpenApiTypes.STR, description="Comma separated fields to return"),
+            OpenApiParameter("exclude", OpenApiTypes.STR, description="Comma separated fields to leave out"),
+            OpenApiParameter(
+                "format", OpenApiTypes.STR, enum=["json", "columnar"],
+                description="`columnar` returns field names once and one value array per field, "
+                            "with repeated strings replaced by indexes into per-field dictionaries"
+            ),
         ],
         responses={200: TaskListSerializer(many=True)}
     )
     def list(self, request, *args, **kwargs):
         """List all tasks with filtering options"""
-        return super().list(request, *args, **kwargs)
+        etag = self.get_list_etag(request)
+        not_modified = self._not_modified(request, etag)
+        if not_modified is not None:
+            return not_modified
+        
+        response = self.get_task_page_response(self.filter_queryset(self.get_queryset()))
+        response["ETag"] = etag
+        return response
+    
+    async def alist(self, request, *args, **kwargs):
+        """list through the async ORM"""
+        etag = self.get_list_etag(request, await self.aget_list_versions())
+        not_modified = self._not_modified(request, etag)
+        if not_modified is not None:
+            return not_modified
+        
+        response = await self.aget_task_page_response(await self.afilter_queryset(self.get_queryset()))
+        response["ETag"] = etag
+        return response
+    
+    def get_list_etag(self, request, versions=None):
+        if versions is None:
+            versions = self.get_list_versions()
+        return make_etag(
+            "task-list", request.user.pk, sorted(versions.items()),
+            request.get_full_path(), request.META.get("HTTP_ACCEPT"),
+        )
     
     @extend_schema(
         summary="Create task",
-        description="Create a new task",
+        description=(
+            "Create a new task, or send a list to create up to 1000 tasks at once. Tasks are "
+            "assigned to the current user unless `assigned_user_id` is given. A list is created "
+            "all or nothing: any invalid item fails the request with one error object per item. "
+            "With `atomic=false` the valid items are created and the response lists, in input "
+            "order, each created task or `{\"errors\": ...}` for an invalid item."
+        ),
+        parameters=[
+            OpenApiParameter(
+                "atomic", OpenApiTypes.BOOL,
+                description="When creating a list, `false` creates the valid items even if others are invalid"
+            ),
+        ],
         request=TaskDetailSerializer,
         responses={
             201: TaskDetailSerializer,
+            207: OpenApiResponse(description="Some items of a non-atomic list were invalid"),
             400: OpenApiResponse(description="Invalid data")
         }
     )
     def create(self, request, *args, **kwargs):
-        """Create a new task"""
-        # Set the assigned user to the current user if not provided
-        if 'assigned_user_id' not in request.data:
-            request.data['assigned_user_id'] = request.user.id
-            
-        return super().create(request, *args, **kwargs)
+        """Create a new task, or many from a list"""
+        if not isinstance(request.data, list):
+            return super().create(request, *args, **kwargs)
+        
+        partial_success = request.query_params.get("atomic", "true").lower() in ("false", "0")
+        serializer = self.get_serializer(
+            data=request.data,
+            many=True,
+            max_length=settings.TASK_BULK_CREATE_MAX_ITEMS,
+            context={**self.get_serializer_context(), "partial_success": partial_success},
+        )
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        if not serializer.item_errors:
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
+        
+        created = iter(serializer.data)
+        return Response(
+            [
+                {"errors": serializer.item_errors[index]} if index in serializer.item_errors else next(created)
+                for index in range(len(request.data))
+            ],
+            status=status.HTTP_207_MULTI_STATUS,
+        )
     
     @extend_schema(
         summary="Get task details",
@@ -536,7 +1244,81 @@ class TaskViewSet(viewsets.ModelViewSet):
     )
     def retrieve(self, request, *args, **kwargs):
         """Get task details"""
-        return super().retrieve(request, *args, **kwargs)
+        try:
+            task_id = int(self.kwargs["pk"])
+        except ValueError:
+            return super().retrieve(request, *args, **kwargs)
+        
+        # The nested users show their assigned task counts, so their versions count too
+        audience = set(Task.objects.filter(pk=task_id).values_list("assigned_user_id", flat=True))
+        audience.update(Task.collaborators.through.objects.filter(task_id=task_id).values_list("user_id", flat=True))
+        versions = get_versions([task_key(task_id), TAGS, CATEGORIES, *map(user_key, audience)])
+        
+        instance = self.get_object()
+        etag, modified = self.get_detail_validators(request, versions)
+        not_modified = self._not_modified(request, etag, modified)
+        if not_modified is not None:
+            not_modified["Last-Modified"] = http_date(modified)
+            return not_modified
+        
+        # Absolute attachment URLs depend on the host
+        data = render_fragments(
+            self.get_serializer_class(),
+            {instance.pk: version_token(etag, request.get_host())},
+            lambda task_ids: [instance],
+            context=self.get_serializer_context(),
+        )
+        return self.get_detail_response(data[0], etag, modified)
+    
+    async def aretrieve(self, request, *args, **kwargs):
+        """retrieve through the async ORM"""
+        try:
+            task_id = int(self.kwargs["pk"])
+        except ValueError:
+            raise Http404
+        
+        audience = {
+            user_id async for user_id in Task.objects.filter(pk=task_id).values_list("assigned_user_id", flat=True)
+        }
+        audience.update([
+            user_id async for user_id in
+            Task.collaborators.through.objects.filter(task_id=task_id).values_list("user_id", flat=True)
+        ])
+        versions = await aget_versions([task_key(task_id), TAGS, CATEGORIES, *map(user_key, audience)])
+        
+        instance = await self.aget_object()
+        etag, modified = self.get_detail_validators(request, versions)
+        not_modified = self._not_modified(request, etag, modified)
+        if not_modified is not None:
+            not_modified["Last-Modified"] = http_date(modified)
+            return not_modified
+        
+        async def aload(task_ids):
+            return [instance]
+        
+        data = await arender_fragments(
+            self.get_serializer_class(),
+            {instance.pk: version_token(etag, request.get_host())},
+            aload,
+            context=self.get_serializer_context(),
+        )
+        return self.get_detail_response(data[0], etag, modified)
+    
+    def get_detail_validators(self, request, versions):
+        """Return the ETag and modification time of a task representation"""
+        fields = self.get_sparse_fields()
+        etag = make_etag(
+            "task-detail", sorted(versions.items()), request.META.get("HTTP_ACCEPT"),
+            sorted(fields) if fields else None,
+        )
+        return etag, last_modified(versions)
+    
+    @staticmethod
+    def get_detail_response(data, etag, modified):
+        response = Response(data)
+        response["ETag"] = etag
+        response["Last-Modified"] = http_date(modified)
+        return response
     
     @extend_schema(
         summary="Update task",
@@ -579,7 +1361,7 @@ class TaskViewSet(viewsets.ModelViewSet):
         serializer = TaskListSerializer(expired_tasks, many=True)
         return Response({
             "message": "Expired tasks have been updated",
-            "expired_tasks_count": expired_tasks.count(),
+            "expired_tasks_count": len(expired_tasks),
             "expired_tasks": serializer.data
         })
     
@@ -600,24 +1382,25 @@ class TaskViewSet(viewsets.ModelViewSet):
         responses={200: TaskListSerializer(many=True)}
     )
     @action(detail=False, methods=['get'])
+    @coalesced
     def upcoming(self, request):
         """Get tasks with upcoming deadlines (within the next 7 days)"""
+        return self.get_task_page_response(self.get_upcoming_queryset())
+    
+    @acoalesced
+    async def aupcoming(self, request):
+        """upcoming through the async ORM"""
+        return await self.aget_task_page_response(self.get_upcoming_queryset())
+    
+    def get_upcoming_queryset(self):
         today = timezone.now().date()
         upcoming_deadline = today + datetime.timedelta(days=7)
         
-        queryset = self.get_queryset().filter(
+        return self.get_queryset().filter(
             end_date__gte=today,
             end_date__lte=upcoming_deadline,
             is_expired=False
         ).order_by('end_date')
-        
-        page = self.paginate_queryset(queryset)
-        if page is not None:
-            serializer = TaskListSerializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
-        
-        serializer = TaskListSerializer(queryset, many=True)
-        return Response(serializer.data)
     
     @extend_schema(
         summary="Get overdue tasks",
@@ -625,31 +1408,345 @@ class TaskViewSet(viewsets.ModelViewSet):
         responses={200: TaskListSerializer(many=True)}
     )
     @action(detail=False, methods=['get'])
+    @coalesced
     def overdue(self, request):
         """Get overdue tasks (past deadline and not completed)"""
+        return self.get_task_page_response(self.get_overdue_queryset())
+    
+    @acoalesced
+    async def aoverdue(self, request):
+        """overdue through the async ORM"""
+        return await self.aget_task_page_response(self.get_overdue_queryset())
+    
+    def get_overdue_queryset(self):
         today = timezone.now().date()
         
-        queryset = self.get_queryset().filter(
+        return self.get_queryset().filter(
             end_date__lt=today,
             status__in=["Not Started", "In Progress", "On Hold"],
             is_expired=True
         ).order_by('end_date')
+    
+    @extend_schema(
+        summary="Get calendar",
+        description=(
+            "Get the tasks overlapping a date window bucketed per day. Recurring tasks are "
+            "expanded virtually. Each day maps to a list of [task_id, span_in_days] entries "
+            "for the occurrences starting on it. Wide windows are streamed."
+        ),
+        parameters=[
+            OpenApiParameter("from", OpenApiTypes.DATE, required=True, description="First day of the window"),
+            OpenApiParameter("to", OpenApiTypes.DATE, required=True, description="Last day of the window (inclusive)"),
+        ],
+        responses={
+            200: OpenApiResponse(
+                description="Tasks and per-day occurrence buckets",
+                examples=[
+                    OpenApiExample(
+                        "Calendar window",
+                        value={
+                            "from": "2025-05-01",
+                            "to": "2025-05-07",
+                            "tasks": {"12": {"name": "Standup", "status": "Not Started", "recurring": "Daily"}},
+                            "days": {"2025-05-01": [[12, 1]], "2025-05-02": [[12, 1]]}
+                        }
+                    )
+                ]
+            ),
+            400: OpenApiResponse(description="Invalid or too wide window")
+        }
+    )
+    @action(detail=False, methods=['get'])
+    def calendar(self, request):
+        """Get tasks and recurring occurrences overlapping a date window"""
+        window_start = parse_date_param(request, "from")
+        window_end = parse_date_param(request, "to")
+        window_days = (window_end - window_start).days + 1
+        if window_days < 1:
+            raise ValidationError({"to": ["Must not be before 'from'."]})
+        if window_days > settings.CALENDAR_MAX_DAYS:
+            raise ValidationError({"to": [f"Window may span at most {settings.CALENDAR_MAX_DAYS} days."]})
         
-        page = self.paginate_queryset(queryset)
-        if page is not None:
-            serializer = TaskListSerializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
+        # Tasks overlapping the window, plus live recurring tasks that started before it
+        overlapping = Q(end_date__gte=window_start, start_date__lte=window_end)
+        recurring = Q(recurring__in=list(RRULE_FREQUENCIES), is_expired=False, start_date__lte=window_end)
+        queryset = (
+            self.filter_queryset(self.get_queryset())
+            .filter(overlapping | recurring)
+            .order_by()
+            .values(
+                "id", "name", "status", "priority", "start_date", "start_time",
+                "end_date", "end_time", "recurring", "is_expired", "progress"
+            )
+        )
+        tasks = [
+            task for shard_tasks in self.on_shards(lambda alias: list(using_shard(queryset, alias)))
+            for task in shard_tasks
+        ]
+        tasks_by_id = {task.pop("id"): task for task in tasks}
+        days = iter_calendar_days(
+            ({"id": task_id, **task} for task_id, task in tasks_by_id.items()),
+            window_start,
+            window_end,
+        )
         
-        serializer = TaskListSerializer(queryset, many=True)
-        return Response(serializer.data)
+        if window_days <= settings.CALENDAR_STREAM_THRESHOLD_DAYS:
+            return Response({
+                "from": window_start,
+                "to": window_end,
+                "tasks": tasks_by_id,
+                "days": {day.isoformat(): entries for day, entries in days},
+            })
+        
+        return StreamingHttpResponse(
+            self._stream_calendar(window_start, window_end, tasks_by_id, days),
+            content_type="application/json",
+        )
+    
+    @extend_schema(
+        summary="Export tasks",
+        description=(
+            "Stream every task matching the list filters, search and ordering as newline "
+            "delimited JSON or CSV. Relations are exported by name and CSV cells holding "
+            "several tags or collaborators separate them with `|`."
+        ),
+        parameters=[
+            OpenApiParameter("assigned_user", OpenApiTypes.INT, description="Filter by assigned user ID"),
+            OpenApiParameter("category", OpenApiTypes.INT, description="Filter by category ID"),
+            OpenApiParameter("status", OpenApiTypes.STR, description="Filter by status"),
+            OpenApiParameter("priority", OpenApiTypes.STR, description="Filter by priority"),
+            OpenApiParameter("start_date__gte", OpenApiTypes.DATE, description="Filter by start date (greater than or equal)"),
+            OpenApiParameter("end_date__lte", OpenApiTypes.DATE, description="Filter by end date (less than or equal)"),
+            OpenApiParameter("search", OpenApiTypes.STR, description="Search in name and description"),
+            OpenApiParameter("ordering", OpenApiTypes.STR, description="Order by field (prefix with - for descending)"),
+            OpenApiParameter("format", OpenApiTypes.STR, enum=["ndjson", "csv"], description="Export format, ndjson by default"),
+        ],
+        responses={
+            (200, "application/x-ndjson"): OpenApiResponse(
+                OpenApiTypes.STR,
+                description="One task per line",
+                examples=[
+                    OpenApiExample(
+                        "NDJSON line",
+                        value={
+                            "id": 12, "name": "Write report", "description": "", "status": "Not Started",
+                            "priority": "High", "start_date": "2025-05-01", "start_time": "09:00:00",
+                            "end_date": "2025-05-02", "end_time": "17:00:00", "recurring": "None",
+                            "progress": 0, "is_expired": False, "reminder_time": None,
+                            "assigned_user": "alice", "category": "Work", "tags": ["urgent"],
+                            "collaborators": ["bob"], "date_created": "2025-04-30T08:00:00Z",
+                            "date_updated": "2025-04-30T08:00:00Z"
+                        }
+                    )
+                ]
+            ),
+            (200, "text/csv"): OpenApiResponse(OpenApiTypes.STR, description="Header row, then one task per row"),
+        }
+    )
+    @action(detail=False, methods=['get'], renderer_classes=[NDJSONRenderer, CSVRenderer])
+    def export(self, request):
+        """Stream the filtered tasks as NDJSON or CSV"""
+        queryset = self.filter_queryset(self.get_queryset())
+        renderer = request.accepted_renderer
+        write = iter_csv if renderer.format == CSVRenderer.format else iter_ndjson
+        response = StreamingHttpResponse(
+            # Streamed after the request, so bound to their shards
+            write([using_shard(queryset, alias) for alias in self.shards], settings.TASK_EXPORT_CHUNK_SIZE),
+            content_type=renderer.media_type if renderer.charset is None
+            else f"{renderer.media_type}; charset={renderer.charset}",
+        )
+        response["Content-Disposition"] = f'attachment; filename="tasks.{renderer.format}"'
+        return response
+    
+    @extend_schema(
+        summary="Import tasks",
+        description=(
+            "Create tasks from a newline delimited JSON or CSV body, read as a stream. Rows use "
+            "the export columns, read-only ones are ignored. Relations are given by name: "
+            "unknown tags and categories are created, unknown usernames fail the row. Tasks "
+            "are assigned to the current user unless a row says otherwise. Valid rows are "
+            "imported in batches, invalid ones are skipped and reported by position, counting "
+            "from 1 without blank lines or the CSV header."
+        ),
+        request={
+            "application/x-ndjson": OpenApiTypes.STR,
+            "text/csv": OpenApiTypes.STR,
+        },
+        responses={
+            200: OpenApiResponse(
+                description="Import report",
+                examples=[
+                    OpenApiExample(
+                        "Import report",
+                        value={
+                            "total": 3,
+                            "created": 2,
+                            "failed": 1,
+                            "errors": [{"row": 2, "errors": {"end_date": ["This field is required."]}}]
+                        }
+                    )
+                ]
+            )
+        }
+    )
+    @action(detail=False, methods=['post'], url_path='import', parser_classes=[NDJSONParser, CSVParser])
+    def import_tasks(self, request):
+        """Create tasks from an NDJSON or CSV stream"""
+        rows = request.data
+        if not isinstance(rows, Iterator):
+            # Empty body
+            rows = ()
+        report = TaskImport(
+            request.user, settings.TASK_IMPORT_BATCH_SIZE, settings.TASK_IMPORT_MAX_ERRORS
+        ).run(rows)
+        return Response(report)
+    
+    @extend_schema(
+        summary="Get task facets",
+        description=(
+            "Get task counts by status, priority, category, tag and expired flag for the "
+            "current filters and search. Results are cached briefly per user."
+        ),
+        parameters=[
+            OpenApiParameter("assigned_user", OpenApiTypes.INT, description="Filter by assigned user ID"),
+            OpenApiParameter("category", OpenApiTypes.INT, description="Filter by category ID"),
+            OpenApiParameter("status", OpenApiTypes.STR, description="Filter by status"),
+            OpenApiParameter("priority", OpenApiTypes.STR, description="Filter by priority"),
+            OpenApiParameter("search", OpenApiTypes.STR, description="Search in name and description"),
+        ],
+        responses={
+            200: OpenApiResponse(
+                description="Facet counts",
+                examples=[
+                    OpenApiExample(
+                        "Facets",
+                        value={
+                            "total": 3,
+                            "status": {"Not Started": 2, "In Progress": 1, "Completed": 0, "On Hold": 0, "Cancelled": 0},
+                            "priority": {"Low": 0, "Medium": 3, "High": 0, "Urgent": 0},
+                            "is_expired": {"true": 0, "false": 3},
+                            "category": [{"id": 1, "name": "Work", "count": 3}],
+                            "tags": [{"id": 4, "name": "urgent", "count": 1}]
+                        }
+                    )
+                ]
+            )
+        }
+    )
+    @action(detail=False, methods=['get'])
+    @coalesced
+    def facets(self, request):
+        """Get task counts grouped by status, priority, category, tag and expiry"""
+        params = sorted(
+            (key, value)
+            for key, values in request.query_params.lists()
+            if key not in ("page", "ordering")
+            for value in values
+        )
+        versions = sorted(self.get_list_versions().items())
+        digest = hashlib.md5(json.dumps([params, versions]).encode()).hexdigest()
+        cache_key = f"task-facets:{request.user.pk}:{digest}"
+        
+        facets = cache.get(cache_key)
+        if facets is None:
+            queryset = self.filter_queryset(self.get_queryset())
+            facets = self._merge_facets(self.on_shards(lambda alias: self._compute_facets(using_shard(queryset, alias))))
+            cache.set(cache_key, facets, settings.TASK_FACETS_CACHE_SECONDS)
+        return Response(facets)
+    
+    @staticmethod
+    def _compute_facets(queryset):
+        """
+        Count the filtered tasks per facet with two grouped queries.
+        
+        The visibility filter joins collaborators, so the scoped task ids are used
+        as a subquery to keep every task counted exactly once.
+        """
+        task_ids = queryset.order_by().values("pk")
+        facets = {
+            "total": 0,
+            "status": {value: 0 for value, _ in Task.STATUS_CHOICES},
+            "priority": {value: 0 for value, _ in Task.PRIORITY_CHOICES},
+            "is_expired": {"true": 0, "false": 0},
+            "category": [],
+            "tags": [],
+        }
+        categories = {}
+        
+        # One GROUP BY over every scalar facet, folded into the separate facets
+        rows = (
+            Task.objects.filter(pk__in=task_ids)
+            .order_by()
+            .values("status", "priority", "is_expired", "category_id", "category__name")
+            .annotate(count=Count("id"))
+        )
+        for row in rows:
+            count = row["count"]
+            facets["total"] += count
+            facets["status"][row["status"]] = facets["status"].get(row["status"], 0) + count
+            facets["priority"][row["priority"]] = facets["priority"].get(row["priority"], 0) + count
+            facets["is_expired"]["true" if row["is_expired"] else "false"] += count
+            category = categories.setdefault(
+                row["category_id"],
+                {"id": row["category_id"], "name": row["category__name"], "count": 0},
+            )
+            category["count"] += count
+        facets["category"] = sorted(categories.values(), key=lambda category: -category["count"])
+        
+        tags = (
+            Task.tags.through.objects.filter(task_id__in=task_ids)
+            .order_by()
+            .values("tag_id", "tag__name")
+            .annotate(count=Count("task_id", distinct=True))
+            .order_by("-count", "tag__name")
+        )
+        facets["tags"] = [
+            {"id": row["tag_id"], "name": row["tag__name"], "count": row["count"]}
+            for row in tags
+        ]
+        return facets
+    
+    @staticmethod
+    def _merge_facets(shard_facets):
+        """Add up the facets counted on each shard"""
+        if len(shard_facets) == 1:
+            return shard_facets[0]
+        facets = shard_facets[0]
+        for other in shard_facets[1:]:
+            facets["total"] += other["total"]
+            for name in ("status", "priority", "is_expired"):
+                for value, count in other[name].items():
+                    facets[name][value] = facets[name].get(value, 0) + count
+            for name in ("category", "tags"):
+                merged = {entry["id"]: entry for entry in facets[name]}
+                for entry in other[name]:
+                    merged.setdefault(entry["id"], {**entry, "count": 0})["count"] += entry["count"]
+                facets[name] = list(merged.values())
+        facets["category"].sort(key=lambda category: -category["count"])
+        facets["tags"].sort(key=lambda tag: (-tag["count"], tag["name"]))
+        return facets
+    
+    @staticmethod
+    def _stream_calendar(window_start, window_end, tasks_by_id, days):
+        """Yield the calendar JSON document one day bucket at a time"""
+        header = json_dumps({"from": window_start, "to": window_end, "tasks": tasks_by_id})
+        yield header[:-1] + b',"days":{'
+        separator = b""
+        for day, entries in days:
+            yield b'%s"%s":%s' % (separator, day.isoformat().encode(), json_dumps(entries))
+            separator = b","
+        yield b"}}"
 
 
 @extend_schema(tags=['Subtasks'])
-class SubTaskViewSet(viewsets.ModelViewSet):
+class SubTaskViewSet(ReplicaReadMixin, ShardedViewMixin, SparseFieldsViewMixin, ColumnarMixin, viewsets.ModelViewSet):
     """
     CRUD operations for subtasks
     """
+    sparse_actions = ("list", "retrieve")
     queryset = SubTask.objects.all()
+    pagination_class = LargePagePagination
+    columnar_actions = ("list",)
     serializer_class = SubTaskSerializer
     permission_classes = [IsAuthenticated]
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
@@ -677,6 +1774,14 @@ class SubTaskViewSet(viewsets.ModelViewSet):
             
         return queryset
     
+    def locate_shard(self, request):
+        if "pk" in self.kwargs:
+            return locate(SubTask, self.kwargs["pk"], self.shards)
+        if self.action == "create" and isinstance(request.data, dict):
+            located = locate(Task, request.data.get("parent_task"), self.shards)
+            return located and (located[0], {located[1]})
+        return None
+    
     @extend_schema(
         summary="List subtasks",
         description="Get a list of subtasks with filtering options",
@@ -685,13 +1790,47 @@ class SubTaskViewSet(viewsets.ModelViewSet):
             OpenApiParameter("status", OpenApiTypes.STR, description="Filter by status"),
             OpenApiParameter("assigned_user", OpenApiTypes.INT, description="Filter by assigned user ID"),
             OpenApiParameter("search", OpenApiTypes.STR, description="Search in name and description"),
+            OpenApiParameter("page_size", OpenApiTypes.INT, description="Subtasks per page, at most 1000"),
+            OpenApiParameter("fields", OpenApiTypes.STR, description="Comma separated fields to return"),
+            OpenApiParameter("exclude", OpenApiTypes.STR, description="Comma separated fields to leave out"),
+            OpenApiParameter(
+                "format", OpenApiTypes.STR, enum=["json", "columnar"],
+                description="`columnar` returns one value array per field"
+            ),
         ],
         responses={200: SubTaskSerializer(many=True)}
     )
     def list(self, request, *args, **kwargs):
         """List all subtasks with filtering options"""
+        if len(self.shards) > 1:
+            return self.list_sharded()
+        if self.wants_columnar():
+            queryset = self.filter_queryset(self.get_queryset())
+            return self.get_columnar_response(values_for(queryset, SUBTASK_COLUMNS), SUBTASK_COLUMNS)
         return super().list(request, *args, **kwargs)
     
+    def list_sharded(self):
+        """list for subtasks spread over several shards"""
+        queryset = self.filter_queryset(self.get_queryset())
+        subtask_ids = [subtask_id for subtask_id, in self.sharded_values(queryset, "pk")]
+        page = self.paginate_queryset(subtask_ids)
+        if page is not None:
+            subtask_ids = page
+        
+        if self.wants_columnar():
+            rows = {
+                row[0]: row for shard_rows in self.on_shards(
+                    lambda alias: list(values_for(using_shard(queryset, alias).filter(pk__in=subtask_ids), SUBTASK_COLUMNS))
+                ) for row in shard_rows
+            }
+            data = to_columnar(SUBTASK_COLUMNS, [rows[pk] for pk in subtask_ids if pk in rows])
+        else:
+            data = self.get_serializer(self.load_sharded(queryset, subtask_ids), many=True).data
+        
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
+    
     @extend_schema(
         summary="Create subtask",
         description="Create a new subtask for a task",
@@ -712,11 +1851,17 @@ class SubTaskViewSet(viewsets.ModelViewSet):
 
 
 @extend_schema(tags=['Tags'])
-class TagViewSet(viewsets.ModelViewSet):
+class TagViewSet(
+    ReplicaReadMixin, ShardedViewMixin, AsyncReadMixin, ReferenceListMixin, TaskFragmentMixin, viewsets.ModelViewSet
+):
     """
     CRUD operations for tags
     """
+    async_actions = ("tasks",)
+    reference_version_key = TAGS
     queryset = Tag.objects.all().order_by('name')
+    pagination_class = LargePagePagination
+    columnar_actions = ("tasks",)
     serializer_class = TagSerializer
     permission_classes = [IsAuthenticated]
     filter_backends = [filters.SearchFilter, filters.OrderingFilter]
@@ -731,25 +1876,22 @@ class TagViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['get'])
     def tasks(self, request, pk=None):
         """Get all tasks for a specific tag"""
-        tag = self.get_object()
-        
+        return self.get_task_page_response(self.get_tag_tasks(self.get_object()))
+    
+    async def atasks(self, request, pk=None):
+        """tasks through the async ORM"""
+        return await self.aget_task_page_response(self.get_tag_tasks(await self.aget_object()))
+    
+    def get_tag_tasks(self, tag):
         # Filter tasks by tag and user permissions
-        if request.user.is_staff:
-            tasks = tag.tasks.filter(is_deleted=False)
-        else:
-            tasks = tag.tasks.filter(
-                Q(assigned_user=request.user) | 
-                Q(collaborators=request.user),
-                is_deleted=False
-            ).distinct()
-        
-        page = self.paginate_queryset(tasks)
-        if page is not None:
-            serializer = TaskListSerializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
-            
-        serializer = TaskListSerializer(tasks, many=True)
-        return Response(serializer.data)
+        user = self.request.user
+        if user.is_staff:
+            return tag.tasks.filter(is_deleted=False)
+        return tag.tasks.filter(
+            Q(assigned_user=user) | 
+            Q(collaborators=user),
+            is_deleted=False
+        ).distinct()
 
 
 @extend_schema(tags=['User Preferences'])
@@ -785,18 +1927,22 @@ class UserPreferenceViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def me(self, request):
         """Get or create preferences for the current user"""
-        preference, created = UserPreference.objects.get_or_create(
-            user=request.user,
-            defaults={
-                'theme': 'System',
-                'receive_email_notifications': True,
-                'receive_collaboration_notifications': True,
-                'default_view': 'calendar'
-            }
-        )
+        def load():
+            preference, created = UserPreference.objects.select_related('user').get_or_create(
+                user=request.user,
+                defaults={
+                    'theme': 'System',
+                    'receive_email_notifications': True,
+                    'receive_collaboration_notifications': True,
+                    'default_view': 'calendar'
+                }
+            )
+            return dict(self.get_serializer(preference).data)
         
-        serializer = self.get_serializer(preference)
-        return Response(serializer.data)
+        # The representation includes the username, so a rename refreshes it too
+        key = preference_key(request.user.id)
+        name = f"{key}:native" if wants_native_temporals({"request": request}) else key
+        return Response(reference_cache.get(name, [key, account_key(request.user.id)], load))
     
     @extend_schema(
         summary="Update my preferences",
@@ -811,14 +1957,10 @@ class UserPreferenceViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['put', 'patch'])
     def update_me(self, request):
         """Update preferences for the current user"""
-        preference, created = UserPreference.objects.get_or_create(
-            user=request.user,
-            defaults={
-                'theme': 'System',
-                'receive_email_notifications': True,
-                'receive_collaboration_notifications': True,
-                'default_view': 'calendar'
-            }
+        # A missing row is created by the save below with the model defaults
+        preference = (
+            UserPreference.objects.filter(user=request.user).first()
+            or UserPreference(user=request.user)
         )
         
         serializer = self.get_serializer(preference, data=request.data, partial=True)
@@ -826,3 +1968,81 @@ class UserPreferenceViewSet(viewsets.ModelViewSet):
         serializer.save()
         
         return Response(serializer.data)
+
+
+@extend_schema(tags=['Task Trends'])
+class TaskTrendViewSet(viewsets.GenericViewSet):
+    """
+    Historical task throughput read from the daily rollups
+    """
+    queryset = TaskDailyRollup.objects.all()
+    permission_classes = [IsAuthenticated]
+    pagination_class = None
+    
+    def get_queryset(self):
+        """
+        Restrict the rollups to the requested date window and user:
+        - Staff may pass a user ID, or omit it to see every user
+        - Regular users only see their own rollups
+        """
+        window_start = parse_date_param(self.request, "from")
+        window_end = parse_date_param(self.request, "to")
+        if window_end < window_start:
+            raise ValidationError({"to": ["Must not be before 'from'."]})
+        queryset = super().get_queryset().filter(day__gte=window_start, day__lte=window_end)
+        
+        user_id = parse_id_param(self.request, "user")
+        if not self.request.user.is_staff:
+            queryset = queryset.filter(user_id=self.request.user.id)
+        elif user_id is not None:
+            queryset = queryset.filter(user_id=user_id)
+        
+        category_id = parse_id_param(self.request, "category")
+        if category_id is not None:
+            queryset = queryset.filter(category_id=category_id)
+        return queryset
+    
+    @extend_schema(
+        summary="Get daily task trends",
+        description=(
+            "Get created, completed, reopened, expired and deleted task counts per day "
+            "with completion rates, read from the daily rollups. A completion rate is "
+            "completions over creations in the same days, capped at 1."
+        ),
+        parameters=[
+            OpenApiParameter("from", OpenApiTypes.DATE, required=True, description="First day of the range"),
+            OpenApiParameter("to", OpenApiTypes.DATE, required=True, description="Last day of the range (inclusive)"),
+            OpenApiParameter("user", OpenApiTypes.INT, description="Filter by user ID (staff only)"),
+            OpenApiParameter("category", OpenApiTypes.INT, description="Filter by category ID"),
+        ],
+        responses={200: OpenApiTypes.OBJECT}
+    )
+    @action(detail=False, methods=['get'])
+    def daily(self, request):
+        """Get task counters per day over a date range"""
+        queryset = self.get_queryset()
+        return Response({
+            "totals": summarize_rollups(queryset)[0],
+            "days": summarize_rollups(queryset, "day"),
+        })
+    
+    @extend_schema(
+        summary="Get task trends by category",
+        description="Get task counters and completion rates per category over a date range",
+        parameters=[
+            OpenApiParameter("from", OpenApiTypes.DATE, required=True, description="First day of the range"),
+            OpenApiParameter("to", OpenApiTypes.DATE, required=True, description="Last day of the range (inclusive)"),
+            OpenApiParameter("user", OpenApiTypes.INT, description="Filter by user ID (staff only)"),
+        ],
+        responses={200: OpenApiTypes.OBJECT}
+    )
+    @action(detail=False, methods=['get'])
+    def categories(self, request):
+        """Get task counters per category over a date range"""
+        rows = summarize_rollups(self.get_queryset(), "category_id")
+        names = dict(
+            TaskCategory.objects.filter(id__in=[row["category_id"] for row in rows]).values_list("id", "name")
+        )
+        for row in rows:
+            row["category_name"] = names.get(row["category_id"])
+        return Response(rows)
@@ -0,0 +1,19 @@
+"""
+Django's MySQL backend with the per-process connection pool of TodoApp.backends.pool.
+
+PyMySQL stands in for mysqlclient when the latter is not installed.
+"""
+try:
+    import MySQLdb  # noqa: F401
+except ImportError:
+    import pymysql
+
+    pymysql.install_as_MySQLdb()
+
+from django.db.backends.mysql import base
+
+from TodoApp.backends.pool import PooledDatabaseWrapperMixin
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+    pass
@@ -0,0 +1,237 @@
+"""
+Bounded per-process pool of database connections for the TodoApp backends.
+
+Django opens a connection per thread and closes it at the end of the request,
+or keeps it for ``CONN_MAX_AGE`` seconds. With ``POOL`` in the settings of a
+database, its connections are checked out of a pool of at most ``SIZE``
+connections shared by the threads of the process, and checked back in instead
+of being closed:
+
+- A checkout waits up to ``TIMEOUT`` seconds for a connection when all of
+  them are in use, then fails with PoolTimeout.
+- A connection idle for more than ``CHECK_AFTER`` seconds is pinged before it
+  is handed out, one opened more than ``RECYCLE`` seconds ago is replaced.
+- A connection given back inside a transaction, with autocommit changed or
+  after an error that made it unusable is closed, not reused.
+
+Every checkout, wait, timeout and opened or discarded connection is counted in
+``ApiDevt.metrics.counters`` under ``db.pool.``. Pools are per process: idle
+connections are closed before a fork and the child starts with empty pools.
+"""
+import functools
+import os
+import threading
+import time
+from collections import deque
+
+from django.db.utils import OperationalError
+
+from ApiDevt.metrics import counters
+
+
+class PoolTimeout(OperationalError):
+    pass
+
+
+class _Waiter:
+    """A checkout queued for the next connection given back or slot freed"""
+    __slots__ = ("entry", "slot")
+
+    def __init__(self):
+        self.entry = None
+        self.slot = False
+
+
+class ConnectionPool:
+    def __init__(self, alias, size, timeout=10, recycle=3600, check_after=30):
+        self.alias = alias
+        self.size = size
+        self.timeout = timeout
+        self.recycle = recycle
+        self.check_after = check_after
+        # (connection, time it was given back), the most recent last
+        self._idle = []
+        # Time every open connection was opened at
+        self._opened_at = {}
+        self._reserved = 0
+        # Served first come first served: a thread giving a connection back and
+        # checking one out again right away must not starve them
+        self._waiters = deque()
+        self._cond = threading.Condition()
+
+    def checkout(self, connect, check):
+        """
+        Return an idle connection, or one opened by ``connect`` while the pool
+        is not full. ``check`` raises when an idle connection no longer works.
+        """
+        counters.incr("db.pool.checkouts")
+        entry = None
+        with self._cond:
+            if self._idle and not self._waiters:
+                entry = self._idle.pop()
+            elif self._reserved < self.size and not self._waiters:
+                self._reserved += 1
+            else:
+                counters.incr("db.pool.waits")
+                waiter = _Waiter()
+                self._waiters.append(waiter)
+                if not self._cond.wait_for(lambda: waiter.entry or waiter.slot, self.timeout):
+                    self._waiters.remove(waiter)
+                    counters.incr("db.pool.timeouts")
+                    raise PoolTimeout(
+                        f"No connection to database {self.alias!r} freed up in {self.timeout} seconds, "
+                        f"all {self.size} are in use."
+                    )
+                entry = waiter.entry
+
+        connection = None
+        if entry is not None:
+            connection, returned_at = entry
+            now = time.monotonic()
+            if now - self._opened_at.get(connection, now) >= self.recycle:
+                counters.incr("db.pool.recycled")
+                self._close(connection)
+                connection = None
+            elif now - returned_at >= self.check_after:
+                try:
+                    check(connection)
+                except Exception:
+                    counters.incr("db.pool.check_failed")
+                    self._close(connection)
+                    connection = None
+        if connection is None:
+            # The slot stays reserved for the replacement
+            try:
+                connection = connect()
+            except BaseException:
+                self._release()
+                raise
+            counters.incr("db.pool.opened")
+            self._opened_at[connection] = time.monotonic()
+        return connection
+
+    def checkin(self, connection):
+        entry = (connection, time.monotonic())
+        with self._cond:
+            if self._waiters:
+                self._waiters.popleft().entry = entry
+                self._cond.notify_all()
+            else:
+                self._idle.append(entry)
+
+    def discard(self, connection):
+        """Close a checked out connection for good and free its slot"""
+        counters.incr("db.pool.discarded")
+        self._close(connection)
+        self._release()
+
+    def close_idle(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._reserved -= len(idle)
+        for connection, returned_at in idle:
+            self._close(connection)
+
+    def stats(self):
+        with self._cond:
+            return {"size": self.size, "open": self._reserved, "idle": len(self._idle)}
+
+    def _close(self, connection):
+        self._opened_at.pop(connection, None)
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def _release(self):
+        with self._cond:
+            if self._waiters:
+                # The slot passes to the first waiter, which opens a connection in it
+                self._waiters.popleft().slot = True
+                self._cond.notify_all()
+            else:
+                self._reserved -= 1
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+# Pools of the parent process, kept referenced in a forked child: collecting
+# them would close the parent's connections, which the child shares
+_inherited = []
+
+
+def get_pool(alias, options):
+    """The pool of database ``alias`` in this process, None without a pool configured"""
+    if not options or not options.get("SIZE"):
+        return None
+    pool = _pools.get(alias)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(alias)
+            if pool is None:
+                pool = _pools[alias] = ConnectionPool(
+                    alias, options["SIZE"], **{
+                        name.lower(): options[name] for name in ("TIMEOUT", "RECYCLE", "CHECK_AFTER")
+                        if name in options
+                    }
+                )
+    return pool
+
+
+def pool_stats():
+    return {alias: pool.stats() for alias, pool in list(_pools.items())}
+
+
+def _close_idle_connections():
+    for pool in list(_pools.values()):
+        pool.close_idle()
+
+
+def _forget_pools():
+    global _pools_lock
+    _inherited.extend(_pools.values())
+    _pools.clear()
+    _pools_lock = threading.Lock()
+
+
+os.register_at_fork(before=_close_idle_connections, after_in_child=_forget_pools)
+
+
+def ping(connection):
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT 1")
+        cursor.fetchall()
+    finally:
+        cursor.close()
+
+
+class PooledDatabaseWrapperMixin:
+    """
+    Check connections out of the process's pool instead of opening them, and
+    back in instead of closing them, when the database has ``POOL`` settings.
+    """
+    @property
+    def connection_pool(self):
+        return get_pool(self.alias, self.settings_dict.get("POOL"))
+
+    def get_new_connection(self, conn_params):
+        pool = self.connection_pool
+        if pool is None:
+            return super().get_new_connection(conn_params)
+        return pool.checkout(functools.partial(super().get_new_connection, conn_params), ping)
+
+    def _close(self):
+        pool = self.connection_pool
+        if pool is None or self.connection is None:
+            return super()._close()
+        with self.wrap_database_errors:
+            # Inside an atomic block the wrapper keeps the connection to roll it back
+            if (
+                self.in_atomic_block
+                or self.get_autocommit() != self.settings_dict["AUTOCOMMIT"]
+                or (self.errors_occurred and not self.is_usable())
+            ):
+                pool.discard(self.connection)
+            else:
+                pool.checkin(self.connection)
@@ -0,0 +1,10 @@
+"""
+Django's PostgreSQL backend with the per-process connection pool of TodoApp.backends.pool.
+"""
+from django.db.backends.postgresql import base
+
+from TodoApp.backends.pool import PooledDatabaseWrapperMixin
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+    pass
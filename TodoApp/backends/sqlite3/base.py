@@ -0,0 +1,101 @@
+"""
+SQLite backend tuned for several worker processes sharing one database file.
+
+On top of Django's SQLite backend:
+
+- ``OPTIONS['pragmas']`` are set on every new connection, busy_timeout first
+  so the others wait for the lock instead of failing.
+- Statements run outside a transaction, ``BEGIN`` among them, are retried
+  with exponential backoff when the database stays locked longer than
+  busy_timeout, up to ``OPTIONS['lock_retries']`` times. Such a statement
+  is atomic, so a retry cannot apply anything twice. Statements inside a
+  transaction are not retried, ``transaction_mode: IMMEDIATE`` takes the
+  write lock when the transaction begins so they do not wait for it.
+- Connections come from the per-process pool of TodoApp.backends.pool when
+  the database has ``POOL`` settings.
+"""
+import random
+import sqlite3
+import time
+
+from django.db.backends.sqlite3 import base
+
+from ApiDevt.metrics import counters
+from TodoApp.backends.pool import PooledDatabaseWrapperMixin
+
+
+def is_locked(exc):
+    return getattr(exc, "sqlite_errorcode", None) in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED)
+
+
+def retry_locked(func, retries, backoff):
+    """
+    Call ``func`` again after ``backoff``, doubled every attempt with jitter,
+    while SQLite reports the database locked.
+    """
+    for attempt in range(retries + 1):
+        try:
+            return func()
+        except sqlite3.OperationalError as exc:
+            if not is_locked(exc) or attempt == retries:
+                if is_locked(exc):
+                    counters.incr("db.lock_failed")
+                raise
+        counters.incr("db.lock_retried")
+        time.sleep(backoff * 2 ** attempt * random.uniform(0.5, 1))
+
+
+class RetryingCursorWrapper(base.SQLiteCursorWrapper):
+    lock_retries = 0
+    lock_backoff = 0
+
+    def execute(self, query, params=None):
+        if self.connection.in_transaction:
+            return super().execute(query, params)
+        return retry_locked(lambda: super(RetryingCursorWrapper, self).execute(query, params),
+                            self.lock_retries, self.lock_backoff)
+
+    def executemany(self, query, param_list):
+        if self.connection.in_transaction:
+            return super().executemany(query, param_list)
+        # The parameters may be a generator, it must survive a retry
+        param_list = list(param_list)
+        return retry_locked(lambda: super(RetryingCursorWrapper, self).executemany(query, param_list),
+                            self.lock_retries, self.lock_backoff)
+
+
+class TunedDatabaseWrapper(base.DatabaseWrapper):
+    def __init__(self, settings_dict, *args, **kwargs):
+        super().__init__(settings_dict, *args, **kwargs)
+        options = self.settings_dict["OPTIONS"]
+        self.pragmas = options.get("pragmas", {})
+        self.lock_retries = options.get("lock_retries", 0)
+        self.lock_backoff = options.get("lock_backoff", 0.05)
+
+    def get_connection_params(self):
+        kwargs = super().get_connection_params()
+        for name in ("pragmas", "lock_retries", "lock_backoff"):
+            kwargs.pop(name, None)
+        return kwargs
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        pragmas = dict(self.pragmas)
+        busy_timeout = pragmas.pop("busy_timeout", None)
+        if busy_timeout is not None:
+            conn.execute(f"PRAGMA busy_timeout = {int(busy_timeout)}")
+        for name, value in pragmas.items():
+            # Switching journal_mode needs the lock while other workers start up
+            retry_locked(lambda: conn.execute(f"PRAGMA {name} = {value}").fetchall(),
+                         self.lock_retries, self.lock_backoff)
+        return conn
+
+    def create_cursor(self, name=None):
+        cursor = self.connection.cursor(factory=RetryingCursorWrapper)
+        cursor.lock_retries = self.lock_retries
+        cursor.lock_backoff = self.lock_backoff
+        return cursor
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, TunedDatabaseWrapper):
+    pass
@@ -0,0 +1,248 @@
+"""
+Preforking ASGI server behind ``manage.py serve``.
+
+The arbiter loads the application once, binds the listening socket and forks
+the workers, which inherit both. Each worker runs a uvicorn event loop on the
+shared socket: coroutine views (the event streams, the async reads) run on the
+loop, sync views in Django's thread, and a worker per core keeps every core
+busy.
+
+Signals to the arbiter:
+
+- TERM or INT stop: the workers finish the request they are serving and exit.
+- HUP reloads: the arbiter executes itself again with the listening socket
+  inherited, loads the application anew, starts new workers and then stops
+  the old ones like TERM does. No connection is refused meanwhile.
+
+Workers exit after ``max_requests`` requests, plus a random jitter so they do
+not all restart together, and the arbiter replaces them. This bounds the
+memory a worker can accumulate. Workers also exit when their arbiter dies.
+"""
+import errno
+import os
+import random
+import select
+import signal
+import socket
+import sys
+import time
+import traceback
+
+import uvicorn
+from django.db import connections
+
+# Environment of an arbiter started by a reload: the inherited listening
+# socket and the workers of the previous code to stop once the new ones run
+LISTENER_FD_ENV = "TODO_SERVE_FD"
+RETIRING_ENV = "TODO_SERVE_RETIRING"
+
+
+def parse_bind(bind):
+    """
+    Split ``host:port`` (``[host]:port`` for IPv6) into an address tuple.
+    """
+    host, _, port = bind.rpartition(":")
+    if not host or not port.isdigit():
+        raise ValueError(f"Expected host:port, got {bind!r}.")
+    return host.strip("[]"), int(port)
+
+
+def create_listener(bind, backlog):
+    host, port = parse_bind(bind)
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    listener = socket.create_server((host, port), family=family, backlog=backlog)
+    # Idle workers all wake up for a new connection, the losers must not block in accept()
+    listener.setblocking(False)
+    return listener
+
+
+class WorkerServer(uvicorn.Server):
+    """
+    uvicorn serving on the listening socket shared with the other workers,
+    until its worker is stopped or the arbiter dies.
+    """
+    def __init__(self, config, worker):
+        super().__init__(config)
+        self.worker = worker
+        self.arbiter = os.getppid()
+
+    async def on_tick(self, counter):
+        if not self.worker.alive or os.getppid() != self.arbiter:
+            return True
+        return await super().on_tick(counter)
+
+
+class Worker:
+    def __init__(self, config, listener, max_requests):
+        self.config = config
+        self.listener = listener
+        self.max_requests = max_requests
+        self.alive = True
+
+    def run(self):
+        # uvicorn takes TERM and INT over while it serves, these handlers cover
+        # the time before and receive the signal it raises again once stopped
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+        self.config.limit_max_requests = self.max_requests or None
+        WorkerServer(self.config, self).run(sockets=[self.listener])
+        connections.close_all()
+
+    def _stop(self, signum, frame):
+        self.alive = False
+
+
+class Arbiter:
+    """
+    Fork, watch and replace the workers serving a preloaded uvicorn ``config``.
+    """
+    def __init__(self, config, bind, workers, max_requests=0, max_requests_jitter=0,
+                 graceful_timeout=30, backlog=2048, log=print):
+        self.config = config
+        self.bind = bind
+        self.worker_count = workers
+        self.max_requests = max_requests
+        self.max_requests_jitter = max_requests_jitter
+        self.graceful_timeout = graceful_timeout
+        self.backlog = backlog
+        self.log = log
+        self.workers = set()
+        # Workers stopping, with the time they must be gone by
+        self.retiring = {}
+        self.listener = None
+
+    def run(self):
+        self.listener = self._get_listener()
+        self._install_signals()
+        self.log(f"Listening on {self.bind} with {self.worker_count} workers (pid {os.getpid()})")
+
+        self._spawn_workers()
+        inherited = [int(pid) for pid in os.environ.pop(RETIRING_ENV, "").split(",") if pid]
+        if inherited:
+            self.log(f"Reloaded, stopping {len(inherited)} old workers")
+            self._retire(inherited)
+
+        while True:
+            for signum in self._wait_for_signals(1.0):
+                if signum in (signal.SIGTERM, signal.SIGINT):
+                    self.log("Shutting down")
+                    self._retire(list(self.workers))
+                    self._wait_for_retired()
+                    return
+                if signum == signal.SIGHUP:
+                    self._reload()
+            self._reap()
+            self._kill_overdue()
+            self._spawn_workers()
+
+    def _get_listener(self):
+        fd = os.environ.pop(LISTENER_FD_ENV, None)
+        if fd is None:
+            return create_listener(self.bind, self.backlog)
+        listener = socket.socket(fileno=int(fd))
+        listener.setblocking(False)
+        return listener
+
+    def _install_signals(self):
+        self._signal_pipe = os.pipe()
+        for fd in self._signal_pipe:
+            os.set_blocking(fd, False)
+        signal.set_wakeup_fd(self._signal_pipe[1])
+        for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP, signal.SIGCHLD):
+            # The wakeup fd carries the signal numbers to the main loop
+            signal.signal(signum, lambda signum, frame: None)
+
+    def _wait_for_signals(self, timeout):
+        try:
+            select.select([self._signal_pipe[0]], [], [], timeout)
+            return list(os.read(self._signal_pipe[0], 64))
+        except BlockingIOError:
+            return []
+
+    def _spawn_workers(self):
+        while len(self.workers) < self.worker_count:
+            max_requests = self.max_requests
+            if max_requests and self.max_requests_jitter:
+                max_requests += random.randint(0, self.max_requests_jitter)
+            # Children must not share the arbiter's database connections
+            connections.close_all()
+            pid = os.fork()
+            if pid == 0:
+                self._run_worker(max_requests)
+            self.workers.add(pid)
+
+    def _run_worker(self, max_requests):
+        status = 0
+        try:
+            signal.set_wakeup_fd(-1)
+            for fd in self._signal_pipe:
+                os.close(fd)
+            Worker(self.config, self.listener, max_requests).run()
+        except BaseException:
+            traceback.print_exc()
+            status = 1
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(status)
+
+    def _reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            if pid in self.workers:
+                self.workers.discard(pid)
+                code = os.waitstatus_to_exitcode(status)
+                if code != 0:
+                    self.log(f"Worker {pid} exited with status {code}")
+            self.retiring.pop(pid, None)
+
+    def _retire(self, pids):
+        deadline = time.monotonic() + self.graceful_timeout
+        for pid in pids:
+            self.workers.discard(pid)
+            self.retiring[pid] = deadline
+            self._kill(pid, signal.SIGTERM)
+
+    def _kill_overdue(self):
+        now = time.monotonic()
+        for pid, deadline in list(self.retiring.items()):
+            if now >= deadline:
+                self.log(f"Worker {pid} did not stop in time, killing it")
+                self._kill(pid, signal.SIGKILL)
+                self.retiring[pid] = now + self.graceful_timeout
+
+    def _wait_for_retired(self):
+        while self.retiring:
+            self._reap()
+            self._kill_overdue()
+            self._wait_for_signals(0.1)
+
+    @staticmethod
+    def _kill(pid, signum):
+        try:
+            os.kill(pid, signum)
+        except OSError as exc:
+            if exc.errno != errno.ESRCH:
+                raise
+
+    def _reload(self):
+        """
+        Execute the arbiter again, the new one takes over the listening socket,
+        loads the application anew and stops the current workers once its own run.
+        """
+        self.log("Reloading")
+        self._reap()
+        self.listener.set_inheritable(True)
+        os.environ[LISTENER_FD_ENV] = str(self.listener.fileno())
+        os.environ[RETIRING_ENV] = ",".join(map(str, self.workers | self.retiring.keys()))
+        signal.set_wakeup_fd(-1)
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os.execv(sys.executable, [sys.executable, *sys.argv])
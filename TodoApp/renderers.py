@@ -0,0 +1,292 @@
+"""
+Fast JSON and MessagePack rendering and parsing for the API.
+
+orjson is used when installed. It serializes the ReturnDict and ReturnList
+containers of DRF serializers as the dicts and lists they subclass, and
+encodes datetimes, dates, times and UUIDs natively. Without orjson the
+stdlib encoder is used with DRF's type handling.
+
+MessagePack (``application/msgpack``) needs the msgpack package. Serializers
+hand it datetimes and dates as objects (see ``wants_native_temporals``):
+datetimes become the standard timestamp extension type -1 and dates the
+extension type 1 holding a big-endian signed 32-bit day count since
+1970-01-01. Times stay ISO strings, which are already compact.
+
+NDJSON and CSV are offered by the task export, which streams its own body,
+and parsed lazily for the task import. Server-sent events are likewise
+streamed by the events view.
+"""
+import codecs
+import csv
+import datetime
+import functools
+import io
+import json
+import struct
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser, JSONParser
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+DATE_EXT_TYPE = 1
+EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+
+# Types orjson does not know (Decimal, lazy strings, querysets, ...) are
+# handled the way DRF's encoder handles them
+_fallback_encoder = JSONEncoder()
+
+if orjson is not None:
+    ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_UTC_Z
+
+
+def json_dumps(data, indent=None):
+    """
+    Encode ``data`` as UTF-8 JSON bytes.
+    """
+    if orjson is not None:
+        options = ORJSON_OPTIONS | orjson.OPT_INDENT_2 if indent else ORJSON_OPTIONS
+        return orjson.dumps(data, default=_fallback_encoder.default, option=options)
+    return json.dumps(
+        data,
+        cls=JSONEncoder,
+        indent=indent,
+        ensure_ascii=False,
+        check_circular=False,
+        separators=(",", ":") if indent is None else (",", ": "),
+    ).encode()
+
+
+def json_loads(data):
+    """
+    Decode JSON bytes, raising ValueError on invalid input.
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    Drop-in replacement for DRF's JSONRenderer.
+    """
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        ret = json_dumps(data, indent)
+
+        # Keep the output a strict JavaScript subset, like DRF does
+        if b"\xe2\x80\xa8" in ret or b"\xe2\x80\xa9" in ret:
+            ret = ret.replace(b"\xe2\x80\xa8", b"\\u2028").replace(b"\xe2\x80\xa9", b"\\u2029")
+        return ret
+
+
+class FastJSONParser(JSONParser):
+    """
+    Drop-in replacement for DRF's JSONParser.
+    """
+    def parse(self, stream, media_type=None, parser_context=None):
+        if orjson is None:
+            return super().parse(stream, media_type, parser_context)
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError(f"JSON parse error - {exc}")
+
+
+def wants_native_temporals(context):
+    """
+    Tell whether the renderer accepted for the request in a serializer context
+    encodes datetimes and dates itself, so serializers should not format them.
+    """
+    request = context.get("request")
+    renderer = getattr(request, "accepted_renderer", None)
+    return getattr(renderer, "native_temporals", False)
+
+
+@functools.lru_cache(maxsize=4096)
+def _date_ext(value):
+    # Pages repeat the same few dates, so the extension values are memoized
+    return msgpack.ExtType(DATE_EXT_TYPE, struct.pack(">i", value.toordinal() - EPOCH_ORDINAL))
+
+
+def _msgpack_default(obj):
+    # Aware datetimes are packed by msgpack itself, only naive ones get here
+    if isinstance(obj, datetime.datetime):
+        return msgpack.Timestamp.from_datetime(timezone.make_aware(obj))
+    if isinstance(obj, datetime.date):
+        return _date_ext(obj)
+    return _fallback_encoder.default(obj)
+
+
+def _msgpack_ext_hook(code, data):
+    if code == DATE_EXT_TYPE:
+        return datetime.date.fromordinal(struct.unpack(">i", data)[0] + EPOCH_ORDINAL)
+    return msgpack.ExtType(code, data)
+
+
+def msgpack_dumps(data):
+    """
+    Encode ``data`` as MessagePack bytes.
+    """
+    return msgpack.packb(data, default=_msgpack_default, datetime=True, use_bin_type=True)
+
+
+class MessagePackRenderer(BaseRenderer):
+    """
+    Renders MessagePack with compact datetimes and dates.
+    """
+    media_type = "application/msgpack"
+    format = "msgpack"
+    charset = None
+    render_style = "binary"
+    native_temporals = True
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return msgpack_dumps(data)
+
+
+class MessagePackParser(BaseParser):
+    """
+    Parses MessagePack, decoding timestamps to aware datetimes and date extensions to dates.
+    """
+    media_type = "application/msgpack"
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return msgpack.unpackb(
+                stream.read(), ext_hook=_msgpack_ext_hook, timestamp=3, raw=False, strict_map_key=False
+            )
+        except (ValueError, msgpack.ExtraData, msgpack.FormatError, msgpack.StackError) as exc:
+            raise ParseError(f"MessagePack parse error - {exc or type(exc).__name__}")
+
+
+class ColumnarJSONRenderer(FastJSONRenderer):
+    """
+    JSON for column-oriented list payloads, selected with ``?format=columnar``
+    or ``Accept: application/vnd.todo.columnar+json``. Views build the payload.
+    """
+    media_type = "application/vnd.todo.columnar+json"
+    format = "columnar"
+
+
+class NDJSONRenderer(BaseRenderer):
+    """
+    Newline delimited JSON, one document per line. Lists become one line per
+    item, anything else (e.g. an error response) a single line. Streaming
+    views write the body themselves and only borrow the media type.
+    """
+    media_type = "application/x-ndjson"
+    format = "ndjson"
+    charset = None
+    render_style = "binary"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        items = data if isinstance(data, list) else [data]
+        return b"".join(json_dumps(item) + b"\n" for item in items)
+
+
+class CSVRenderer(BaseRenderer):
+    """
+    CSV with a header row taken from the keys of the first row. Lists become
+    one row per item, a dict (e.g. an error response) a single row.
+    """
+    media_type = "text/csv"
+    format = "csv"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        rows = data if isinstance(data, list) else [data]
+        if not rows:
+            return b""
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=list(rows[0]), extrasaction="ignore")
+        writer.writeheader()
+        for row in rows:
+            # Error messages come as lists
+            writer.writerow({
+                key: "; ".join(map(str, value)) if isinstance(value, list) else value
+                for key, value in row.items()
+            })
+        return buffer.getvalue().encode(self.charset)
+
+
+class NDJSONParser(BaseParser):
+    """
+    Parses newline delimited JSON lazily: ``request.data`` is an iterator of
+    the documents, read from the request stream as it is consumed. Blank lines
+    are skipped and invalid lines come out as ParseError instances, so callers
+    can report them and carry on.
+    """
+    media_type = "application/x-ndjson"
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        return self._documents(stream)
+
+    @staticmethod
+    def _documents(stream):
+        for line in stream:
+            if not line.strip():
+                continue
+            try:
+                yield json_loads(line)
+            except ValueError as exc:
+                yield ParseError(f"JSON parse error - {exc}")
+
+
+class CSVParser(BaseParser):
+    """
+    Parses CSV with a header row lazily: ``request.data`` is an iterator of
+    one dict per row, read from the request stream as it is consumed. Values
+    stay strings. Malformed CSV ends the rows with a ParseError instance.
+    """
+    media_type = "text/csv"
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get("encoding", settings.DEFAULT_CHARSET)
+        if codecs.lookup(encoding).name == "utf-8":
+            # Spreadsheet exports often start with a byte order mark
+            encoding = "utf-8-sig"
+        return self._rows(codecs.iterdecode(stream, encoding))
+
+    @staticmethod
+    def _rows(lines):
+        try:
+            yield from csv.DictReader(lines)
+        except (csv.Error, UnicodeDecodeError) as exc:
+            yield ParseError(f"CSV parse error - {exc}")
+
+
+class EventStreamRenderer(BaseRenderer):
+    """
+    Server-sent events. The events view streams its own body, responses
+    rendered here (e.g. authentication errors) become a single ``error`` event.
+    """
+    media_type = "text/event-stream"
+    format = "sse"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return b"event: error\ndata: %s\n\n" % json_dumps(data)
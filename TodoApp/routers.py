@@ -0,0 +1,147 @@
+"""
+Database routing state of the current request.
+
+Views choose a read replica for a request with ``read_from(alias, fresh_until)``
+inside a ``read_scope()``, see ApiDevt/replicas.py. Every other read and every
+write goes to the primary. The choice is a context variable, so it follows the
+request into ``sync_to_async`` threads and ends with the scope.
+
+The replica holds every change made before ``fresh_until``. Code about to read
+rows of a newer version calls ``require_fresh()``, which sends the remaining
+reads of the request to the primary.
+
+Task data is split across shards when sharding is enabled, see
+ApiDevt/sharding.py. ShardRouter sends task data to the shard of its
+assigned user. Queries on task data that name no object to route by go to
+the shard of the current ``shard_scope()``, the default database outside of
+one.
+"""
+import contextvars
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS
+
+from ApiDevt.metrics import counters
+
+_read_database = contextvars.ContextVar("read_database", default=None)
+_shard = contextvars.ContextVar("shard", default=None)
+
+
+@contextmanager
+def read_scope():
+    """Undo any ``read_from`` made inside the block when it ends"""
+    token = _read_database.set(None)
+    try:
+        yield
+    finally:
+        _read_database.reset(token)
+
+
+def read_from(alias, fresh_until=None):
+    _read_database.set((alias, fresh_until) if alias else None)
+
+
+def read_database():
+    """The database reads of the current request go to, None for the primary"""
+    chosen = _read_database.get()
+    return chosen[0] if chosen else None
+
+
+def require_fresh(since):
+    """
+    Send the remaining reads of the current request to the primary if its
+    replica may miss changes made up to ``since``, a wall clock time.
+    """
+    chosen = _read_database.get()
+    if chosen is not None and since > chosen[1]:
+        counters.incr("replicas.switched_to_primary")
+        _read_database.set(None)
+
+
+@contextmanager
+def shard_scope(alias=None):
+    """Run the block on a shard, undoing any ``use_shard`` made inside it when it ends"""
+    token = _shard.set(alias)
+    try:
+        yield
+    finally:
+        _shard.reset(token)
+
+
+def use_shard(alias):
+    _shard.set(alias)
+
+
+def current_shard():
+    return _shard.get() or DEFAULT_DB_ALIAS
+
+
+def shard_aliases():
+    """Every database holding task data, the default one first"""
+    return [DEFAULT_DB_ALIAS, *settings.DB_SHARD_ALIASES]
+
+
+def _sharding():
+    # ApiDevt.sharding imports the models, which import this module
+    from ApiDevt import sharding
+    return sharding
+
+
+class ShardRouter:
+    """
+    Route tasks, subtasks and their links to the shard of their assigned user.
+
+    Reads of other models through a task follow the task, their copies on its
+    shard join with it. Routing to the default database is left to the next
+    router so read replicas still serve it.
+    """
+    def db_for_read(self, model, **hints):
+        sharding = _sharding()
+        if not sharding.sharding_enabled():
+            return None
+        instance = hints.get("instance")
+        if sharding.is_sharded(model) or (instance is not None and sharding.is_sharded(type(instance))):
+            return self._shard_for(model, instance)
+        if instance is not None and instance._state.db in settings.DB_SHARD_ALIASES:
+            # A copy loaded from a shard, its other relations live on the default database
+            return DEFAULT_DB_ALIAS
+        return None
+
+    def db_for_write(self, model, **hints):
+        sharding = _sharding()
+        if not sharding.sharding_enabled() or not sharding.is_sharded(model):
+            return None
+        return self._shard_for(model, hints.get("instance"))
+
+    @staticmethod
+    def _shard_for(model, instance):
+        sharding = _sharding()
+        if instance is not None and sharding.is_sharded(type(instance)):
+            alias = sharding.shard_of(instance)
+        elif isinstance(instance, User):
+            alias = sharding.home_shard(instance.pk)
+        else:
+            alias = current_shard()
+        return None if alias == DEFAULT_DB_ALIAS else alias
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Shards hold every table, the reference copies need their dependencies
+        return True if db in settings.DB_SHARD_ALIASES else None
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return read_database()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold copies of the primary's rows
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema from the primary through replication
+        return db == DEFAULT_DB_ALIAS
@@ -1,4 +1,5 @@
 from pathlib import Path
+import importlib.util
 import os
 from dotenv import load_dotenv
 
@@ -62,13 +63,93 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'TodoApp.wsgi.application'
 
+# Database, from DB_* variables. DB_ENGINE is sqlite3 (default), postgresql or mysql,
+# served by the TodoApp.backends variants, or the dotted path of another backend.
+DB_ENGINE = os.getenv('DB_ENGINE', 'sqlite3')
+# Connections per worker process, shared by its threads. 0 opens one per thread instead.
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '0' if DB_ENGINE == 'sqlite3' else '5'))
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'ENGINE': DB_ENGINE if '.' in DB_ENGINE else f'TodoApp.backends.{DB_ENGINE}',
+        'NAME': os.getenv('DB_NAME', BASE_DIR / 'db.sqlite3'),
+        'USER': os.getenv('DB_USER', ''),
+        'PASSWORD': os.getenv('DB_PASSWORD', ''),
+        'HOST': os.getenv('DB_HOST', ''),
+        'PORT': os.getenv('DB_PORT', ''),
+        # Seconds a thread keeps its connection across requests. Pooled
+        # connections go back to the pool after every request instead.
+        'CONN_MAX_AGE': 0 if DB_POOL_SIZE else int(os.getenv('DB_CONN_MAX_AGE', '60')),
+        'CONN_HEALTH_CHECKS': True,  # Ping a kept connection before the first query of a request
+        # Per-process connection pool (see TodoApp/backends/pool.py)
+        'POOL': {
+            'SIZE': DB_POOL_SIZE,
+            'TIMEOUT': float(os.getenv('DB_POOL_TIMEOUT', '10')),  # Seconds a checkout waits for a free connection
+            'RECYCLE': int(os.getenv('DB_POOL_RECYCLE', '3600')),  # Seconds before a connection is replaced
+            'CHECK_AFTER': 30,  # Seconds idle before a connection is pinged on checkout
+        },
     }
 }
 
+# SQLite profile for several workers writing to one file (see TodoApp/backends/sqlite3).
+# Set SQLITE_TUNING=false for Django's defaults.
+SQLITE_TUNING = os.getenv('SQLITE_TUNING', 'true').lower() == 'true'
+SQLITE_PRAGMAS = {
+    'busy_timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000')),  # Milliseconds a writer waits for the lock
+    'journal_mode': os.getenv('SQLITE_JOURNAL_MODE', 'WAL'),  # Readers no longer block behind the writer
+    'synchronous': os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL'),  # Safe with WAL, a power loss may drop the last commits
+    'mmap_size': int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024))),  # Bytes read through memory mapping
+    'cache_size': int(os.getenv('SQLITE_CACHE_SIZE', '-65536')),  # Pages, or KiB when negative, per connection
+    'temp_store': os.getenv('SQLITE_TEMP_STORE', 'MEMORY'),  # Sorts and temporary indexes stay off disk
+}
+SQLITE_LOCK_RETRIES = int(os.getenv('SQLITE_LOCK_RETRIES', '3'))  # Retries once busy_timeout ran out
+SQLITE_LOCK_BACKOFF_SECONDS = 0.05  # First pause between retries, doubled every retry
+if DB_ENGINE == 'sqlite3' and SQLITE_TUNING:
+    DATABASES['default'].update({
+        'OPTIONS': {
+            'pragmas': SQLITE_PRAGMAS,
+            # Transactions take the write lock when they begin, not at their
+            # first write, so one that read first cannot deadlock another writer
+            'transaction_mode': 'IMMEDIATE',
+            'lock_retries': SQLITE_LOCK_RETRIES,
+            'lock_backoff': SQLITE_LOCK_BACKOFF_SECONDS,
+        },
+    })
+
+
+def database_at(location):
+    """The default database settings pointed at another file, or host[:port]"""
+    if DB_ENGINE == 'sqlite3':
+        return {**DATABASES['default'], 'NAME': location}
+    host, _, port = location.partition(':')
+    return {**DATABASES['default'], 'HOST': host, 'PORT': port or DATABASES['default']['PORT']}
+
+
+# Read replicas of the default database, comma separated: file paths for sqlite3,
+# host[:port] otherwise. Safe requests of the task endpoints read from a replica
+# that holds every change they depend on (see ApiDevt/replicas.py).
+DB_REPLICAS = [replica.strip() for replica in os.getenv('DB_REPLICAS', '').split(',') if replica.strip()]
+for i, replica in enumerate(DB_REPLICAS, 1):
+    DATABASES[f'replica{i}'] = {**database_at(replica), 'TEST': {'MIRROR': 'default'}}
+DB_REPLICA_ALIASES = [f'replica{i}' for i in range(1, len(DB_REPLICAS) + 1)]
+REPLICA_CHECK_SECONDS = 1  # Seconds between measurements of a replica's position
+REPLICA_MAX_LAG_SECONDS = int(os.getenv('REPLICA_MAX_LAG_SECONDS', '10'))  # Replicas further behind serve nothing
+REPLICA_RETRY_SECONDS = 30  # Seconds a failed replica stays out of rotation
+REPLICA_PIN_SECONDS = 5  # Seconds a user who wrote reads from the primary
+REPLICA_CLOCK_SKEW_SECONDS = 0.5  # Allowed difference between the clocks stamping versions and change log rows
+
+# Shards for task data besides the default database, comma separated like
+# DB_REPLICAS. Tasks, their subtasks and links live on the shard of their
+# assigned user (see ApiDevt/sharding.py). Empty keeps everything in default.
+DB_SHARDS = [shard.strip() for shard in os.getenv('DB_SHARDS', '').split(',') if shard.strip()]
+for i, shard in enumerate(DB_SHARDS, 1):
+    DATABASES[f'shard{i}'] = database_at(shard)
+DB_SHARD_ALIASES = [f'shard{i}' for i in range(1, len(DB_SHARDS) + 1)]
+SHARD_MAP_CACHE_SECONDS = 5  # Seconds a process may keep using a user's previous shard after a move
+SHARD_ID_BLOCK_SIZE = 100  # Task and subtask ids a process reserves at a time
+SHARD_MOVE_BATCH_SIZE = 500  # Tasks copied per transaction when moving a user
+SHARD_MOVE_GRACE_SECONDS = 30  # Longest write in flight, waited for before a move switches shards
+DATABASE_ROUTERS = ['TodoApp.routers.ShardRouter', 'TodoApp.routers.ReplicaRouter']
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -100,6 +181,56 @@ STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Caches. Set REDIS_URL whenever several worker processes serve the API, the
+# version stamps behind ETags must be shared between them.
+REDIS_URL = os.getenv('REDIS_URL')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django_redis.cache.RedisCache',
+            'LOCATION': REDIS_URL,
+        },
+        'versions': {
+            'BACKEND': 'django_redis.cache.RedisCache',
+            'LOCATION': REDIS_URL,
+            'KEY_PREFIX': 'todo',
+        },
+        'fragments': {
+            'BACKEND': 'django_redis.cache.RedisCache',
+            'LOCATION': REDIS_URL,
+            'KEY_PREFIX': 'todo',
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+        'versions': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'versions',
+            'OPTIONS': {'MAX_ENTRIES': 100000},
+        },
+        # Without Redis the in-process LRU is the only fragment tier
+        'fragments': {
+            'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+        },
+    }
+
+# Cache holding the per-user and per-task version stamps used for ETags
+VERSION_CACHE_ALIAS = 'versions'
+
+# Serialized task fragments: an in-process LRU in front of the shared cache
+FRAGMENT_CACHE_ALIAS = 'fragments'
+FRAGMENT_CACHE_LOCAL_SIZE = 5000  # Fragments kept per process
+FRAGMENT_CACHE_TIMEOUT = 3600  # Seconds a fragment lives in the shared tier
+
+# Reference data (tags, categories, preferences): in-process snapshots backed by the shared cache
+REFCACHE_ALIAS = 'default'
+REFCACHE_MAX_ENTRIES = 10000  # Snapshots kept per process
+REFCACHE_TTL = 300  # Seconds before a snapshot is rebuilt regardless of its version
+REFCACHE_VERSION_CHECK_SECONDS = 2  # Upper bound on how long a worker serves a changed snapshot
+
 MEDIA_URL = 'media/'
 
 MEDIA_ROOT = os.path.join(BASE, 'static/media')
@@ -115,6 +246,15 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'TodoApp.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'TodoApp.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 10,
@@ -125,6 +265,11 @@ REST_FRAMEWORK = {
     ],
 }
 
+# MessagePack (application/msgpack) is offered when the msgpack package is installed
+if importlib.util.find_spec('msgpack') is not None:
+    REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'].insert(1, 'TodoApp.renderers.MessagePackRenderer')
+    REST_FRAMEWORK['DEFAULT_PARSER_CLASSES'].insert(1, 'TodoApp.renderers.MessagePackParser')
+
 # Spectacular settings for Swagger documentation
 SPECTACULAR_SETTINGS = {
     'TITLE': 'Todo App API',
@@ -154,6 +299,12 @@ SPECTACULAR_SETTINGS = {
         {'name': 'Tags', 'description': 'Tag operations'},
         {'name': 'Subtasks', 'description': 'Subtask operations'},
         {'name': 'User Preferences', 'description': 'User preference settings'},
+        {'name': 'Task Trends', 'description': 'Historical task throughput'},
+        {'name': 'Sync', 'description': 'Delta sync for offline clients'},
+        {'name': 'Metrics', 'description': 'Process counters for operators'},
+        {'name': 'Batch', 'description': 'Several API requests in one round trip'},
+        {'name': 'Events', 'description': 'Server-sent change events'},
+        {'name': 'Health', 'description': 'Probes for load balancers and orchestrators'},
         {'name': 'OTP Codes', 'description': 'OTP code operations'},
     ],
     'SECURITY': [
@@ -175,6 +326,66 @@ SPECTACULAR_SETTINGS = {
     }
 }
 
+# Calendar endpoint settings
+CALENDAR_MAX_DAYS = 731  # Widest window a single calendar request may ask for
+CALENDAR_STREAM_THRESHOLD_DAYS = 62  # Windows wider than this are streamed
+
+# Task facet counts are cached per user and filter set for this many seconds
+TASK_FACETS_CACHE_SECONDS = 30
+
+# Delta sync page sizes (changes per page)
+SYNC_PAGE_SIZE = 200
+SYNC_MAX_PAGE_SIZE = 1000
+# Longest a transaction writing the change log stays open. The sync cursor never
+# passes changes this recent by the database clock (see ApiDevt/sync.py).
+SYNC_CURSOR_GRACE_SECONDS = 5
+
+# Single-flight coalescing of identical concurrent requests (see ApiDevt/coalescing.py)
+COALESCE_CACHE_ALIAS = 'default'
+COALESCE_LOCK_SECONDS = 10  # Longest a worker waits for another worker's result
+COALESCE_RESULT_SECONDS = 2  # How long a shared result is kept for late arrivals
+COALESCE_POLL_SECONDS = 0.02
+
+# Task export and import (see ApiDevt/transfer.py)
+TASK_EXPORT_CHUNK_SIZE = 2000  # Rows fetched, prefetched and written per batch
+TASK_IMPORT_BATCH_SIZE = 1000  # Rows validated and inserted per transaction
+TASK_IMPORT_MAX_ERRORS = 1000  # Row errors listed in an import report, the rest are only counted
+
+# Most tasks a single create request may hold as a list
+TASK_BULK_CREATE_MAX_ITEMS = 1000
+
+# Admin changelists count matches exactly up to this many rows, beyond it they
+# show the database's estimate (see ApiDevt/pagination.py)
+ADMIN_EXACT_COUNT_LIMIT = 10000
+
+# Batch endpoint (see ApiDevt/batch.py)
+BATCH_MAX_REQUESTS = 20  # Sub-requests per batch
+BATCH_MAX_WORKERS = 4  # Threads running safe sub-requests concurrently, per process
+
+# Serve the read-only task endpoints with coroutine handlers under ASGI (see
+# ApiDevt/asyncviews.py). Off by default: every async ORM query is a thread hop
+# of its own, measure with `manage.py bench_async_reads` before turning it on.
+ASYNC_VIEWS = os.getenv('ASYNC_VIEWS', 'false').lower() == 'true'
+
+# Production server (manage.py serve, see TodoApp/prefork.py)
+SERVE_BIND = os.getenv('SERVE_BIND', '0.0.0.0:8000')
+SERVE_WORKERS = int(os.getenv('SERVE_WORKERS', '0'))  # 0 starts one worker per CPU
+SERVE_MAX_REQUESTS = int(os.getenv('SERVE_MAX_REQUESTS', '2000'))  # Requests before a worker is replaced, 0 never
+SERVE_MAX_REQUESTS_JITTER = 200  # Spreads the worker replacements out
+SERVE_GRACEFUL_TIMEOUT = 30  # Seconds workers get to finish their request on stop or reload
+SERVE_KEEP_ALIVE = 5  # Seconds an idle connection is kept open for its next request
+SERVE_BACKLOG = 2048  # Connections queued while every worker is busy
+
+# Server-sent events (see ApiDevt/events.py). Without a pub/sub URL events only
+# reach streams served by the process that made the change.
+EVENTS_PUBSUB_URL = os.getenv('EVENTS_PUBSUB_URL', REDIS_URL)
+EVENTS_CHANNEL = 'todo:events'
+EVENTS_QUEUE_SIZE = 256  # Events buffered per stream before it falls back to the change log
+EVENTS_MAX_REPLAY = 1000  # Most events replayed from the log, beyond that clients resync
+EVENTS_HEARTBEAT_SECONDS = 15  # Idle time before a heartbeat comment keeps proxies from closing the stream
+EVENTS_RETRY_MILLISECONDS = 3000  # Reconnection delay suggested to clients
+EVENTS_RECONNECT_SECONDS = 1  # Pause before listening to pub/sub again after losing it
+
 # CORS settings
 CORS_ALLOW_ALL_ORIGINS = True  # For development, in production specify domains
 CORS_ALLOW_CREDENTIALS = True
@@ -0,0 +1,14 @@
+"""
+Settings of the test suite: the project settings with two empty shard
+databases. Sharding stays off, so the suite runs the unsharded path of every
+deployment without DB_SHARDS. ShardingTests in ApiDevt/tests.py turns it on
+for itself.
+"""
+from TodoApp.settings import *  # noqa: F401,F403
+from TodoApp.settings import DATABASES
+
+SHARD_TEST_ALIASES = ['shard1', 'shard2']
+for alias in SHARD_TEST_ALIASES:
+    # SQLite test databases live in memory, the others get a name of their own
+    DATABASES[alias] = {**DATABASES['default'], 'NAME': f"{DATABASES['default']['NAME']}_{alias}"}
+DB_SHARD_ALIASES = []
@@ -1,8 +1,21 @@
 #!/bin/sh
+set -e
 
-python3 manage.py makemigrations  || echo "making Migration failed"
-
-python3 manage.py migrate || echo "Migration failed"
-
-# Run the server
-python3 manage.py runserver 0.0.0.0:8000 || echo "Server failed to start"
+case "$1" in
+    migrate)
+        # One-shot step, run before the servers start. Shards come after the
+        # default database, they copy its users, tags and categories.
+        python3 manage.py migrate --noinput
+        i=1
+        for _ in $(echo "${DB_SHARDS:-}" | tr ',' ' '); do
+            python3 manage.py migrate --noinput --database "shard$i"
+            i=$((i + 1))
+        done
+        ;;
+    serve | "")
+        exec python3 manage.py serve
+        ;;
+    *)
+        exec "$@"
+        ;;
+esac
@@ -6,7 +6,9 @@ import sys
 
 def main():
     """Run administrative tasks."""
-    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'TodoApp.settings')
+    # The test suite brings databases of its own, see TodoApp/test_settings.py
+    settings_module = 'TodoApp.test_settings' if sys.argv[1:2] == ['test'] else 'TodoApp.settings'
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
     try:
         from django.core.management import execute_from_command_line
     except ImportError as exc: